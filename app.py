@@ -1,8 +1,22 @@
 import streamlit as st
 import pandas as pd
 import os
-from sqlalchemy import create_engine
+import time
+import uuid
+import datetime
 from dotenv import load_dotenv
+import db
+import metrics
+from item_store import ItemStore
+from refresher import StoreRefresher
+from decision_log import DecisionLog
+from item_viewer import ItemViewer, SORTS, VIEWER_PAGE_SIZE
+from reports import REPORTS, ReportService
+from sites import DEFAULT_SITE, ensure_parent, list_sites, normalize_site, shard_table
+import history
+from item_search import SEARCH_LIMIT
+from decision import lookup_item, read_pick_list, evaluate_batch
+from rules import ensure_rules_table, order_ok
 
 # Load environment variables
 load_dotenv()
@@ -23,6 +37,15 @@ if not DATABASE_URL:
     st.error("⚠️ DATABASE_URL not found in .env file!")
     st.stop()
 
+# Per-session latency metrics (process-wide ones live in metrics.REGISTRY)
+if "metrics" not in st.session_state:
+    st.session_state.metrics = metrics.Registry()
+session_metrics = st.session_state.metrics
+# Session id recorded with each decision in the audit log
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+page_start = time.perf_counter()
+
 # Custom CSS to hide number input spinners and prevent non-numeric input
 st.markdown("""
 <style>
@@ -41,21 +64,79 @@ st.markdown("""
     }
 </style>
 """, unsafe_allow_html=True)
+# Shared connection pool (one engine per server process, reused across reruns and reloads)
+@st.cache_resource
+def get_db_engine():
+    return db.get_engine(DATABASE_URL)
+
+# Databases created before multi-site support hold a single unpartitioned ro_items:
+# convert it to the default site's shard once per server process
+# (and create the decision_rules table so rules can be added with plain SQL)
+@st.cache_resource
+def migrate_sites():
+    with db.begin(get_db_engine()) as conn:
+        ensure_parent(conn, "ro_items")
+        ensure_rules_table(conn)
+
+# Sites that have data (ro_items is partitioned by site); refreshed every minute for new sites
+@st.cache_data(ttl=60, show_spinner=False)
+def load_sites():
+    try:
+        migrate_sites()
+        with db.connect(get_db_engine()) as conn:
+            sites = list_sites(conn, "ro_items")
+    except Exception:
+        sites = []
+    return sites or [normalize_site(DEFAULT_SITE)]
+
+# Shared item store per site (one per server process): full load of that site's shard once,
+# then delta refresh by revision. Holds a compact ItemTable (code buffer + float arrays)
+# that every session of the site reads without copying; other sites are never loaded
+@st.cache_resource
+def get_item_store(site):
+    return ItemStore(shard_table("ro_items", site), site=site)
+
+# Write-behind audit log of decisions (one buffer + background writer per server process)
+@st.cache_resource
+def get_decision_log():
+    return DecisionLog(get_db_engine())
+
+# Paged database viewer (SQL filtering/sorting/keyset paging, LRU page cache shared by sessions)
+@st.cache_resource
+def get_item_viewer(site):
+    return ItemViewer(get_db_engine(), shard_table("ro_items", site), site)
+
+# Report jobs run on a worker pool; finished files are cached by report type, dates and data version
+@st.cache_resource
+def get_report_service():
+    return ReportService(get_db_engine())
+
+# avg_consume trends read the small rollup tables maintained at ingestion time.
+# Keyed by the store revision so a new ingestion shows up after the next refresh
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_history(kind, site, revision, *args):
+    with db.connect(get_db_engine()) as conn:
+        return getattr(history, kind)(conn, shard_table("ro_items", site), *args)
+
+# Keeps the loaded item stores fresh for every session: refreshes on NOTIFY from the ingestion
+# scripts or on the Settings interval, swapping the new table in without blocking anyone
+@st.cache_resource
+def get_store_refresher():
+    return StoreRefresher(get_db_engine())
+
 # Load database
-@st.cache_data
-def load_database():
-    """Load data from Supabase PostgreSQL"""
+def load_database(site):
+    """Load the site's shard from Supabase PostgreSQL (returns the shared ItemTable)"""
     try:
-        engine = create_engine(DATABASE_URL)
-        query = "SELECT item_code, avg_consume FROM ro_items ORDER BY item_code"
-        df = pd.read_sql(query, engine)
-        df.columns = ['Item_Code', 'Avg_Consume']
-        df = df.dropna()
-        return df, []
+        with metrics.span("load_database", session_metrics, site=site):
+            store = get_item_store(site)
+            # Starts from the local snapshot when available and checks the database in background
+            store.open(get_db_engine())
+            get_store_refresher().watch(store)
+        return store.table, []
         
     except Exception as e:
         return None, [f"Lỗi kết nối Supabase: {str(e)}"]
-    return combined, []
 
 # Sidebar Navigation
 st.sidebar.title("Navigation")
@@ -68,6 +149,20 @@ page = st.sidebar.radio(
 st.sidebar.markdown("---")
 st.sidebar.info(f"Current Page: **{page}**")
 
+# Every page works on one site's data
+sites = load_sites()
+# Load every site's store on the refresher thread from the first run of the server process
+# (and sites that appear later), so the first session of a site does not wait for a full load
+get_store_refresher().preload([get_item_store(s) for s in sites])
+# list_sites returns normalized names; DEFAULT_SITE comes from .env as typed (e.g. "Main")
+default_site = normalize_site(DEFAULT_SITE)
+site = st.sidebar.selectbox(
+    "Site:",
+    sites,
+    index=sites.index(default_site) if default_site in sites else 0,
+    key="site"
+)
+
 # Main content based on selection
 if page == "ISC _ DO system tracking":
     # ========== RO/DO DECISION PAGE ==========
@@ -76,9 +171,9 @@ if page == "ISC _ DO system tracking":
     st.markdown("---")
     
     # Load data
-    df, errors = load_database()
+    items, errors = load_database(site)
     
-    if df is None:
+    if items is None:
         st.error("Error: No data found in 'data' folder")
         if errors:
             st.error("Details:")
@@ -96,10 +191,24 @@ if page == "ISC _ DO system tracking":
     # Database info in sidebar
     st.sidebar.markdown("---")
     st.sidebar.subheader("Database Info")
-    st.sidebar.metric("Total Items", len(df))
+    st.sidebar.metric("Total Items", len(items))
+    store = get_item_store(site)
+    st.sidebar.caption(f"Data revision: {store.revision} (source: {store.source})")
+    st.sidebar.caption(f"Decision rules: {len(items.rules)} (+ default x{items.rules.default['multiplier']:g})")
+    if store.last_error:
+        st.sidebar.warning("Database unreachable - read-only mode using local snapshot")
     if st.sidebar.button("Reload Database"):
-        st.cache_data.clear()
-        st.rerun()
+        # Only fetch rows changed since the revision we hold (decision rule changes apply too)
+        try:
+            store.refresh(get_db_engine())
+        except Exception as e:
+            st.sidebar.error(f"Reload failed: {str(e)}")
+        else:
+            st.rerun()
+    
+    with st.sidebar.expander("Connection Stats"):
+        for name, stats in db.get_stats().items():
+            st.caption(f"**{name}**: {stats['count']}x, avg {stats['avg_ms']:.1f} ms, max {stats['max_ms']:.1f} ms")
     
     # Main form - 2 columns layout
     col1, col2 = st.columns([1, 1])
@@ -107,11 +216,28 @@ if page == "ISC _ DO system tracking":
     with col1:
         st.subheader("Input Information")
         
-        item_code = st.selectbox(
-            "Item Code:",
-            options=[""] + df['Item_Code'].astype(str).tolist(),
-            key="item_code_select"
+        # Server-side search: only the top matches are sent to the browser
+        item_search = st.text_input(
+            "Search Item Code:",
+            placeholder="Type part of item code",
+            key="item_code_search"
         )
+        with metrics.span("item_search", session_metrics):
+            matches = store.search.search(item_search, limit=SEARCH_LIMIT)
+        if item_search and not matches:
+            st.caption(f"No item code matching '{item_search}'")
+        
+        # Exact match -> select it directly
+        exact = matches and matches[0].lower() == item_search.strip().lower()
+        if exact and st.session_state.get("item_code_select") not in matches:
+            st.session_state.item_code_select = matches[0]
+        
+        with metrics.span("item_select_render", session_metrics):
+            item_code = st.selectbox(
+                "Item Code:",
+                options=[""] + matches,
+                key="item_code_select"
+            )
         
         stock_input = st.number_input(
             "Pick to Light Stock:",
@@ -147,7 +273,7 @@ if page == "ISC _ DO system tracking":
     
     if reset_btn:
         # Clear all widget states
-        for key in ['item_code_select', 'item_code_manual', 'stock_input', 'ro_input', 'show_result', 'decision_text', 'decision_type']:
+        for key in ['item_code_select', 'item_code_search', 'stock_input', 'ro_input', 'show_result', 'decision_text', 'decision_type']:
             if key in st.session_state:
                 del st.session_state[key]
         st.rerun()
@@ -179,16 +305,25 @@ if page == "ISC _ DO system tracking":
         else:
             stock = stock_input
             ro = ro_input
-            result_df = df[df['Item_Code'].astype(str) == str(item_code)]
+            with metrics.span("decision", session_metrics):
+                entry = lookup_item(items, item_code)
+                if entry is not None:
+                    avg_consume, threshold, moq = entry
+                    decision = bool(order_ok(stock, ro, threshold, moq))
             
-            if len(result_df) == 0:
+            if entry is None:
+                metrics.REGISTRY.inc("decisions", result="UNKNOWN")
                 st.error(f"Item Code '{item_code}' not found in database")
                 st.session_state.show_result = False
             else:
-                avg_consume = abs(float(result_df['Avg_Consume'].iloc[0]))
-                total = stock + ro
-                threshold = 2 * avg_consume
-                decision = total <= threshold
+                metrics.REGISTRY.inc("decisions", result="YES" if decision else "NO")
+                # Buffered only: written to decision_log by the background thread
+                get_decision_log().record(
+                    item_code, stock, ro, avg_consume, threshold,
+                    "YES" if decision else "NO",
+                    session_id=st.session_state.session_id,
+                    site=site,
+                )
                 
                 if decision:
                     st.session_state.decision_text = "YES"
@@ -200,10 +335,88 @@ if page == "ISC _ DO system tracking":
                 st.session_state.show_result = True
                 st.rerun()
     
+    # Batch mode
+    st.markdown("---")
+    with st.expander("Batch Decision (Upload Pick List)"):
+        st.caption("CSV or Excel file with columns: Item Code, Pick to Light Stock, Requested Quantity")
+        pick_file = st.file_uploader(
+            "Pick List File:",
+            type=["csv", "xlsx", "xls"],
+            key="pick_list_file"
+        )
+        
+        if pick_file is not None:
+            try:
+                with metrics.span("batch_read", session_metrics):
+                    pick_df = read_pick_list(pick_file)
+            except Exception as e:
+                st.error(f"Cannot read pick list: {str(e)}")
+            else:
+                with metrics.span("batch_evaluate", session_metrics, rows=len(pick_df)):
+                    batch_result = evaluate_batch(pick_df, items)
+                counts = batch_result['Decision'].value_counts()
+                
+                bcol1, bcol2, bcol3, bcol4 = st.columns(4)
+                bcol1.metric("YES", int(counts.get("YES", 0)))
+                bcol2.metric("NO", int(counts.get("NO", 0)))
+                bcol3.metric("Unknown Items", int(counts.get("UNKNOWN", 0)))
+                bcol4.metric("Invalid Lines", int(counts.get("INVALID", 0)))
+                
+                st.dataframe(batch_result, use_container_width=True)
+                st.download_button(
+                    "Download Result (CSV)",
+                    data=batch_result.to_csv(index=False).encode("utf-8"),
+                    file_name=f"{os.path.splitext(pick_file.name)[0]}_result.csv",
+                    mime="text/csv"
+                )
+    
     # Database view
     st.markdown("---")
     with st.expander("View Full Database"):
-        st.dataframe(df, use_container_width=True)
+        st.caption(f"{len(items):,} items")
+        # The expander body runs on every rerun: only query the database while browsing is on
+        browse = st.toggle("Browse items", key="viewer_open")
+        if browse and store.last_error:
+            st.info("Database unreachable - item browser is unavailable in read-only mode")
+        elif browse:
+            vcol1, vcol2, vcol3, vcol4 = st.columns(4)
+            with vcol1:
+                view_prefix = st.text_input("Item Code starts with", key="viewer_prefix").strip()
+            with vcol2:
+                view_min = st.number_input("Min Avg Consume", value=None, format="%g", key="viewer_min")
+            with vcol3:
+                view_max = st.number_input("Max Avg Consume", value=None, format="%g", key="viewer_max")
+            with vcol4:
+                view_sort = st.selectbox("Sort by", list(SORTS), key="viewer_sort")
+        
+            # Keyset paging: keep the start key of every visited page, restart when filters change
+            view_filters = (site, view_prefix, view_min, view_max, view_sort)
+            if st.session_state.get("viewer_filters") != view_filters:
+                st.session_state.viewer_filters = view_filters
+                st.session_state.viewer_cursors = [None]
+            cursors = st.session_state.viewer_cursors
+        
+            try:
+                with metrics.span("viewer", session_metrics):
+                    page_df, next_key = get_item_viewer(site).page(
+                        store.revision, view_prefix, view_min, view_max, view_sort,
+                        after=cursors[-1], limit=VIEWER_PAGE_SIZE,
+                    )
+            except Exception as e:
+                st.error(f"Cannot read database: {str(e)}")
+            else:
+                st.dataframe(page_df, use_container_width=True, hide_index=True)
+                pcol1, pcol2, pcol3 = st.columns([1, 2, 1])
+                with pcol1:
+                    if st.button("◀ Previous", disabled=len(cursors) == 1, key="viewer_prev"):
+                        cursors.pop()
+                        st.rerun()
+                with pcol2:
+                    st.caption(f"Page {len(cursors)} ({len(page_df)} rows)")
+                with pcol3:
+                    if st.button("Next ▶", disabled=next_key is None, key="viewer_next"):
+                        cursors.append(next_key)
+                        st.rerun()
 
 elif page == "Inventory Management":
     # ========== INVENTORY MANAGEMENT (PENDING) ==========
@@ -230,41 +443,71 @@ elif page == "Inventory Management":
         st.metric("Out of Stock", "Pending", delta="TBD")
 
 elif page == "Sales Analysis":
-    # ========== SALES ANALYSIS (PENDING) ==========
+    # ========== SALES ANALYSIS ==========
     st.title("Sales Analysis")
     st.markdown("---")
     
-    st.info("This feature is under development")
+    items, errors = load_database(site)
+    revision = get_item_store(site).revision if items is not None else None
+    today = datetime.date.today()
     
-    st.write("""
-    **Planned Features:**
-    - Sales trends
-    - Top selling items
-    - Revenue analysis
-    - Forecasting
-    """)
+    date_range = st.date_input("Date Range:", [today - datetime.timedelta(days=90), today])
+    start_date = date_range[0] if len(date_range) > 0 else today
+    end_date = date_range[1] if len(date_range) > 1 else start_date
     
-    # Placeholder chart
-    st.subheader("Sales Trend (Sample)")
-    chart_data = pd.DataFrame({
-        'Month': ['Jan', 'Feb', 'Mar', 'Apr', 'May'],
-        'Sales': [100, 150, 130, 180, 200]
-    })
-    st.line_chart(chart_data.set_index('Month'))
+    try:
+        # Catalog activity per day
+        st.subheader("Avg Consume Changes per Day")
+        summary = load_history("daily_summary", site, revision, start_date, end_date)
+        if summary.empty:
+            st.info("No avg consume changes recorded in this period")
+        else:
+            scol1, scol2, scol3 = st.columns(3)
+            scol1.metric("Changes", int(summary["Changes"].sum()))
+            scol2.metric("New Items", int(summary["New Items"].sum()))
+            scol3.metric("Net Change", f"{summary['Net Change'].sum():,.2f}")
+            st.bar_chart(summary.set_index("Day")[["Changes", "New Items"]])
+        
+        # Trend of a single item
+        st.subheader("Item Trend")
+        tcol1, tcol2 = st.columns([3, 1])
+        with tcol1:
+            trend_item = st.text_input("Item Code:", key="trend_item").strip()
+        with tcol2:
+            trend_period = st.selectbox("Period", ["day", "week"], key="trend_period")
+        if trend_item:
+            trend = load_history("item_trend", site, revision, trend_item, start_date, end_date, trend_period)
+            if trend.empty:
+                st.info(f"No history for '{trend_item}' in this period")
+            else:
+                st.line_chart(trend.set_index("Period")[["Avg_Consume"]])
+        
+        # Biggest changes of one day / week
+        st.subheader("Top Movers")
+        mcol1, mcol2 = st.columns([3, 1])
+        with mcol2:
+            mover_period = st.selectbox("Period", ["day", "week"], key="mover_period")
+        with mcol1:
+            mover_day = st.date_input("Day (or any day of the week):", end_date, key="mover_day")
+        if mover_period == "week":
+            mover_day = mover_day - datetime.timedelta(days=mover_day.weekday())
+        movers = load_history("top_movers", site, revision, mover_day, mover_period)
+        if movers.empty:
+            st.info("No changed items in this period")
+        else:
+            st.dataframe(movers, use_container_width=True, hide_index=True)
+    except Exception as e:
+        st.error(f"Cannot read history: {str(e)}")
 
 elif page == "Reports":
     # ========== REPORTS (PENDING) ==========
     st.title("Reports")
     st.markdown("---")
     
-    st.info("This feature is under development")
-    
     st.write("""
-    **Planned Features:**
-    - Generate custom reports
-    - Export to Excel/PDF
-    - Scheduled reports
-    - Email notifications
+    **Available Reports:**
+    - Daily Summary: every Check Decision result in the date range
+    - Weekly Inventory: current catalog with avg consume and threshold
     """)
     
     report_type = st.selectbox(
@@ -273,8 +516,52 @@ elif page == "Reports":
     )
     
     date_range = st.date_input("Date Range:", [])
+    start_date = date_range[0] if len(date_range) > 0 else None
+    end_date = date_range[1] if len(date_range) > 1 else start_date
+    
+    if report_type not in REPORTS:
+        st.info("This report is under development")
     
-    st.button("Generate Report", disabled=True)
+    if st.button("Generate Report", disabled=report_type not in REPORTS):
+        try:
+            job = get_report_service().submit(report_type, start_date, end_date, site=site)
+            st.session_state.report_job = job.id
+        except Exception as e:
+            st.error(f"Cannot start report: {str(e)}")
+    
+    # Poll the job status without rerunning the whole page, only while the job is running
+    report_job = get_report_service().get(st.session_state.get("report_job"))
+    polling = report_job is not None and not report_job.done
+    
+    @st.fragment(run_every=1 if polling else None)
+    def report_status():
+        job = get_report_service().get(st.session_state.get("report_job"))
+        if job is None:
+            return
+        if not job.done:
+            st.info(f"Generating {job.report_type}... ({job.status})")
+            return
+        if polling:
+            # Finished: rerun the page once so the fragment stops polling
+            st.rerun()
+        if job.status == "error":
+            st.error(f"Report failed: {job.error}")
+            return
+        source = "cached" if job.cached else f"{job.rows:,} rows in {job.finished_at - job.submitted_at:.1f}s"
+        st.success(f"{job.report_type} ready ({source})")
+        # Read the file once per job, not on every rerun
+        if st.session_state.get("report_file", (None,))[0] != job.id:
+            with open(job.path, "rb") as f:
+                st.session_state.report_file = (job.id, f.read())
+        st.download_button(
+            "Download Report (Excel)",
+            data=st.session_state.report_file[1],
+            file_name=job.file_name,
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            key=f"report_download_{job.id}"
+        )
+    
+    report_status()
 
 elif page == "Settings":
     # ========== SETTINGS (PENDING) ==========
@@ -294,9 +581,57 @@ elif page == "Settings":
     st.subheader("Configuration")
     
     st.text_input("Data Folder Path:", value=DATA_FOLDER, disabled=True)
-    st.number_input("Refresh Interval (minutes):", value=30, disabled=True)
+    # Auto-refresh settings apply to the whole server process (every session)
+    refresher = get_store_refresher()
+    refresh_interval = st.number_input(
+        "Refresh Interval (minutes):",
+        min_value=0.1,
+        value=float(refresher.interval_minutes),
+        step=1.0,
+        format="%g",
+        help="How often to check the database for new data when no change notification arrives"
+    )
     st.checkbox("Enable notifications", disabled=True)
-    st.checkbox("Auto-refresh database", disabled=True)
+    auto_refresh = st.checkbox("Auto-refresh database", value=refresher.enabled)
+    if refresh_interval != refresher.interval_minutes or auto_refresh != refresher.enabled:
+        refresher.configure(interval_minutes=refresh_interval, enabled=auto_refresh)
+    
+    if refresher.enabled:
+        mode = "change notifications + interval" if refresher.listening else "interval only"
+        last = (time.strftime("%H:%M:%S", time.localtime(refresher.last_refresh))
+                if refresher.last_refresh else "not yet")
+        st.caption(f"Auto-refresh: {mode}, last check {last}, {site} data revision {get_item_store(site).revision}")
+        if refresher.last_error:
+            st.warning(f"Last refresh failed: {refresher.last_error}")
+
+# Diagnostics: latency percentiles for this session and for the whole server process
+metrics.observe("page_run", time.perf_counter() - page_start, session_metrics)
+st.sidebar.markdown("---")
+with st.sidebar.expander("Diagnostics"):
+    session_summary = session_metrics.summary()
+    process_summary = metrics.REGISTRY.summary()
+    rows = []
+    for name, proc in process_summary.items():
+        sess = session_summary.get(name, {})
+        rows.append({
+            "span": name,
+            "session n": sess.get("count", 0),
+            "session p50": sess.get("p50_ms"),
+            "session p95": sess.get("p95_ms"),
+            "session p99": sess.get("p99_ms"),
+            "process n": proc["count"],
+            "process p50": proc["p50_ms"],
+            "process p95": proc["p95_ms"],
+            "process p99": proc["p99_ms"],
+        })
+    st.caption("Latency in ms (estimated from histogram buckets)")
+    st.dataframe(pd.DataFrame(rows), hide_index=True)
+    st.download_button(
+        "Download Metrics (Prometheus)",
+        data=metrics.REGISTRY.to_prometheus().encode("utf-8"),
+        file_name="ros_metrics.prom",
+        mime="text/plain"
+    )
 
 # Footer
 st.sidebar.markdown("---")
@@ -0,0 +1,84 @@
+"""
+Script để kiểm tra YES/NO cho cả pick list (Batch mode)
+- Input: file CSV/Excel có cột Item Code, Pick to Light Stock, Requested Quantity
+- Output: file kết quả có thêm Avg_Consume, Threshold, Min_Order_Qty, Decision (theo rule của site)
+
+Chạy: python batch_decision.py pick_list.xlsx [output.csv] [--site SITE]
+"""
+
+import pandas as pd
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+from db import connect, get_engine, format_stats
+from decision import read_pick_list, evaluate_batch
+from item_table import ItemTable
+from rules import load_rules
+from sites import DEFAULT_SITE, shard_table
+
+# Load environment variables
+load_dotenv()
+
+# Supabase connection string from .env
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+if not DATABASE_URL:
+    print("❌ DATABASE_URL not found in .env file!")
+    exit(1)
+
+def batch_decision(pick_list_path, output_path=None, table_name='ro_items', site=None):
+    """
+    Tính YES/NO cho toàn bộ pick list
+
+    Args:
+        pick_list_path: Đường dẫn đến file pick list (CSV hoặc Excel)
+        output_path: File kết quả (.csv hoặc .xlsx), mặc định <tên file>_result.csv
+        table_name: Tên bảng trong database
+        site: Site của pick list (mặc định DEFAULT_SITE)
+    """
+    try:
+        print(f"Đọc pick list: {pick_list_path}")
+        pick_df = read_pick_list(pick_list_path)
+        print(f"✓ Đã đọc: {len(pick_df)} dòng")
+
+        print("Đang kết nối Supabase...")
+        engine = get_engine(DATABASE_URL)
+        with connect(engine) as conn:
+            items_df = pd.read_sql(
+                f"SELECT item_code, avg_consume FROM {shard_table(table_name, site)} ORDER BY item_code", conn
+            )
+            rules = load_rules(conn, site or DEFAULT_SITE)
+        items_df.columns = ['Item_Code', 'Avg_Consume']
+        items = ItemTable.from_frame(items_df.dropna(), rules)
+        print(f"✓ Rule quyết định: {len(rules)} rule (+ default)")
+
+        start = time.perf_counter()
+        result = evaluate_batch(pick_df, items)
+        elapsed = time.perf_counter() - start
+
+        if output_path is None:
+            output_path = os.path.splitext(pick_list_path)[0] + "_result.csv"
+        if output_path.lower().endswith(('.xlsx', '.xls')):
+            result.to_excel(output_path, index=False)
+        else:
+            result.to_csv(output_path, index=False)
+
+        counts = result['Decision'].value_counts()
+        print(f"✅ Đã xử lý {len(result)} dòng trong {elapsed * 1000:.1f} ms")
+        for label in ['YES', 'NO', 'UNKNOWN', 'INVALID']:
+            print(f"   - {label}: {counts.get(label, 0)}")
+        print(f"   File kết quả: {output_path}")
+        print(f"   {format_stats()}")
+
+    except Exception as e:
+        print(f"❌ Lỗi: {str(e)}")
+
+if __name__ == "__main__":
+    site = sys.argv[sys.argv.index("--site") + 1] if "--site" in sys.argv else None
+    args = [a for a in sys.argv[1:] if a not in ("--site", site)]
+    if len(args) < 1:
+        print("Cách dùng: python batch_decision.py <pick_list.csv|xlsx> [output.csv|xlsx] [--site SITE]")
+    else:
+        batch_decision(args[0], args[1] if len(args) > 1 else None, site=site)
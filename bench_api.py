@@ -0,0 +1,147 @@
+"""
+Load test cho decision_api.py
+- Latency trong process (DecisionService.decide / decide_batch, không qua HTTP)
+- RPS + latency p50 / p95 / p99 qua HTTP (keep-alive, nhiều client thread)
+- Mặc định chạy server ở process riêng với catalog giả lập (--items),
+  hoặc đo server đang chạy bằng --url (request dùng item ITEM-N của site mặc định)
+
+Chạy: python bench_api.py [--items N] [--threads T] [--duration S] [--batch B] [--url URL]
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from decision_api import DecisionService, make_server
+from item_store import ItemStore
+from item_table import ItemTable
+from sites import DEFAULT_SITE
+
+
+def make_service(n, seed=0):
+    """DecisionService với 1 site, n item giả lập ITEM-0 .. ITEM-{n-1} (không cần database)"""
+    rng = np.random.default_rng(seed)
+    codes = np.char.add('ITEM-', np.arange(n).astype(str))
+    store = ItemStore(snapshot_dir=None)
+    store._set_table(ItemTable.from_arrays(codes, rng.normal(50, 30, n).round(3)), 0,
+                     rebuild_search=False)
+    return DecisionService(stores={DEFAULT_SITE: store})
+
+
+def serve(n, port, ready):
+    server = make_server(make_service(n), '127.0.0.1', port)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def make_bodies(n, batch, count=1000, seed=1):
+    """Request ngẫu nhiên (5% item không có trong catalog)"""
+    rng = np.random.default_rng(seed)
+
+    def item():
+        code = int(rng.integers(0, int(n * 1.05)))
+        return {'item_code': f"ITEM-{code}", 'stock': int(rng.integers(0, 100)),
+                'qty': int(rng.integers(0, 100))}
+
+    if batch <= 1:
+        return [json.dumps(item()).encode() for _ in range(count)]
+    return [json.dumps({'items': [item() for _ in range(batch)]}).encode() for _ in range(count // 10 or 1)]
+
+
+def run_in_process(n, batch):
+    service = make_service(n)
+    rng = np.random.default_rng(2)
+    codes = [f"ITEM-{c}" for c in rng.integers(0, n, 10_000)]
+    start = time.perf_counter()
+    for code in codes:
+        service.decide(code, 10, 5)
+    single_s = (time.perf_counter() - start) / len(codes)
+    items = [{'item_code': c, 'stock': 10, 'qty': 5} for c in codes[:max(batch, 1)]]
+    start = time.perf_counter()
+    for _ in range(20):
+        service.decide_batch(items)
+    batch_s = (time.perf_counter() - start) / 20
+    print(f"In-process: decide {single_s * 1e6:.1f}us / item, "
+          f"decide_batch({len(items)}) {batch_s * 1e3:.2f}ms")
+
+
+def client(host, port, path, bodies, deadline, latencies, errors):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    i = 0
+    while time.perf_counter() < deadline:
+        body = bodies[i % len(bodies)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request('POST', path, body, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def run_http(host, port, bodies, threads, duration, batch):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    workers = [
+        threading.Thread(target=client, args=(host, port, '/decision', bodies, deadline, latencies, errors))
+        for _ in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1e3
+    rps = len(ms) / elapsed
+    print(f"\nHTTP: {threads} client thread, {duration}s, {max(batch, 1)} item / request")
+    print(f"{'requests':>10} {'errors':>8} {'RPS':>10} {'items/s':>12} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    if len(ms):
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        print(f"{len(ms):>10,} {len(errors):>8,} {rps:>10,.0f} {rps * max(batch, 1):>12,.0f} "
+              f"{p50:>7.2f}ms {p95:>7.2f}ms {p99:>7.2f}ms {ms.max():>7.2f}ms")
+    if errors:
+        print(f"❌ Lỗi đầu tiên: {errors[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test decision API")
+    parser.add_argument("--items", type=int, default=100_000, help="Số item của catalog giả lập")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--batch", type=int, default=1, help="Số item / request (1 = request đơn)")
+    parser.add_argument("--url", help="Đo server đang chạy, vd: http://localhost:8600")
+    args = parser.parse_args()
+
+    bodies = make_bodies(args.items, args.batch)
+    process = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        run_in_process(args.items, args.batch)
+        ready = multiprocessing.Queue()
+        process = multiprocessing.Process(target=serve, args=(args.items, 0, ready), daemon=True)
+        process.start()
+        host, port = '127.0.0.1', ready.get(timeout=60)
+    try:
+        run_http(host, port, bodies, args.threads, args.duration, args.batch)
+    finally:
+        if process is not None:
+            process.terminate()
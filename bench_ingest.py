@@ -0,0 +1,237 @@
+"""
+Benchmark ingestion: Replace / Append / Upsert với workbook giả lập
+- Workbook cùng layout với file export từ ERP: header ở row 2, tên cột "nhiễu",
+  item trùng, avg_consume không phải số, dòng trống, nhiều cột thừa
+- Đo thời gian từng stage (detect, read, clean, load, merge) và peak memory,
+  mỗi case chạy trong một process riêng để đo memory chính xác
+- Ghi theo pipeline giống các script (đọc Excel song song với ghi database):
+  tổng các stage > total nghĩa là các stage đã chạy chồng lên nhau
+- Ghi kết quả ra JSON để so sánh giữa các lần chạy (--compare)
+
+Chạy: python bench_ingest.py [--sizes 10000,100000] [--modes replace,append,upsert]
+                             [--db URL] [--compare bench_results/<file>.json]
+(mặc định dùng SQLite local; truyền --db postgresql://... để chạy với Postgres local)
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from openpyxl import Workbook
+from sqlalchemy import text
+
+DEFAULT_SIZES = [10_000, 100_000]
+MODES = ['replace', 'append', 'upsert']
+STAGES = ['detect', 'read', 'clean', 'load', 'merge']
+DATA_DIR = "bench_data"
+RESULTS_DIR = "bench_results"
+
+# Tên cột giống file export thật: có cột "gây nhiễu" cho heuristic tìm cột
+HEADERS = [
+    'No.', 'Item Description', '  ITEM CODE  ', 'UOM', 'Warehouse', 'On Hand',
+    'Consume Last Month', 'Avg. Consume (3M)', 'Unit Cost', 'Supplier', 'Note',
+]
+INVALID_VALUES = ['n/a', '-', 'N/A', '#VALUE!', 'abc', '']
+
+
+def generate_workbook(path, n_rows, seed=0, duplicate_rate=0.05, invalid_rate=0.02,
+                      blank_rate=0.01, extra_columns=20):
+    """
+    Tạo workbook giả lập (openpyxl write-only, không giữ cả file trong memory)
+
+    Args:
+        path: File .xlsx đầu ra
+        n_rows: Số dòng data
+        duplicate_rate: Tỉ lệ dòng trùng item_code với dòng trước đó
+        invalid_rate: Tỉ lệ avg_consume không phải số
+        blank_rate: Tỉ lệ dòng trống item_code
+        extra_columns: Số cột thừa thêm vào cuối (file export thật rất rộng)
+    """
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Export")
+    ws.append([f"ERP Inventory Export - {n_rows} rows"])
+    ws.append(HEADERS + [f"Extra {i}" for i in range(extra_columns)])
+
+    filler = ['x'] * extra_columns
+    for i in range(n_rows):
+        r = rng.random()
+        if r < blank_rate:
+            code = None
+        elif r < blank_rate + duplicate_rate and i > 0:
+            code = f"IT{rng.randrange(i):07d}"
+        elif rng.random() < 0.2:
+            code = 1_000_000_000 + i  # Một số item code dạng số
+        else:
+            code = f"IT{i:07d}"
+
+        if rng.random() < invalid_rate:
+            avg = rng.choice(INVALID_VALUES)
+        else:
+            avg = round(rng.gauss(50, 40), 3)
+
+        ws.append([i + 1, f"Item description {i}", code, 'PCS', 'WH01',
+                   rng.randint(0, 500), round(rng.uniform(0, 100), 2), avg,
+                   round(rng.uniform(1, 1000), 2), 'Supplier A', None] + filler)
+    wb.save(path)
+
+
+def workbook_path(n_rows, seed=0, data_dir=DATA_DIR):
+    """Đường dẫn workbook giả lập (tạo nếu chưa có, dùng lại giữa các lần chạy)"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"synthetic_{n_rows}_{seed}.xlsx")
+    if not os.path.exists(path):
+        print(f"   Tạo workbook {n_rows:,} dòng: {path}")
+        generate_workbook(path, n_rows, seed)
+    return path
+
+
+def reset_database(url, table_name):
+    """Xóa bảng data + metadata để mỗi case bắt đầu từ database trống"""
+    import db
+    from history import history_tables
+    from sites import SITES_TABLE, shard_table
+
+    if url.startswith('sqlite:///'):
+        path = url[len('sqlite:///'):]
+        if path and os.path.exists(path):
+            os.remove(path)
+        return
+    with db.begin(db.get_engine(url)) as conn:
+        tables = [table_name, 'table_revisions', 'ingest_manifest', SITES_TABLE]
+        tables += [t for key, t in history_tables(shard_table(table_name)).items() if key != 'changes']
+        for table in tables:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table} CASCADE"))
+
+
+def run_case(mode, path, url, table_name='ro_items', writers=1):
+    """Chạy một case (trong process riêng), trả về dict kết quả"""
+    import db
+    from bulk_loader import append_rows, bulk_upsert, replace_table
+    from excel_reader import iter_clean_chunks
+
+    reset_database(url, table_name)
+    engine = db.get_engine(url, statement_timeout_ms=0)
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = {}
+    start_total = time.perf_counter()
+
+    chunks = iter_clean_chunks(path, timings=timings)
+
+    if mode == 'replace':
+        summary = replace_table(engine, chunks, table_name, timings=timings)
+    elif mode == 'append':
+        summary = append_rows(engine, chunks, table_name, timings=timings)
+    else:
+        summary = bulk_upsert(engine, chunks, table_name, timings=timings, writers=writers)
+
+    total = time.perf_counter() - start_total
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'mode': mode,
+        'items': summary['rows'],
+        'timings': {stage: timings.get(stage, 0.0) for stage in STAGES},
+        'total': total,
+        'peak_rss_mb': rss_peak / 1024,
+        'rss_growth_mb': (rss_peak - rss_start) / 1024,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_results(results):
+    print(f"\n{'rows':>10} {'mode':>8} {'items':>9} " + " ".join(f"{s:>8}" for s in STAGES)
+          + f" {'total':>8} {'peak MB':>8}")
+    for r in results:
+        stages = " ".join(f"{r['timings'][s]:>7.2f}s" for s in STAGES)
+        print(f"{r['rows']:>10,} {r['mode']:>8} {r['items']:>9,} {stages} "
+              f"{r['total']:>7.2f}s {r['peak_rss_mb']:>8.0f}")
+
+
+def print_comparison(results, baseline_path):
+    """So sánh với kết quả lần chạy trước (tỉ lệ thời gian: >1 là chậm hơn)"""
+    with open(baseline_path) as f:
+        baseline = {(r['rows'], r['mode']): r for r in json.load(f)['results']}
+    print(f"\nSo sánh với {baseline_path} (mới / cũ):")
+    for r in results:
+        old = baseline.get((r['rows'], r['mode']))
+        if old is None:
+            continue
+        ratios = []
+        for stage in STAGES + ['total']:
+            new_s = r['total'] if stage == 'total' else r['timings'][stage]
+            old_s = old['total'] if stage == 'total' else old['timings'][stage]
+            ratios.append(f"{stage} {new_s / old_s:.2f}x" if old_s > 0.001 else f"{stage} -")
+        mem = r['peak_rss_mb'] / old['peak_rss_mb'] if old['peak_rss_mb'] else 0
+        print(f"   {r['rows']:>10,} {r['mode']:>8}: " + ", ".join(ratios) + f", memory {mem:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion Replace / Append / Upsert")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES),
+                        help="Số dòng workbook, cách nhau bởi dấu phẩy (vd: 10000,100000,1000000)")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--db", default=None,
+                        help="Database URL (mặc định: SQLite trong bench_data/)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--writers", type=int, default=1, help="Số writer COPY song song (upsert)")
+    parser.add_argument("--out", default=RESULTS_DIR, help="Folder ghi file kết quả JSON")
+    parser.add_argument("--compare", default=None, help="File JSON của lần chạy trước")
+    args = parser.parse_args()
+
+    sizes = [int(n) for n in args.sizes.split(",")]
+    modes = [m for m in args.modes.split(",") if m]
+    url = args.db or f"sqlite:///{os.path.abspath(os.path.join(DATA_DIR, 'bench.db'))}"
+
+    results = []
+    # spawn: mỗi case là process mới -> peak memory không bị ảnh hưởng bởi case trước
+    ctx = multiprocessing.get_context('spawn')
+    for n_rows in sizes:
+        path = workbook_path(n_rows, args.seed)
+        for mode in modes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                result = pool.submit(run_case, mode, path, url, writers=args.writers).result()
+            result['rows'] = n_rows
+            results.append(result)
+            print(f"   ✓ {n_rows:,} dòng, {mode}: {result['total']:.2f}s")
+
+    print_results(results)
+
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"ingest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(out_path, 'w') as f:
+        json.dump({
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'commit': git_commit(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'database': url.split(':', 1)[0],
+                'seed': args.seed,
+                'writers': args.writers,
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f"\n📄 Kết quả: {out_path}")
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Microbenchmark cho "Check Decision"
+So sánh ItemTable (binary search, đang dùng) với 2 cách cũ làm baseline:
+filter cả DataFrame mỗi lần click và dict Python item_code -> (avg, threshold)
+ở 10k, 100k và 1M items, đo batch mode với pick list 100k dòng,
+search Item Code (prefix / substring / không khớp)
+và memory của cache dashboard (DataFrame + dict index so với ItemTable)
+
+Chạy: python bench_lookup.py
+"""
+
+import gc
+import pickle
+import random
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from decision import evaluate_batch, lookup_item
+from item_search import ItemSearchIndex
+from item_table import ItemTable
+from rules import order_ok
+
+SIZES = [10_000, 100_000, 1_000_000]
+N_LOOKUPS = 1_000
+BATCH_LINES = 100_000
+
+
+def make_items(n, seed=0):
+    """Tạo DataFrame giả lập giống kết quả của load_database()"""
+    rng = np.random.default_rng(seed)
+    codes = np.char.add('ITEM-', np.arange(n).astype(str))
+    avg = rng.normal(50, 30, n).round(3)
+    return pd.DataFrame({'Item_Code': codes, 'Avg_Consume': avg})
+
+
+def scan_decision(df, item_code, stock, ro):
+    """Cách cũ trong app.py: filter cả cột mỗi lần click"""
+    result_df = df[df['Item_Code'].astype(str) == str(item_code)]
+    if len(result_df) == 0:
+        return None
+    avg_consume = abs(float(result_df['Avg_Consume'].iloc[0]))
+    return stock + ro <= 2 * avg_consume
+
+
+def dict_index(df):
+    """Baseline: dict item_code -> (avg, threshold) như load_database() cũ (item trùng: dòng đầu thắng)"""
+    codes = df['Item_Code'].astype(str).tolist()
+    avg = df['Avg_Consume'].abs().to_numpy(dtype=float)
+    entries = zip(avg.tolist(), (2 * avg).tolist())
+    return dict(zip(reversed(codes), reversed(list(entries))))
+
+
+def dict_decision(index, item_code, stock, ro):
+    entry = index.get(str(item_code))
+    if entry is None:
+        return None
+    return stock + ro <= entry[1]
+
+
+def table_decision(table, item_code, stock, ro):
+    """Cách hiện tại trong app.py / decision_api.py"""
+    entry = lookup_item(table, item_code)
+    if entry is None:
+        return None
+    return order_ok(stock, ro, entry[1], entry[2])
+
+
+def time_per_call(fn, codes):
+    """Trả về thời gian trung bình mỗi lần gọi (giây)"""
+    start = time.perf_counter()
+    for code in codes:
+        fn(code)
+    return (time.perf_counter() - start) / len(codes)
+
+
+def run():
+    print(f"{'items':>10} {'build dict':>12} {'build table':>12} {'scan / call':>14} "
+          f"{'dict / call':>13} {'table / call':>14} {'vs scan':>9}")
+    for n in SIZES:
+        df = make_items(n)
+        codes = random.Random(n).choices(df['Item_Code'].tolist(), k=N_LOOKUPS)
+
+        start = time.perf_counter()
+        index = dict_index(df)
+        dict_build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        table = ItemTable.from_frame(df)
+        table_build_s = time.perf_counter() - start
+
+        # Scan chậm -> chỉ đo một phần nhỏ số lần tra cứu
+        scan_codes = codes[:max(5, N_LOOKUPS * 10_000 // n // 10)]
+        scan_s = time_per_call(lambda c: scan_decision(df, c, 10.0, 5.0), scan_codes)
+        dict_s = time_per_call(lambda c: dict_decision(index, c, 10.0, 5.0), codes)
+        table_s = time_per_call(lambda c: table_decision(table, c, 10.0, 5.0), codes)
+
+        # Các cách phải cho cùng kết quả (rule mặc định)
+        for code in scan_codes + ['MISSING']:
+            expected = scan_decision(df, code, 10.0, 5.0)
+            assert expected == dict_decision(index, code, 10.0, 5.0) == table_decision(table, code, 10.0, 5.0)
+
+        print(f"{n:>10,} {dict_build_s * 1e3:>10.1f}ms {table_build_s * 1e3:>10.1f}ms "
+              f"{scan_s * 1e6:>12.1f}us {dict_s * 1e6:>11.3f}us {table_s * 1e6:>12.3f}us "
+              f"{scan_s / table_s:>8,.0f}x")
+
+
+def run_batch():
+    """Batch mode: BATCH_LINES dòng pick list, ~5% item không có trong database (so với loop tra dict)"""
+    print(f"\n{'items':>10} {'pick lines':>12} {'dict loop':>12} {'batch time':>12} {'speedup':>10}")
+    for n in SIZES:
+        df = make_items(n)
+        rng = np.random.default_rng(n)
+        picked = rng.choice(df['Item_Code'].to_numpy(), BATCH_LINES)
+        missing = rng.random(BATCH_LINES) < 0.05
+        picked[missing] = 'MISSING'
+        pick_df = pd.DataFrame({
+            'Item_Code': picked,
+            'Stock': rng.uniform(0, 100, BATCH_LINES).round(3),
+            'Requested_Qty': rng.uniform(0, 100, BATCH_LINES).round(3),
+        })
+
+        index = dict_index(df)
+        start = time.perf_counter()
+        looped = [dict_decision(index, code, stock, qty) for code, stock, qty in pick_df.itertuples(index=False)]
+        loop_s = time.perf_counter() - start
+
+        table = ItemTable.from_frame(df)
+        start = time.perf_counter()
+        result = evaluate_batch(pick_df, table)
+        batch_s = time.perf_counter() - start
+        assert (result['Decision'] == 'UNKNOWN').sum() == missing.sum()
+        expected = ['UNKNOWN' if ok is None else 'YES' if ok else 'NO' for ok in looped]
+        assert result['Decision'].tolist() == expected
+
+        print(f"{n:>10,} {BATCH_LINES:>12,} {loop_s * 1e3:>10.1f}ms {batch_s * 1e3:>10.1f}ms "
+              f"{loop_s / batch_s:>9,.0f}x")
+
+
+
+def run_search():
+    """Search Item Code: thời gian build index và mỗi lần search"""
+    queries = {'prefix': 'item-12', 'substring': '999', 'no match': 'zzz'}
+    print(f"\n{'items':>10} {'build':>10} " + " ".join(f"{name:>12}" for name in queries))
+    for n in SIZES:
+        codes = make_items(n)['Item_Code']
+        start = time.perf_counter()
+        search_index = ItemSearchIndex(codes)
+        build_s = time.perf_counter() - start
+        timings = [time_per_call(search_index.search, [q] * 20) for q in queries.values()]
+        print(f"{n:>10,} {build_s * 1e3:>8.1f}ms " + " ".join(f"{t * 1e3:>10.3f}ms" for t in timings))
+
+
+def measure_memory(build):
+    """
+    Memory giữ bởi kết quả của build() (bytes): allocation Python/NumPy (tracemalloc)
+    + memory pool của Arrow (cột string của pandas 3)
+
+    Returns:
+        (kết quả, bytes)
+    """
+    gc.collect()
+    arrow_start = pa.total_allocated_bytes()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current + pa.total_allocated_bytes() - arrow_start
+
+
+def run_memory():
+    """Memory của cache dashboard: DataFrame + dict index (cũ) so với ItemTable + search index"""
+    print(f"\n{'items':>10} {'df + dict':>12} {'item table':>12} {'+ search':>12} "
+          f"{'pickle df':>12} {'pickle table':>13}")
+    for n in SIZES:
+        raw = make_items(n)
+        codes, avg = raw['Item_Code'].tolist(), raw['Avg_Consume'].to_numpy()
+        del raw
+
+        # Giống load_database() cũ: DataFrame + dict item_code -> (avg, threshold)
+        def build_old():
+            df = pd.DataFrame({'Item_Code': np.array(codes, dtype=object), 'Avg_Consume': avg.copy()})
+            return df, dict_index(df)
+        (df, index), old_bytes = measure_memory(build_old)
+
+        table, table_bytes = measure_memory(lambda: ItemTable.from_arrays(codes, avg))
+        search, search_bytes = measure_memory(lambda: ItemSearchIndex(table.codes))
+
+        # Hai cách phải cho cùng kết quả
+        for code in codes[:1000]:
+            assert index[code] == table.get(code)[:2]
+
+        print(f"{n:>10,} {old_bytes / 2**20:>10.1f}MB {table_bytes / 2**20:>10.1f}MB "
+              f"{(table_bytes + search_bytes) / 2**20:>10.1f}MB "
+              f"{len(pickle.dumps(df)) / 2**20:>10.1f}MB {len(pickle.dumps(table)) / 2**20:>11.1f}MB")
+        del df, index, table, search
+
+
+if __name__ == "__main__":
+    run()
+    run_batch()
+    run_search()
+    run_memory()
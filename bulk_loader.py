@@ -0,0 +1,463 @@
+"""
+Ghi data vào database (dùng chung cho các script)
+- Replace / Append / Upsert, mỗi lần ghi 1 site (shard {table}_{site}, xem sites.py)
+- Replace: load vào bảng staging (đã có PRIMARY KEY + index) rồi swap bằng RENAME
+  (PostgreSQL: DETACH CONCURRENTLY / ATTACH PARTITION, các site khác không bị ảnh hưởng)
+- Thứ tự lock của mọi lần ghi: shard -> row revision (không deadlock giữa Replace và Upsert/Append),
+  DDL (tạo shard, index, bảng history) chạy ở transaction riêng trước transaction ghi data
+- Append: từng chunk commit riêng, item_code đã có thì bỏ qua (ON CONFLICT DO NOTHING)
+- PostgreSQL: COPY FROM STDIN (psycopg2 copy_expert) vào bảng TEMP của session
+- SQLite (chạy local/test không cần Postgres): executemany
+- Merge từ bảng TEMP vào bảng chính trong cùng một transaction,
+  chỉ ghi những dòng mới hoặc thay đổi (và ghi các thay đổi đó vào history, xem history.py)
+- Input dạng iterable chunk (iter_clean_chunks): parse Excel chạy song song với ghi
+  database qua pipeline (queue có giới hạn)
+"""
+
+import io
+import os
+import time
+import uuid
+
+import pandas as pd
+from sqlalchemy import inspect, text
+
+from db import DETACH_LOCK_TIMEOUT_MS, LOCK_TIMEOUT_MS, begin, run_locked
+from history import ensure_history, record_history, stage_changes
+from pipeline import prefetch, run_pipeline
+from revision import ensure_revision, ensure_revision_table, next_revision
+from sites import (DEFAULT_SITE, attach_shard, detach_shard, ensure_parent, ensure_shard,
+                   normalize_site, shard_columns, shard_table)
+
+COLUMNS = ['item_code', 'avg_consume']
+
+# Số dòng mỗi chunk (mỗi chunk 1 transaction) của Append mode (có thể override trong .env)
+APPEND_CHUNK_SIZE = int(os.getenv("APPEND_CHUNK_SIZE", "10000"))
+
+
+def is_postgres(conn):
+    return conn.dialect.name == 'postgresql'
+
+
+def ensure_table(conn, table_name, site=None):
+    """
+    Tạo shard của site nếu chưa có ((site, item_code) là PRIMARY KEY, có cột revision)
+    + bảng history của shard. Gọi ở transaction riêng, trước transaction ghi data
+
+    Returns:
+        Tên shard
+    """
+    shard = ensure_shard(conn, table_name, site)
+    # Cho viewer sort/lọc theo avg_consume (keyset trên (avg_consume, item_code))
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {shard}_avg_consume_idx "
+        f"ON {shard} (avg_consume, item_code)"
+    ))
+    ensure_revision(conn, shard)
+    ensure_history(conn, shard)
+    return shard
+
+
+def lock_shard(conn, shard, mode='ROW EXCLUSIVE'):
+    """
+    Lock shard trước khi lấy row lock revision (next_revision) - mọi lần ghi cùng 1 thứ tự lock
+    ROW EXCLUSIVE: các lần ghi không chặn nhau / người đọc, chỉ chờ swap của Replace mode
+    """
+    if is_postgres(conn):
+        conn.execute(text(f"LOCK TABLE {shard} IN {mode} MODE"))
+
+
+def create_stage_table(conn, stage_table, site=DEFAULT_SITE):
+    """Tạo bảng TEMP (chỉ tồn tại trong session/transaction hiện tại)"""
+    if is_postgres(conn):
+        on_commit = " ON COMMIT DROP"
+    else:
+        on_commit = ""
+        conn.execute(text(f"DROP TABLE IF EXISTS {stage_table}"))
+    conn.execute(text(f"""
+        CREATE TEMP TABLE {stage_table} (
+            site TEXT NOT NULL DEFAULT '{normalize_site(site)}',
+            item_code TEXT,
+            avg_consume NUMERIC
+        ){on_commit}
+    """))
+
+
+def copy_frame(conn, df, table_name):
+    """
+    Ghi DataFrame vào bảng bằng COPY (PostgreSQL) hoặc executemany (SQLite)
+
+    Args:
+        conn: SQLAlchemy Connection (đang trong transaction)
+        df: DataFrame với cột 'item_code' và 'avg_consume'
+        table_name: Bảng đích
+    """
+    if len(df) == 0:
+        return
+    if is_postgres(conn):
+        buf = io.StringIO()
+        df[COLUMNS].to_csv(buf, index=False, header=False)
+        buf.seek(0)
+        copy_sql = f"COPY {table_name} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            if hasattr(cursor, 'copy_expert'):
+                cursor.copy_expert(copy_sql, buf)
+            else:
+                # psycopg 3
+                with cursor.copy(copy_sql) as copy:
+                    copy.write(buf.getvalue())
+        finally:
+            cursor.close()
+    else:
+        conn.exec_driver_sql(
+            f"INSERT INTO {table_name} ({', '.join(COLUMNS)}) VALUES (?, ?)",
+            list(df[COLUMNS].itertuples(index=False, name=None)),
+        )
+
+
+def _iter_frames(data):
+    """
+    Nhận một DataFrame hoặc iterable các chunk DataFrame
+    Iterable được đọc trước ở thread riêng (prefetch) trong lúc chunk trước đang được ghi
+    """
+    if hasattr(data, 'columns'):
+        yield data
+    else:
+        yield from prefetch(data)
+
+
+def _rechunk(frames, chunksize, skip_rows=0):
+    """Chia lại các chunk thành đúng `chunksize` dòng (bỏ qua `skip_rows` dòng đầu)"""
+    buffer, buffered = [], 0
+    for frame in frames:
+        if skip_rows:
+            if len(frame) <= skip_rows:
+                skip_rows -= len(frame)
+                continue
+            frame, skip_rows = frame.iloc[skip_rows:], 0
+        buffer.append(frame)
+        buffered += len(frame)
+        while buffered >= chunksize:
+            merged = pd.concat(buffer, ignore_index=True) if len(buffer) > 1 else buffer[0]
+            yield merged.iloc[:chunksize]
+            rest = merged.iloc[chunksize:]
+            buffer, buffered = [rest], len(rest)
+    if buffered:
+        yield pd.concat(buffer, ignore_index=True)
+
+
+def _distinct(conn):
+    """Toán tử so sánh khác nhau có tính NULL theo từng database"""
+    return "IS DISTINCT FROM" if is_postgres(conn) else "IS NOT"
+
+
+def _record(timings, stage, start):
+    """Cộng dồn thời gian của một stage vào dict timings (nếu có)"""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def _create_replace_table(conn, table_name, shard, site):
+    """Bảng mới cho Replace mode (SQLite không thêm được PRIMARY KEY sau khi tạo bảng)"""
+    if is_postgres(conn):
+        columns = shard_columns(site, constraint=f"{shard}_site_check")
+    else:
+        columns = shard_columns(site) + ", PRIMARY KEY (site, item_code)"
+    conn.execute(text(f"CREATE TABLE {table_name} ({columns})"))
+
+
+def replace_table(engine, data, table_name='ro_items', timings=None, site=None):
+    """
+    Thay thế toàn bộ data của 1 site bằng data mới (Replace mode), không downtime:
+    1. Bulk load vào bảng staging rồi tạo PRIMARY KEY + index (shard cũ vẫn phục vụ bình thường)
+    2. PostgreSQL: DETACH PARTITION CONCURRENTLY shard cũ (không lock exclusive bảng partitioned)
+    3. Một transaction ngắn có lock_timeout (hết giờ -> thử lại, xem db.run_locked):
+       lock shard cũ, diff history, tăng revision, DROP shard cũ, RENAME staging -> shard
+    4. ATTACH PARTITION shard mới (lock_timeout + thử lại)
+    Người đọc luôn thấy shard cũ đầy đủ hoặc shard mới đầy đủ (đã có index)
+
+    Args:
+        engine: SQLAlchemy engine
+        data: DataFrame hoặc iterable các chunk DataFrame đã bỏ duplicate (vd: iter_clean_chunks)
+        table_name: Tên bảng trong database
+        timings: Dict nhận thời gian từng stage ('load', 'merge')
+        site: Site của data (mặc định DEFAULT_SITE)
+
+    Returns:
+        dict: rows, revision, table (tên shard)
+    """
+    site = normalize_site(site or DEFAULT_SITE)
+    shard = shard_table(table_name, site)
+    stage_table = f"{shard}_staging"
+    if hasattr(data, 'columns'):
+        data = data.drop_duplicates(subset=['item_code'], keep='first')
+    total = 0
+
+    with begin(engine) as conn:
+        ensure_parent(conn, table_name)
+        ensure_revision_table(conn)
+        ensure_history(conn, shard)
+        # Bảng staging còn sót lại từ lần chạy lỗi trước -> tạo lại
+        conn.execute(text(f"DROP TABLE IF EXISTS {stage_table}"))
+        _create_replace_table(conn, stage_table, shard, site)
+        for chunk in _iter_frames(data):
+            start = time.perf_counter()
+            copy_frame(conn, chunk, stage_table)
+            _record(timings, 'load', start)
+            total += len(chunk)
+        # Build index sau khi load (nhanh hơn cập nhật index từng dòng)
+        start = time.perf_counter()
+        if is_postgres(conn):
+            conn.execute(text(f"ALTER TABLE {stage_table} ADD PRIMARY KEY (site, item_code)"))
+            conn.execute(text(
+                f"CREATE INDEX {stage_table}_revision_idx ON {stage_table} (revision)"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX {stage_table}_avg_consume_idx ON {stage_table} (avg_consume, item_code)"
+            ))
+            conn.execute(text(f"ANALYZE {stage_table}"))
+        _record(timings, 'load', start)
+
+    # Swap: chỉ giữ lock shard cũ trong vài thao tác metadata
+    # Dòng của lần replace giữ revision 0: base_revision mới buộc dashboard load lại toàn bộ,
+    # các lần upsert/append sau sẽ gắn revision lớn hơn cho dòng thay đổi
+    start = time.perf_counter()
+    run_locked(engine, lambda conn: detach_shard(conn, table_name, shard),
+               timeout_ms=min(LOCK_TIMEOUT_MS, DETACH_LOCK_TIMEOUT_MS), autocommit=True)
+
+    def swap(conn):
+        # History: so với shard cũ sau khi lock exclusive -> lần ghi commit trước khi có lock
+        # cũng được tính, không lần ghi nào chen vào giữa diff và DROP
+        if inspect(conn).has_table(shard):
+            lock_shard(conn, shard, 'ACCESS EXCLUSIVE')
+            stage_changes(conn, shard, f"""
+                SELECT s.item_code, s.avg_consume, t.avg_consume FROM {stage_table} s
+                LEFT JOIN {shard} t ON t.site = s.site AND t.item_code = s.item_code
+                WHERE t.item_code IS NULL OR t.avg_consume {_distinct(conn)} s.avg_consume
+            """)
+        else:
+            stage_changes(conn, shard, f"SELECT item_code, avg_consume, NULL FROM {stage_table}")
+        revision = next_revision(conn, shard, full_replace=True)
+        record_history(conn, shard, revision, ensure=False)
+        conn.execute(text(f"DROP TABLE IF EXISTS {shard}"))
+        if not is_postgres(conn):
+            # SQLite: tên index dùng chung cả database và không đổi tên được -> tạo với tên
+            # của shard sau khi DROP shard cũ, trước RENAME (shard mới có đủ index ngay)
+            conn.execute(text(f"CREATE INDEX {shard}_revision_idx ON {stage_table} (revision)"))
+            conn.execute(text(
+                f"CREATE INDEX {shard}_avg_consume_idx ON {stage_table} (avg_consume, item_code)"
+            ))
+        conn.execute(text(f"ALTER TABLE {stage_table} RENAME TO {shard}"))
+        if is_postgres(conn):
+            for suffix in ('pkey', 'revision_idx', 'avg_consume_idx'):
+                conn.execute(text(f"ALTER INDEX {stage_table}_{suffix} RENAME TO {shard}_{suffix}"))
+        ensure_revision(conn, shard)
+        return revision
+
+    revision = run_locked(engine, swap)
+    # CHECK (site = ...) có sẵn -> ATTACH không quét lại bảng
+    run_locked(engine, lambda conn: attach_shard(conn, table_name, shard, site))
+    _record(timings, 'merge', start)
+    return {'rows': total, 'revision': revision, 'table': shard}
+
+
+def append_rows(engine, data, table_name='ro_items', chunksize=APPEND_CHUNK_SIZE, resume_from=None,
+                after_chunk=None, timings=None, site=None):
+    """
+    Thêm data vào bảng, giữ data cũ (Append mode)
+    - Ghi theo từng chunk: COPY vào bảng TEMP rồi INSERT ... ON CONFLICT DO NOTHING
+      (item_code đã có trong bảng -> bỏ qua, không lỗi cả batch)
+    - Mỗi chunk commit riêng: lỗi giữa chừng thì chạy lại từ chunk chưa commit (resume_from)
+
+    Args:
+        engine: SQLAlchemy engine
+        data: DataFrame hoặc iterable các chunk DataFrame (vd: iter_clean_chunks)
+        table_name: Tên bảng trong database
+        chunksize: Số dòng mỗi chunk
+        resume_from: Summary đã commit của lần chạy trước ({'chunks', 'inserted', 'skipped'}),
+            các chunk đó được bỏ qua
+        after_chunk: Hàm (conn, summary) gọi trước khi commit mỗi chunk (vd: lưu tiến độ)
+        timings: Dict nhận thời gian từng stage ('load': COPY vào bảng TEMP, 'merge')
+        site: Site của data (mặc định DEFAULT_SITE)
+
+    Returns:
+        dict: rows (số dòng input), inserted, skipped, chunks, resumed_chunks, revision, table (tên shard)
+    """
+    site = normalize_site(site or DEFAULT_SITE)
+    shard = shard_table(table_name, site)
+    stage_table = f"{shard}_append_stage"
+    resume_from = resume_from or {}
+    summary = {
+        'rows': resume_from.get('chunks', 0) * chunksize,
+        'inserted': resume_from.get('inserted', 0),
+        'skipped': resume_from.get('skipped', 0),
+        'chunks': resume_from.get('chunks', 0),
+        'resumed_chunks': resume_from.get('chunks', 0),
+        'revision': None,
+        'table': shard,
+    }
+
+    with begin(engine) as conn:
+        ensure_table(conn, table_name, site)
+
+    for chunk in _rechunk(_iter_frames(data), chunksize, skip_rows=summary['rows']):
+        with begin(engine) as conn:
+            create_stage_table(conn, stage_table, site)
+            start = time.perf_counter()
+            copy_frame(conn, chunk, stage_table)
+            _record(timings, 'load', start)
+
+            # Gắn revision mới cho các dòng thêm vào (dashboard refresh delta)
+            start = time.perf_counter()
+            lock_shard(conn, shard)
+            revision = next_revision(conn, shard)
+            result = conn.execute(text(f"""
+                INSERT INTO {shard} (site, item_code, avg_consume, revision)
+                SELECT site, item_code, avg_consume, :rev FROM {stage_table} WHERE true
+                ON CONFLICT (site, item_code) DO NOTHING
+            """), {'rev': revision})
+            stage_changes(conn, shard, f"""
+                SELECT item_code, avg_consume, NULL FROM {shard} WHERE revision = :rev
+            """, {'rev': revision})
+            record_history(conn, shard, revision, ensure=False)
+            if not is_postgres(conn):
+                conn.execute(text(f"DROP TABLE {stage_table}"))
+            _record(timings, 'merge', start)
+
+            summary['rows'] += len(chunk)
+            summary['inserted'] += result.rowcount
+            summary['skipped'] += len(chunk) - result.rowcount
+            summary['chunks'] += 1
+            summary['revision'] = revision
+            if after_chunk is not None:
+                after_chunk(conn, summary)
+    return summary
+
+
+def _merge_stage(conn, stage_table, table_name, total):
+    """
+    Merge bảng stage vào shard (table_name): chỉ INSERT item mới / UPDATE item thay đổi
+
+    Returns:
+        dict: rows, inserted, updated, unchanged, revision, table
+    """
+    # Diff với bảng hiện tại trước khi merge (các dòng thay đổi cũng là dòng ghi vào history)
+    lock_shard(conn, table_name)
+    revision = next_revision(conn, table_name)
+    inserted, updated = stage_changes(conn, table_name, f"""
+        SELECT s.item_code, s.avg_consume, t.avg_consume FROM {stage_table} s
+        LEFT JOIN {table_name} t ON t.site = s.site AND t.item_code = s.item_code
+        WHERE t.item_code IS NULL OR t.avg_consume {_distinct(conn)} s.avg_consume
+    """)
+    record_history(conn, table_name, revision, ensure=False)
+
+    # WHERE true: SQLite cần để phân biệt ON CONFLICT với JOIN ... ON
+    conn.execute(text(f"""
+        INSERT INTO {table_name} (site, item_code, avg_consume, revision)
+        SELECT site, item_code, avg_consume, :rev FROM {stage_table} WHERE true
+        ON CONFLICT (site, item_code)
+        DO UPDATE SET avg_consume = EXCLUDED.avg_consume, revision = EXCLUDED.revision
+        WHERE {table_name}.avg_consume {_distinct(conn)} EXCLUDED.avg_consume
+    """), {'rev': revision})
+
+    return {
+        'rows': total,
+        'inserted': int(inserted),
+        'updated': int(updated),
+        'unchanged': total - int(inserted) - int(updated),
+        'revision': revision,
+        'table': table_name,
+    }
+
+
+def bulk_upsert(engine, data, table_name='ro_items', before_commit=None, timings=None,
+                writers=1, site=None):
+    """
+    Upsert data vào bảng chính: COPY vào bảng TEMP rồi merge (1 transaction)
+    - Chỉ ghi item mới hoặc item có avg_consume thay đổi
+    - Item không đổi bị bỏ qua (không UPDATE no-op, không sinh WAL)
+    - Dòng được ghi được gắn revision mới (để dashboard refresh delta)
+
+    Args:
+        engine: SQLAlchemy engine
+        data: DataFrame hoặc iterable các chunk DataFrame (vd: iter_clean_chunks)
+        table_name: Tên bảng trong database
+        before_commit: Hàm (conn, summary) gọi trước khi commit (vd: ghi manifest)
+        timings: Dict nhận thời gian từng stage ('load': COPY vào bảng TEMP, 'merge')
+        writers: Số connection COPY song song (> 1: COPY vào bảng stage dùng chung,
+            mỗi writer 1 connection; merge vẫn trong 1 transaction)
+        site: Site của data (mặc định DEFAULT_SITE)
+
+    Returns:
+        dict: rows (số dòng input), inserted, updated, unchanged, revision, table (tên shard)
+    """
+    site = normalize_site(site or DEFAULT_SITE)
+    if writers > 1 and not hasattr(data, 'columns'):
+        return _bulk_upsert_parallel(engine, data, table_name, before_commit, timings, writers, site)
+
+    stage_table = f"{shard_table(table_name, site)}_stage"
+    with begin(engine) as conn:
+        shard = ensure_table(conn, table_name, site)
+    if hasattr(data, 'columns'):
+        # item_code trùng: giữ dòng đầu (như replace_table); ON CONFLICT không cho update 1 dòng 2 lần
+        data = data.drop_duplicates(subset=['item_code'], keep='first')
+    total = 0
+    with begin(engine) as conn:
+        create_stage_table(conn, stage_table, site)
+
+        for chunk in _iter_frames(data):
+            start = time.perf_counter()
+            copy_frame(conn, chunk, stage_table)
+            _record(timings, 'load', start)
+            total += len(chunk)
+
+        start = time.perf_counter()
+        summary = _merge_stage(conn, stage_table, shard, total)
+        if not is_postgres(conn):
+            conn.execute(text(f"DROP TABLE {stage_table}"))
+        _record(timings, 'merge', start)
+
+        if before_commit is not None:
+            before_commit(conn, summary)
+    return summary
+
+
+def _bulk_upsert_parallel(engine, chunks, table_name, before_commit, timings, writers, site):
+    """bulk_upsert với nhiều writer: bảng TEMP chỉ thấy trong 1 session nên dùng bảng stage thường"""
+    shard = shard_table(table_name, site)
+    stage_table = f"{shard}_stage_{uuid.uuid4().hex[:8]}"
+    with begin(engine) as conn:
+        ensure_table(conn, table_name, site)
+        unlogged = "UNLOGGED " if is_postgres(conn) else ""
+        conn.execute(text(f"""
+            CREATE {unlogged}TABLE {stage_table} (
+                site TEXT NOT NULL DEFAULT '{site}',
+                item_code TEXT,
+                avg_consume NUMERIC
+            )
+        """))
+
+    def write(chunk):
+        start = time.perf_counter()
+        with begin(engine) as conn:
+            copy_frame(conn, chunk, stage_table)
+        return len(chunk), time.perf_counter() - start
+
+    try:
+        results = run_pipeline(chunks, write, writers=writers)
+        if timings is not None:
+            # Tổng thời gian COPY của các writer (có thể lớn hơn thời gian thực)
+            timings['load'] = timings.get('load', 0.0) + sum(s for _, s in results)
+
+        with begin(engine) as conn:
+            start = time.perf_counter()
+            summary = _merge_stage(conn, stage_table, shard, sum(n for n, _ in results))
+            conn.execute(text(f"DROP TABLE {stage_table}"))
+            _record(timings, 'merge', start)
+            if before_commit is not None:
+                before_commit(conn, summary)
+    finally:
+        with begin(engine) as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {stage_table}"))
+    return summary
@@ -0,0 +1,200 @@
+"""
+Engine database dùng chung cho app và các script (1 engine / process)
+- Connection pool cấu hình qua .env: size, pre-ping, recycle, statement timeout, connect timeout
+- run_locked: transaction DDL ngắn có lock_timeout + thử lại
+- Đo thời gian mở connection mới, lấy connection từ pool và chạy query
+  (ghi cả vào metrics.REGISTRY: span db_connect, db_acquire, db_query)
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+import metrics
+
+# Cấu hình pool (có thể override trong .env)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Giới hạn thời gian mỗi câu SQL (ms), 0 = không giới hạn
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+# Thời gian chờ mở connection tới Postgres (giây), 0 = không giới hạn
+CONNECT_TIMEOUT_S = int(os.getenv("CONNECT_TIMEOUT_S", "10"))
+# Thời gian chờ lock của transaction cần lock exclusive (swap Replace mode, ATTACH), ms
+# Hết giờ -> rollback, chờ rồi thử lại tối đa DB_LOCK_RETRIES lần
+LOCK_TIMEOUT_MS = int(os.getenv("DB_LOCK_TIMEOUT_MS", "2000"))
+LOCK_RETRIES = int(os.getenv("DB_LOCK_RETRIES", "5"))
+# lock_timeout của DETACH ... CONCURRENTLY, ms: phải < deadlock_timeout / 2 của PostgreSQL (mặc định 1s)
+# DETACH giữ lock shard trong lúc chờ snapshot cũ -> người đọc đã lấy snapshot và đang chờ lock shard
+# tạo thành vòng chờ; DETACH hết giờ (rồi thử lại bằng FINALIZE) trước khi người đọc bị hủy vì deadlock
+DETACH_LOCK_TIMEOUT_MS = int(os.getenv("DB_DETACH_LOCK_TIMEOUT_MS", "400"))
+
+# lock_not_available (hết lock_timeout), deadlock_detected
+_LOCK_ERRORS = ('55P03', '40P01')
+
+_engines = {}
+_lock = threading.Lock()
+
+
+class Timing:
+    """Thống kê thời gian: số lần, tổng, max"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        with self._lock:
+            avg = self.total / self.count if self.count else 0.0
+            return {'count': self.count, 'total_ms': self.total * 1e3,
+                    'avg_ms': avg * 1e3, 'max_ms': self.max * 1e3}
+
+
+# connect: mở connection vật lý mới (TLS handshake, auth)
+# acquire: lấy connection từ pool (gồm cả connect nếu pool hết connection)
+# query: thời gian chạy câu SQL
+STATS = {'connect': Timing(), 'acquire': Timing(), 'query': Timing()}
+
+_local = threading.local()
+
+
+def _add(name, seconds):
+    STATS[name].add(seconds)
+    metrics.observe(f"db_{name}", seconds)
+
+
+def _install_timers(engine):
+    @event.listens_for(engine, "do_connect")
+    def _before_connect(dialect, conn_rec, cargs, cparams):
+        _local.connect_start = time.perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def _after_connect(dbapi_connection, connection_record):
+        start = getattr(_local, 'connect_start', None)
+        if start is not None:
+            _add('connect', time.perf_counter() - start)
+            _local.connect_start = None
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        _add('query', time.perf_counter() - conn.info['query_start'].pop())
+
+
+def get_engine(url=None, statement_timeout_ms=None):
+    """
+    Lấy engine dùng chung của process (tạo lần đầu, các lần sau dùng lại)
+
+    Args:
+        url: Connection string (mặc định DATABASE_URL trong .env)
+        statement_timeout_ms: Override STATEMENT_TIMEOUT_MS (0 = không giới hạn)
+    """
+    url = url or os.getenv("DATABASE_URL")
+    if statement_timeout_ms is None:
+        statement_timeout_ms = STATEMENT_TIMEOUT_MS
+    key = (url, statement_timeout_ms)
+
+    with _lock:
+        engine = _engines.get(key)
+        if engine is None:
+            kwargs = {'pool_pre_ping': True}
+            if not url.startswith('sqlite'):
+                kwargs.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW,
+                              pool_timeout=POOL_TIMEOUT, pool_recycle=POOL_RECYCLE)
+            if url.startswith('postgresql'):
+                connect_args = {}
+                if CONNECT_TIMEOUT_S:
+                    connect_args['connect_timeout'] = CONNECT_TIMEOUT_S
+                if statement_timeout_ms:
+                    connect_args['options'] = f'-c statement_timeout={statement_timeout_ms}'
+                kwargs['connect_args'] = connect_args
+            engine = create_engine(url, **kwargs)
+            _install_timers(engine)
+            _engines[key] = engine
+    return engine
+
+
+@contextmanager
+def connect(engine):
+    """engine.connect() có đo thời gian lấy connection từ pool"""
+    start = time.perf_counter()
+    conn = engine.connect()
+    _add('acquire', time.perf_counter() - start)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def begin(engine):
+    """engine.begin() có đo thời gian lấy connection từ pool"""
+    with connect(engine) as conn:
+        with conn.begin():
+            yield conn
+
+
+def run_locked(engine, fn, timeout_ms=None, retries=None, autocommit=False):
+    """
+    Chạy fn(conn) trong 1 transaction có lock_timeout (PostgreSQL), hết giờ chờ lock -> thử lại
+    - Transaction DDL không xếp hàng chờ lâu sau query dài, query mới của người đọc
+      không bị chặn sau nó quá timeout_ms
+    - Deadlock (PostgreSQL hủy 1 transaction) cũng được thử lại
+    - autocommit=True: cho lệnh không chạy được trong transaction (vd: DETACH ... CONCURRENTLY)
+
+    Returns:
+        Kết quả của fn
+    """
+    timeout_ms = LOCK_TIMEOUT_MS if timeout_ms is None else timeout_ms
+    retries = LOCK_RETRIES if retries is None else retries
+    postgres = engine.dialect.name == 'postgresql' and timeout_ms
+    for attempt in range(retries + 1):
+        try:
+            if autocommit:
+                with connect(engine) as conn:
+                    conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+                    if postgres:
+                        conn.execute(text(f"SET lock_timeout = {int(timeout_ms)}"))
+                    try:
+                        return fn(conn)
+                    finally:
+                        if postgres:
+                            conn.execute(text("RESET lock_timeout"))
+            with begin(engine) as conn:
+                if postgres:
+                    conn.execute(text(f"SET LOCAL lock_timeout = {int(timeout_ms)}"))
+                return fn(conn)
+        except OperationalError as e:
+            if getattr(e.orig, 'pgcode', None) not in _LOCK_ERRORS or attempt == retries:
+                raise
+            metrics.REGISTRY.inc('db_lock_retries')
+            time.sleep(min(0.2 * 2 ** attempt, 5.0))
+
+
+def get_stats():
+    """Thống kê connect / acquire / query của process hiện tại"""
+    return {name: timing.as_dict() for name, timing in STATS.items()}
+
+
+def format_stats():
+    """Thống kê dạng 1 dòng để in ra console"""
+    parts = []
+    for name, s in get_stats().items():
+        parts.append(f"{name}: {s['count']}x avg {s['avg_ms']:.1f}ms max {s['max_ms']:.1f}ms")
+    return "DB " + " | ".join(parts)
@@ -0,0 +1,123 @@
+"""
+Logic quyết định RO/DO (YES/NO) dùng chung cho app và các script
+- ItemTable (item_table.py) build một lần khi load data: item_code -> (avg_consume, threshold, moq)
+- Mỗi lần "Check Decision" chỉ là một lần binary search trên ItemTable, không scan DataFrame
+- Batch mode: tính YES/NO cho cả pick list bằng một phép tính vector
+- Ngưỡng / moq của từng item theo rule của site (rules.py), tính sẵn khi load data
+"""
+
+import numpy as np
+import pandas as pd
+
+from item_table import ItemTable
+from rules import order_ok
+
+
+def lookup_item(index, item_code):
+    """
+    Tra cứu item trong ItemTable
+
+    Returns:
+        (avg_consume, threshold, moq) hoặc None nếu không tìm thấy
+    """
+    return index.get(str(item_code))
+
+
+def find_pick_list_columns(columns):
+    """
+    Tìm cột Item Code, Pick to Light Stock, Requested Quantity trong pick list
+
+    Returns:
+        (item_col, stock_col, qty_col) - None nếu không tìm thấy
+    """
+    item_col = stock_col = qty_col = None
+    for col in columns:
+        col_lower = str(col).lower().strip()
+        if item_col is None and 'item' in col_lower and 'code' in col_lower:
+            item_col = col
+        elif stock_col is None and 'stock' in col_lower:
+            stock_col = col
+        elif qty_col is None and (col_lower == 'ro' or 'request' in col_lower
+                                  or 'qty' in col_lower or 'quantity' in col_lower):
+            qty_col = col
+    if item_col is None:
+        for col in columns:
+            col_lower = str(col).lower().strip()
+            if 'item' in col_lower or 'code' in col_lower:
+                item_col = col
+                break
+    # File không có header rõ ràng -> lấy theo thứ tự 3 cột đầu
+    if (item_col is None or stock_col is None or qty_col is None) and len(columns) == 3:
+        item_col, stock_col, qty_col = columns
+    return item_col, stock_col, qty_col
+
+
+def read_pick_list(source, name=None):
+    """
+    Đọc pick list từ file CSV hoặc Excel
+
+    Args:
+        source: Đường dẫn file hoặc file object (vd: file upload của Streamlit)
+        name: Tên file để nhận dạng định dạng (mặc định lấy từ source)
+
+    Returns:
+        DataFrame với cột 'Item_Code', 'Stock', 'Requested_Qty'
+    """
+    name = name or getattr(source, 'name', None) or str(source)
+    if name.lower().endswith('.csv'):
+        raw = pd.read_csv(source, dtype=str)
+    else:
+        raw = pd.read_excel(source, dtype=str)
+
+    item_col, stock_col, qty_col = find_pick_list_columns(list(raw.columns))
+    if item_col is None or stock_col is None or qty_col is None:
+        raise ValueError(
+            f"Không tìm thấy cột cần thiết! Item Code: {item_col}, "
+            f"Stock: {stock_col}, Requested Qty: {qty_col}"
+        )
+
+    return pd.DataFrame({
+        'Item_Code': raw[item_col].astype(str).str.strip(),
+        'Stock': pd.to_numeric(raw[stock_col], errors='coerce'),
+        'Requested_Qty': pd.to_numeric(raw[qty_col], errors='coerce'),
+    })
+
+
+def evaluate_batch(pick_df, items):
+    """
+    Tính YES/NO cho toàn bộ pick list trong một phép tính vector
+
+    Args:
+        pick_df: DataFrame từ read_pick_list()
+        items: ItemTable từ load_database(), hoặc DataFrame ('Item_Code', 'Avg_Consume' - rule mặc định)
+
+    Returns:
+        DataFrame kết quả với cột 'Avg_Consume', 'Threshold', 'Min_Order_Qty', 'Decision'
+        Decision = YES / NO / UNKNOWN (item không có trong database)
+                   / INVALID (stock hoặc qty không phải số)
+    """
+    if isinstance(items, pd.DataFrame):
+        items = ItemTable.from_frame(items)
+    # Join pick list với ro_items bằng hash index (vị trí -1 = không tìm thấy)
+    positions = items.positions(pick_df['Item_Code'].astype(str))
+    unknown = positions < 0
+    if len(items):
+        avg, threshold = np.abs(items.avg[positions]), items.threshold[positions]
+        moq = items.moq[positions]
+    else:
+        avg, threshold, moq = (np.full(len(positions), np.nan) for _ in range(3))
+    avg[unknown] = threshold[unknown] = moq[unknown] = np.nan
+
+    stock = pick_df['Stock'].to_numpy(dtype=float)
+    qty = pick_df['Requested_Qty'].to_numpy(dtype=float)
+    invalid = np.isnan(stock) | np.isnan(qty)
+    decision = np.where(order_ok(stock, qty, threshold, moq), 'YES', 'NO')
+    decision = np.where(invalid, 'INVALID', decision)
+    decision = np.where(unknown, 'UNKNOWN', decision)
+
+    result = pick_df.copy()
+    result['Avg_Consume'] = avg
+    result['Threshold'] = threshold
+    result['Min_Order_Qty'] = moq
+    result['Decision'] = decision
+    return result
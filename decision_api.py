@@ -0,0 +1,365 @@
+"""
+HTTP API quyết định YES/NO cho thiết bị pick-to-light / máy scan (không qua Streamlit)
+- stdlib http.server (ThreadingHTTPServer, keep-alive HTTP/1.1), không cần thư viện ngoài
+- Khởi động: load ItemStore của các site vào memory (snapshot local nếu có, rồi kiểm tra database)
+- Mỗi request chỉ tra ItemTable trong memory, không truy cập database
+  (1 item: binary search; batch lớn: hash join của Arrow, YES/NO tính bằng 1 phép tính vector)
+- Refresh không downtime: StoreRefresher (NOTIFY + theo chu kỳ) build bảng mới rồi swap reference,
+  request đang chạy vẫn đọc bảng cũ đầy đủ
+
+Endpoints (JSON):
+  GET  /decision?item_code=..&stock=..&qty=..[&site=..]
+  POST /decision   {"site": .., "item_code": .., "stock": .., "qty": ..}
+                   hoặc {"site": .., "items": [{"item_code": .., "stock": .., "qty": ..}, ...]}
+  GET  /health     trạng thái store của từng site (revision, số item, nguồn data)
+  GET  /metrics    Prometheus text format
+
+Chạy: python decision_api.py [--host H] [--port P] [--site SITE ...] [--audit]
+"""
+
+import argparse
+import json
+import math
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+from dotenv import load_dotenv
+
+import metrics
+from db import begin, get_engine
+from decision import lookup_item
+from decision_log import DecisionLog
+from item_store import SNAPSHOT_DIR, ItemStore
+from refresher import StoreRefresher
+from rules import order_ok
+from sites import DEFAULT_SITE, ensure_parent, list_sites, normalize_site, shard_table
+
+# Địa chỉ lắng nghe (có thể override trong .env)
+DECISION_API_HOST = os.getenv("DECISION_API_HOST", "0.0.0.0")
+DECISION_API_PORT = int(os.getenv("DECISION_API_PORT", "8600"))
+# Số dòng tối đa của 1 request batch
+DECISION_API_MAX_BATCH = int(os.getenv("DECISION_API_MAX_BATCH", "10000"))
+# Kích thước tối đa body của POST (byte), lớn hơn -> 413 (không đọc body)
+API_MAX_BODY = int(os.getenv("API_MAX_BODY", str(4 * 2**20)))
+# Snapshot riêng của API (không ghi chung file với dashboard)
+DECISION_API_SNAPSHOT_DIR = os.getenv("DECISION_API_SNAPSHOT_DIR", os.path.join(SNAPSHOT_DIR, "api"))
+# Batch nhỏ hơn ngưỡng này: tra từng item (binary search) thay vì build hash của cả catalog
+HASH_JOIN_MIN_BATCH = 256
+
+
+class RequestError(Exception):
+    """Request sai (trả về HTTP status kèm message)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _number(value):
+    # Số hợp lệ (>= 0) hoặc NaN
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return number if number >= 0 else math.nan
+
+
+def _site(site):
+    # Site dạng chuẩn, site sai -> 400 (không để ValueError thành 500)
+    try:
+        return normalize_site(site or DEFAULT_SITE)
+    except ValueError as e:
+        raise RequestError(str(e))
+
+
+def _clean(value):
+    # NaN -> null trong JSON
+    return None if value is None or math.isnan(value) else value
+
+
+class DecisionService:
+    """
+    ItemStore của các site + tính YES/NO (1 instance / process, dùng chung mọi thread)
+
+    Args:
+        engine: SQLAlchemy Engine (None = chỉ dùng store có sẵn, không refresh - vd: benchmark)
+        stores: Dict site -> ItemStore đã load (mặc định: load bằng open())
+        audit: DecisionLog ghi lại từng decision (None = không ghi)
+    """
+
+    def __init__(self, engine=None, stores=None, audit=None):
+        self.engine = engine
+        self.stores = dict(stores or {})
+        self.audit = audit
+        self.refresher = None
+        self.started_at = time.time()
+
+    def open(self, sites=None, table_name='ro_items'):
+        """
+        Load store của các site (mặc định mọi site đã có data lúc khởi động) rồi bật auto refresh
+        Site ingest lần đầu sau khi API đã chạy: cần khởi động lại API
+        """
+        with begin(self.engine) as conn:
+            # Database trước khi có multi-site -> chuyển ro_items cũ thành shard của DEFAULT_SITE
+            ensure_parent(conn, table_name)
+            sites = sites or list_sites(conn, table_name) or [DEFAULT_SITE]
+        for site in sites:
+            site = normalize_site(site)
+            store = ItemStore(shard_table(table_name, site), DECISION_API_SNAPSHOT_DIR, site=site)
+            store.open(self.engine)
+            self.stores[site] = store
+        self.refresher = StoreRefresher(self.engine, self.stores.values())
+
+    def table(self, site=None):
+        """ItemTable hiện tại của site (đọc reference 1 lần / request -> không thấy bảng đang swap)"""
+        site = _site(site)
+        store = self.stores.get(site)
+        if store is None or store.table is None:
+            raise RequestError(f"Site '{site}' chưa được load", status=404)
+        return store.table
+
+    def decide(self, item_code, stock, qty, site=None, client=None):
+        """
+        YES/NO cho 1 item
+
+        Returns:
+            dict: item_code, decision (YES / NO / UNKNOWN), avg_consume, threshold, moq
+        """
+        site = _site(site)
+        stock, qty = _number(stock), _number(qty)
+        if math.isnan(stock) or math.isnan(qty):
+            raise RequestError("stock và qty phải là số >= 0")
+        item_code = str(item_code or '').strip()
+        if not item_code:
+            raise RequestError("Thiếu item_code")
+        entry = lookup_item(self.table(site), item_code)
+        if entry is None:
+            metrics.REGISTRY.inc('api_decisions', result='UNKNOWN')
+            return {'item_code': item_code, 'decision': 'UNKNOWN', 'avg_consume': None, 'threshold': None,
+                    'moq': None}
+        avg_consume, threshold, moq = entry
+        result = 'YES' if order_ok(stock, qty, threshold, moq) else 'NO'
+        metrics.REGISTRY.inc('api_decisions', result=result)
+        if self.audit is not None:
+            self.audit.record(item_code, stock, qty, avg_consume, threshold, result,
+                              session_id=client, site=site)
+        return {'item_code': item_code, 'decision': result, 'avg_consume': avg_consume,
+                'threshold': threshold, 'moq': moq}
+
+    def decide_batch(self, items, site=None, client=None):
+        """
+        YES/NO cho cả danh sách (1 phép tính vector)
+
+        Args:
+            items: List dict {'item_code', 'stock', 'qty'}
+
+        Returns:
+            dict: results (list như decide(), thêm INVALID), counts theo decision
+        """
+        site = _site(site)
+        if not isinstance(items, list):
+            raise RequestError("items phải là list")
+        if len(items) > DECISION_API_MAX_BATCH:
+            raise RequestError(f"Tối đa {DECISION_API_MAX_BATCH} dòng mỗi request", status=413)
+        table = self.table(site)
+        try:
+            codes = [str(item.get('item_code') or '').strip() for item in items]
+            stock = np.array([_number(item.get('stock')) for item in items], dtype=float)
+            qty = np.array([_number(item.get('qty')) for item in items], dtype=float)
+        except AttributeError:
+            raise RequestError("Mỗi dòng của items phải là object")
+
+        if len(codes) >= HASH_JOIN_MIN_BATCH:
+            positions = table.positions(codes)
+        else:
+            positions = np.array([table.find(code) for code in codes], dtype=np.int64)
+        unknown = positions < 0
+        if len(table):
+            avg, threshold = np.abs(table.avg[positions]), table.threshold[positions]
+            moq = table.moq[positions]
+        else:
+            avg, threshold, moq = (np.full(len(codes), np.nan) for _ in range(3))
+        avg[unknown] = threshold[unknown] = moq[unknown] = np.nan
+        decision = np.where(order_ok(stock, qty, threshold, moq), 'YES', 'NO')
+        decision = np.where(np.isnan(stock) | np.isnan(qty), 'INVALID', decision)
+        decision = np.where(unknown, 'UNKNOWN', decision)
+
+        labels, counts = np.unique(decision, return_counts=True)
+        counts = {str(label): int(n) for label, n in zip(labels, counts)}
+        for label, n in counts.items():
+            metrics.REGISTRY.inc('api_decisions', n, result=label)
+        if self.audit is not None:
+            for i in np.flatnonzero((decision == 'YES') | (decision == 'NO')):
+                self.audit.record(codes[i], float(stock[i]), float(qty[i]), float(avg[i]),
+                                  float(threshold[i]), str(decision[i]),
+                                  session_id=client, site=site)
+        results = [
+            {'item_code': code, 'decision': str(d), 'avg_consume': _clean(a), 'threshold': _clean(t),
+             'moq': _clean(m)}
+            for code, d, a, t, m in zip(codes, decision, avg.tolist(), threshold.tolist(), moq.tolist())
+        ]
+        return {'results': results, 'counts': counts}
+
+    def health(self):
+        sites = {}
+        for site, store in self.stores.items():
+            sites[site] = {
+                'items': len(store.table) if store.table is not None else 0,
+                'revision': store.revision,
+                'source': store.source,
+                'last_error': store.last_error,
+            }
+        ok = all(s['items'] for s in sites.values()) and bool(sites)
+        return {
+            'status': 'ok' if ok else 'degraded',
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'listening': bool(self.refresher and self.refresher.listening),
+            'sites': sites,
+        }
+
+
+class DecisionHandler(BaseHTTPRequestHandler):
+    """Handler HTTP/1.1 keep-alive (server.service = DecisionService)"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ROSDecisionAPI/1.0'
+    # Header và body là 2 lần write: không tắt Nagle -> chờ delayed ACK (~40ms) mỗi request
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass  # Không ghi log từng request (tốn hơn cả việc tính decision), xem /metrics
+
+    def _send(self, status, body, content_type='application/json'):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, endpoint, handler):
+        start = time.perf_counter()
+        status = 200
+        try:
+            body = handler()
+        except RequestError as e:
+            status, body = e.status, {'error': str(e)}
+        except Exception as e:
+            status, body = 500, {'error': str(e)}
+            metrics.REGISTRY.inc('api_errors', endpoint=endpoint)
+        if isinstance(body, str):
+            self._send(status, body.encode('utf-8'), 'text/plain; version=0.0.4')
+        else:
+            self._send(status, body)
+        metrics.REGISTRY.observe('api_request', time.perf_counter() - start, endpoint=endpoint)
+
+    def _client(self):
+        return f"api:{self.client_address[0]}"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        service = self.server.service
+        if url.path == '/decision':
+            query = dict(parse_qsl(url.query))
+            self._handle('decision', lambda: service.decide(
+                query.get('item_code'), query.get('stock'), query.get('qty'),
+                site=query.get('site'), client=self._client(),
+            ))
+        elif url.path == '/health':
+            self._handle('health', service.health)
+        elif url.path == '/metrics':
+            self._handle('metrics', metrics.REGISTRY.to_prometheus)
+        else:
+            self._send(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if not 0 <= length <= API_MAX_BODY:
+            # Body không được đọc -> đóng connection (phần còn lại của body không phải request kế tiếp)
+            self.close_connection = True
+            if length < 0:
+                self._send(400, {'error': "Content-Length không hợp lệ"})
+            else:
+                self._send(413, {'error': f"Body tối đa {API_MAX_BODY} byte"})
+            return
+        raw = self.rfile.read(length) if length else b''
+        if url.path != '/decision':
+            self._send(404, {'error': 'Not found'})
+            return
+        self._handle('decision', lambda: self._post_decision(raw))
+
+    def _post_decision(self, raw):
+        try:
+            payload = json.loads(raw or b'{}')
+        except ValueError:
+            raise RequestError("Body không phải JSON")
+        if not isinstance(payload, dict):
+            raise RequestError("Body phải là JSON object")
+        service = self.server.service
+        site = payload.get('site')
+        if 'items' in payload:
+            return service.decide_batch(payload['items'], site=site, client=self._client())
+        return service.decide(payload.get('item_code'), payload.get('stock'), payload.get('qty'),
+                              site=site, client=self._client())
+
+
+def make_server(service, host=DECISION_API_HOST, port=DECISION_API_PORT):
+    """ThreadingHTTPServer gắn với service (port=0: chọn port trống)"""
+    server = ThreadingHTTPServer((host, port), DecisionHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    DATABASE_URL = os.getenv("DATABASE_URL")
+    if not DATABASE_URL:
+        print("❌ DATABASE_URL not found in .env file!")
+        exit(1)
+
+    parser = argparse.ArgumentParser(description="HTTP API quyết định YES/NO")
+    parser.add_argument("--host", default=DECISION_API_HOST)
+    parser.add_argument("--port", type=int, default=DECISION_API_PORT)
+    parser.add_argument("--site", action="append", help="Site cần load (mặc định: mọi site)")
+    parser.add_argument("--audit", action="store_true", help="Ghi từng decision vào decision_log")
+    args = parser.parse_args()
+
+    try:
+        engine = get_engine(DATABASE_URL)
+        service = DecisionService(engine, audit=DecisionLog(engine) if args.audit else None)
+        start = time.perf_counter()
+        service.open(args.site)
+        for site, store in service.stores.items():
+            print(f"✓ Site {site}: {len(store.table)} items (revision {store.revision}, {store.source})")
+        print(f"✓ Load xong trong {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"❌ Lỗi: {str(e)}")
+        exit(1)
+
+    server = make_server(service, args.host, args.port)
+    # SIGTERM: dừng nhận request (shutdown phải gọi từ thread khác serve_forever)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"🚀 Decision API: http://{args.host}:{args.port}/decision")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.refresher.stop()
+        if service.audit is not None:
+            service.audit.close()
+        print("👋 Dừng API")
@@ -0,0 +1,184 @@
+"""
+Audit log các quyết định YES/NO (bảng decision_log), ghi kiểu write-behind
+- record(): chỉ thêm vào buffer trong process (không chờ database -> không tăng độ trễ click)
+- Thread nền ghi buffer theo batch: đủ DECISION_LOG_BATCH dòng hoặc sau DECISION_LOG_FLUSH_SECONDS
+- Database lỗi: giữ lại dòng chưa ghi và thử lại sau, buffer có giới hạn
+  (DECISION_LOG_MAX_BUFFER dòng, đầy thì bỏ dòng cũ nhất và đếm số dòng bị bỏ)
+- Process kết thúc (atexit) / close(): ghi nốt phần còn lại trong buffer
+"""
+
+import atexit
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, text
+
+import metrics
+from db import begin
+from sites import DEFAULT_SITE
+
+DECISION_LOG_TABLE = 'decision_log'
+
+# Số dòng mỗi lần ghi (có thể override trong .env)
+DECISION_LOG_BATCH = int(os.getenv("DECISION_LOG_BATCH", "100"))
+# Thời gian tối đa (giây) một dòng nằm trong buffer trước khi được ghi
+DECISION_LOG_FLUSH_SECONDS = float(os.getenv("DECISION_LOG_FLUSH_SECONDS", "5"))
+# Số dòng tối đa giữ trong memory khi database không ghi được
+DECISION_LOG_MAX_BUFFER = int(os.getenv("DECISION_LOG_MAX_BUFFER", "100000"))
+
+COLUMNS = ['logged_at', 'session_id', 'site', 'item_code', 'stock', 'requested_qty',
+           'avg_consume', 'threshold', 'result']
+
+
+def ensure_decision_log(conn):
+    """Tạo bảng decision_log nếu chưa có"""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {DECISION_LOG_TABLE} (
+            logged_at TIMESTAMP NOT NULL,
+            session_id TEXT,
+            site TEXT,
+            item_code TEXT NOT NULL,
+            stock DOUBLE PRECISION,
+            requested_qty DOUBLE PRECISION,
+            avg_consume DOUBLE PRECISION,
+            threshold DOUBLE PRECISION,
+            result TEXT NOT NULL
+        )
+    """))
+    # Bảng tạo trước khi có nhiều site: decision cũ thuộc DEFAULT_SITE
+    if 'site' not in [c['name'] for c in inspect(conn).get_columns(DECISION_LOG_TABLE)]:
+        conn.execute(text(f"ALTER TABLE {DECISION_LOG_TABLE} ADD COLUMN site TEXT"))
+        conn.execute(text(f"UPDATE {DECISION_LOG_TABLE} SET site = :site"), {'site': DEFAULT_SITE})
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {DECISION_LOG_TABLE}_logged_at_idx "
+        f"ON {DECISION_LOG_TABLE} (logged_at)"
+    ))
+
+
+class DecisionLog:
+    """
+    Buffer + thread nền ghi decision vào database
+
+    Args:
+        engine: SQLAlchemy Engine
+        batch_size: Ghi ngay khi buffer có đủ số dòng này
+        flush_seconds: Ghi sau tối đa số giây này kể cả khi chưa đủ batch
+        max_buffer: Số dòng tối đa trong buffer
+    """
+
+    def __init__(self, engine, batch_size=DECISION_LOG_BATCH,
+                 flush_seconds=DECISION_LOG_FLUSH_SECONDS, max_buffer=DECISION_LOG_MAX_BUFFER):
+        self.engine = engine
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.buffer = deque(maxlen=max(1, max_buffer))
+        self.dropped = 0
+        self.written = 0
+        self.last_error = None
+        self._table_ready = False
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._failing = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, item_code, stock, requested_qty, avg_consume, threshold, result, session_id=None,
+               site=DEFAULT_SITE):
+        """Thêm 1 decision vào buffer (không truy cập database)"""
+        row = {
+            'logged_at': datetime.now(timezone.utc).replace(tzinfo=None),
+            'session_id': session_id,
+            'site': site,
+            'item_code': str(item_code),
+            'stock': stock,
+            'requested_qty': requested_qty,
+            'avg_consume': avg_consume,
+            'threshold': threshold,
+            'result': result,
+        }
+        with self._cond:
+            self._append([row])
+            # Database đang lỗi: không đánh thức thread (chờ hết thời gian backoff)
+            if len(self.buffer) >= self.batch_size and not self._failing:
+                self._cond.notify()
+
+    def _append(self, rows):
+        # Gọi khi đang giữ self._cond: buffer đầy -> deque tự bỏ dòng cũ nhất
+        overflow = len(self.buffer) + len(rows) - self.buffer.maxlen
+        if overflow > 0:
+            self.dropped += overflow
+            metrics.REGISTRY.inc('decision_log_dropped', overflow)
+        self.buffer.extend(rows)
+
+    def _take(self):
+        with self._cond:
+            rows = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+        return rows
+
+    def flush(self):
+        """
+        Ghi toàn bộ buffer vào database (theo batch)
+
+        Returns:
+            True nếu ghi hết, False nếu database lỗi (dòng chưa ghi được trả lại buffer)
+        """
+        with self._flush_lock:
+            while True:
+                rows = self._take()
+                if not rows:
+                    return True
+                try:
+                    with metrics.span('decision_log_flush', rows=len(rows)):
+                        with begin(self.engine) as conn:
+                            if not self._table_ready:
+                                ensure_decision_log(conn)
+                            conn.execute(text(f"""
+                                INSERT INTO {DECISION_LOG_TABLE} ({', '.join(COLUMNS)})
+                                VALUES ({', '.join(':' + c for c in COLUMNS)})
+                            """), rows)
+                    self._table_ready = True
+                    self.written += len(rows)
+                except Exception as e:
+                    self.last_error = str(e)
+                    metrics.REGISTRY.inc('decision_log_errors')
+                    # Trả lại đầu buffer (giữ thứ tự), buffer đầy -> bỏ dòng cũ nhất
+                    with self._cond:
+                        pending = rows + list(self.buffer)
+                        self.buffer.clear()
+                        self._append(pending)
+                    return False
+                self.last_error = None
+
+    def _run(self):
+        wait = self.flush_seconds
+        while True:
+            with self._cond:
+                if not self._closed and (self._failing or len(self.buffer) < self.batch_size):
+                    self._cond.wait(wait)
+                if self._closed:
+                    return
+            self._failing = not self.flush()
+            # Database lỗi: chờ lâu dần (tối đa 60s) thay vì thử lại liên tục
+            wait = min(wait * 2, 60.0) if self._failing else self.flush_seconds
+
+    def close(self, timeout=10):
+        """Dừng thread nền và ghi nốt buffer (gọi khi tắt process)"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        return {
+            'buffered': len(self.buffer),
+            'written': self.written,
+            'dropped': self.dropped,
+            'last_error': self.last_error,
+        }
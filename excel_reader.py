@@ -0,0 +1,216 @@
+"""
+Đọc file Excel export từ ERP theo kiểu streaming (dùng chung cho các script)
+- Mở file 1 lần: đọc header ở row 2, tìm cột Item Code và Avg Consume
+- Chỉ lấy 2 cột đó, theo từng chunk dòng (openpyxl read-only)
+- Mỗi chunk đã được làm sạch: bỏ dòng trống, bỏ duplicate, ép kiểu số
+"""
+
+import time
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+
+# Số dòng mỗi chunk khi đọc file
+CHUNK_SIZE = 50_000
+
+# Header nằm ở row 2 (giống pd.read_excel(..., header=1))
+HEADER_ROW = 2
+
+# Các giá trị text được coi là ô trống (giống mặc định của pd.read_excel)
+NA_VALUES = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+    'n/a', 'nan', 'null',
+} | set(ERROR_CODES)  # Ô lỗi Excel (#VALUE!, #DIV/0!...) pd.read_excel cũng đọc thành NaN
+
+
+def find_columns(columns):
+    """
+    Tìm cột Item Code và Avg Consume từ danh sách tên cột
+
+    Returns:
+        (item_col, avg_col) - None nếu không tìm thấy
+    """
+    # Tìm cột Item Code
+    item_col = None
+    for col in columns:
+        if col is None:
+            continue
+        col_lower = str(col).lower().strip()
+        if 'item' in col_lower and 'code' in col_lower:
+            item_col = col
+            break
+        elif 'item' in col_lower:
+            item_col = col
+
+    # Tìm cột Avg Consume
+    avg_col = None
+    for col in columns:
+        if col is None:
+            continue
+        col_lower = str(col).lower().strip()
+        if 'avg' in col_lower and 'consume' in col_lower:
+            avg_col = col
+            break
+        elif 'consume' in col_lower:
+            avg_col = col
+
+    return item_col, avg_col
+
+
+def _is_xlsx(excel_file_path):
+    return not str(excel_file_path).lower().endswith('.xls')
+
+
+class ColumnNotFoundError(ValueError):
+    """Không tìm thấy cột Item Code hoặc Avg Consume trong header"""
+
+    def __init__(self, item_col, avg_col):
+        super().__init__(
+            f"Không tìm thấy cột cần thiết! Item Code: {item_col}, Avg Consume: {avg_col}"
+        )
+        self.item_col = item_col
+        self.avg_col = avg_col
+
+
+def _open_rows(excel_file_path):
+    """
+    Mở file Excel (1 lần), đọc header ở row 2
+
+    Returns:
+        (columns, rows, close) - rows: iterator các dòng data (tuple), close: hàm đóng file
+    """
+    if not _is_xlsx(excel_file_path):
+        # .xls không hỗ trợ read-only (và tối đa 65k dòng) -> đọc bằng pandas
+        df = pd.read_excel(excel_file_path, header=HEADER_ROW - 1, dtype=object)
+        return list(df.columns), df.itertuples(index=False, name=None), lambda: None
+
+    wb = load_workbook(excel_file_path, read_only=True, data_only=True)
+    ws = wb.worksheets[0]
+    ws.reset_dimensions()
+    rows = ws.iter_rows(min_row=HEADER_ROW, values_only=True)
+    columns = list(next(rows, ()))
+    return columns, rows, wb.close
+
+
+def read_header(excel_file_path):
+    """Đọc danh sách tên cột ở row 2 (không đọc phần data)"""
+    columns, _, close = _open_rows(excel_file_path)
+    close()
+    return columns
+
+
+def _iter_raw_chunks(rows, item_idx, avg_idx, chunksize):
+    """Lấy 2 cột (item, avg) từ các dòng theo từng chunk, chưa làm sạch"""
+    items, avgs = [], []
+    for row in rows:
+        items.append(row[item_idx] if item_idx < len(row) else None)
+        avgs.append(row[avg_idx] if avg_idx < len(row) else None)
+        if len(items) >= chunksize:
+            yield items, avgs
+            items, avgs = [], []
+    if items:
+        yield items, avgs
+
+
+def clean_chunk(items, avgs, seen=None):
+    """
+    Làm sạch một chunk dữ liệu
+
+    Args:
+        items, avgs: List giá trị cột Item Code và Avg Consume
+        seen: Set item_code đã gặp ở các chunk trước (bỏ duplicate giữa các chunk)
+
+    Returns:
+        DataFrame với cột 'item_code' (str) và 'avg_consume' (float)
+    """
+    df = pd.DataFrame({'item_code': items, 'avg_consume': avgs}, dtype=object)
+
+    # Loại bỏ dòng trống
+    df = df.mask(df.isin(NA_VALUES)).dropna()
+
+    # Loại bỏ duplicate (giữ item đầu tiên)
+    df['item_code'] = df['item_code'].astype(str)
+    df = df.drop_duplicates(subset=['item_code'], keep='first')
+    if seen is not None:
+        df = df[~df['item_code'].isin(seen)]
+        seen.update(df['item_code'])
+
+    # Chuyển đổi kiểu dữ liệu, loại bỏ avg_consume không hợp lệ
+    df['avg_consume'] = pd.to_numeric(df['avg_consume'], errors='coerce')
+    df = df.dropna(subset=['avg_consume'])
+    return df.reset_index(drop=True)
+
+
+def iter_clean_chunks(excel_file_path, item_col=None, avg_col=None, chunksize=CHUNK_SIZE,
+                      timings=None):
+    """
+    Đọc file Excel theo từng chunk đã làm sạch
+    File được mở và header được kiểm tra ngay khi gọi hàm (trước khi đọc data)
+
+    Args:
+        excel_file_path: Đường dẫn đến file Excel
+        item_col, avg_col: Tên cột (mặc định tự tìm từ header)
+        chunksize: Số dòng mỗi chunk
+        timings: Dict nhận thời gian từng stage ('detect', 'read', 'clean')
+
+    Returns:
+        Generator các DataFrame với cột 'item_code' và 'avg_consume'
+
+    Raises:
+        ColumnNotFoundError: Không tìm thấy cột cần thiết
+    """
+    if timings is None:
+        timings = {}
+
+    start = time.perf_counter()
+    columns, rows, close = _open_rows(excel_file_path)
+    try:
+        if item_col is None or avg_col is None:
+            item_col, avg_col = find_columns(columns)
+        if not item_col or not avg_col or item_col not in columns or avg_col not in columns:
+            raise ColumnNotFoundError(item_col, avg_col)
+    except Exception:
+        close()
+        raise
+    timings['detect'] = timings.get('detect', 0.0) + time.perf_counter() - start
+
+    raw_chunks = _iter_raw_chunks(rows, columns.index(item_col), columns.index(avg_col), chunksize)
+    return _clean_chunks(raw_chunks, close, timings)
+
+
+def _clean_chunks(raw_chunks, close, timings):
+    timings.setdefault('read', 0.0)
+    timings.setdefault('clean', 0.0)
+    seen = set()
+    try:
+        while True:
+            start = time.perf_counter()
+            raw = next(raw_chunks, None)
+            timings['read'] += time.perf_counter() - start
+            if raw is None:
+                break
+
+            start = time.perf_counter()
+            chunk = clean_chunk(raw[0], raw[1], seen)
+            timings['clean'] += time.perf_counter() - start
+            if len(chunk):
+                yield chunk
+    finally:
+        close()
+
+
+def read_clean(excel_file_path, item_col=None, avg_col=None, chunksize=CHUNK_SIZE,
+               timings=None):
+    """
+    Đọc toàn bộ file Excel thành một DataFrame đã làm sạch
+
+    Raises:
+        ColumnNotFoundError: Không tìm thấy cột cần thiết
+    """
+    chunks = list(iter_clean_chunks(excel_file_path, item_col, avg_col, chunksize, timings))
+    if not chunks:
+        return pd.DataFrame({'item_code': pd.Series(dtype=str),
+                             'avg_consume': pd.Series(dtype=float)})
+    return pd.concat(chunks, ignore_index=True)
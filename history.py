@@ -0,0 +1,214 @@
+"""
+Lịch sử avg_consume + bảng tổng hợp theo ngày / tuần (cho trang Sales Analysis)
+- Mỗi lần ingest chỉ ghi các item mới / có avg_consume thay đổi (kèm giá trị cũ)
+  vào {table}_history, cùng transaction với ghi data
+- PostgreSQL: {table}_history partition theo tháng (RANGE trên ts, partition tạo khi cần),
+  index (item_code, ts)
+- Rollup cập nhật ngay lúc ingest (chỉ cộng phần thay đổi của lần ingest đó):
+  {table}_daily / {table}_weekly: 1 dòng / item / ngày (tuần) - giá trị cuối, giá trị đầu kỳ, số lần đổi
+  {table}_daily_summary: 1 dòng / ngày - số thay đổi, số item mới, tổng chênh lệch
+- Chart / top mover chỉ đọc bảng rollup (không quét history)
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+from sqlalchemy import inspect, text
+
+
+def _is_postgres(conn):
+    return conn.dialect.name == 'postgresql'
+
+
+def history_tables(table_name):
+    """Tên các bảng lịch sử của 1 bảng data"""
+    return {
+        'history': f"{table_name}_history",
+        'daily': f"{table_name}_daily",
+        'weekly': f"{table_name}_weekly",
+        'summary': f"{table_name}_daily_summary",
+        'changes': f"{table_name}_changes",
+    }
+
+
+def ensure_history(conn, table_name):
+    """Tạo bảng history (partitioned trên PostgreSQL) + các bảng rollup nếu chưa có"""
+    t = history_tables(table_name)
+    partitioned = " PARTITION BY RANGE (ts)" if _is_postgres(conn) else ""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {t['history']} (
+            item_code TEXT NOT NULL,
+            ts TIMESTAMP NOT NULL,
+            avg_consume NUMERIC,
+            prev_avg NUMERIC,
+            revision BIGINT
+        ){partitioned}
+    """))
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {t['history']}_item_ts_idx ON {t['history']} (item_code, ts)"
+    ))
+    for rollup, period in (('daily', 'day'), ('weekly', 'week')):
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {t[rollup]} (
+                item_code TEXT NOT NULL,
+                {period} DATE NOT NULL,
+                avg_consume NUMERIC,
+                prev_avg NUMERIC,
+                changes INTEGER NOT NULL,
+                PRIMARY KEY (item_code, {period})
+            )
+        """))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {t[rollup]}_{period}_idx ON {t[rollup]} ({period})"
+        ))
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {t['summary']} (
+            day DATE PRIMARY KEY,
+            changes INTEGER NOT NULL,
+            added INTEGER NOT NULL,
+            net_change NUMERIC NOT NULL
+        )
+    """))
+
+
+def ensure_partition(conn, table_name, ts):
+    """Tạo partition tháng chứa ts (PostgreSQL)"""
+    if not _is_postgres(conn):
+        return
+    history = history_tables(table_name)['history']
+    start = ts.date().replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {history}_{start:%Y%m} PARTITION OF {history}
+        FOR VALUES FROM ('{start}') TO ('{end}')
+    """))
+
+
+def stage_changes(conn, table_name, select_sql, params=None):
+    """
+    Lưu các thay đổi của lần ingest vào bảng TEMP {table}_changes
+
+    Args:
+        select_sql: SELECT trả về (item_code, avg_consume mới, avg_consume cũ hoặc NULL nếu item mới)
+        params: Tham số của select_sql
+
+    Returns:
+        (added, updated): số item mới, số item đổi avg_consume
+    """
+    changes = history_tables(table_name)['changes']
+    if _is_postgres(conn):
+        on_commit = " ON COMMIT DROP"
+    else:
+        on_commit = ""
+        conn.execute(text(f"DROP TABLE IF EXISTS {changes}"))
+    conn.execute(text(f"""
+        CREATE TEMP TABLE {changes} (
+            item_code TEXT,
+            avg_consume NUMERIC,
+            prev_avg NUMERIC
+        ){on_commit}
+    """))
+    conn.execute(text(f"INSERT INTO {changes} (item_code, avg_consume, prev_avg) {select_sql}"),
+                 params or {})
+    total, added = conn.execute(text(f"""
+        SELECT COUNT(*), COALESCE(SUM(CASE WHEN prev_avg IS NULL THEN 1 ELSE 0 END), 0)
+        FROM {changes}
+    """)).one()
+    return int(added), int(total) - int(added)
+
+
+def record_history(conn, table_name, revision, ts=None, ensure=True):
+    """
+    Ghi bảng {table}_changes (stage_changes) vào history + cập nhật rollup ngày / tuần
+    Gọi trong transaction ghi data, sau next_revision (row lock revision -> các lần ingest nối tiếp nhau)
+
+    Args:
+        ensure: False nếu ensure_history đã chạy ở transaction riêng (không chạy DDL trong
+            transaction ghi data; partition tháng vẫn được tạo nếu thiếu)
+    """
+    t = history_tables(table_name)
+    ts = ts or datetime.now(timezone.utc).replace(tzinfo=None)
+    day = ts.date()
+    week = day - timedelta(days=day.weekday())
+    if ensure:
+        ensure_history(conn, table_name)
+    ensure_partition(conn, table_name, ts)
+
+    conn.execute(text(f"""
+        INSERT INTO {t['history']} (item_code, ts, avg_consume, prev_avg, revision)
+        SELECT item_code, :ts, avg_consume, prev_avg, :rev FROM {t['changes']}
+    """), {'ts': ts, 'rev': revision})
+    # Rollup: giữ prev_avg của lần đổi đầu tiên trong kỳ, avg_consume của lần cuối
+    for rollup, period, value in (('daily', 'day', day), ('weekly', 'week', week)):
+        conn.execute(text(f"""
+            INSERT INTO {t[rollup]} (item_code, {period}, avg_consume, prev_avg, changes)
+            SELECT item_code, :p, avg_consume, prev_avg, 1 FROM {t['changes']} WHERE true
+            ON CONFLICT (item_code, {period}) DO UPDATE
+            SET avg_consume = EXCLUDED.avg_consume, changes = {t[rollup]}.changes + 1
+        """), {'p': value})
+    conn.execute(text(f"""
+        INSERT INTO {t['summary']} (day, changes, added, net_change)
+        SELECT :day, COUNT(*),
+               COALESCE(SUM(CASE WHEN prev_avg IS NULL THEN 1 ELSE 0 END), 0),
+               COALESCE(SUM(avg_consume - COALESCE(prev_avg, 0)), 0)
+        FROM {t['changes']}
+        HAVING COUNT(*) > 0
+        ON CONFLICT (day) DO UPDATE
+        SET changes = {t['summary']}.changes + EXCLUDED.changes,
+            added = {t['summary']}.added + EXCLUDED.added,
+            net_change = {t['summary']}.net_change + EXCLUDED.net_change
+    """), {'day': day})
+    if not _is_postgres(conn):
+        conn.execute(text(f"DROP TABLE {t['changes']}"))
+
+
+def _read(conn, table, sql, params, columns):
+    # Chưa ingest lần nào từ khi có history -> chưa có bảng, trả về DataFrame rỗng
+    rows = conn.execute(text(sql), params).fetchall() if inspect(conn).has_table(table) else []
+    df = pd.DataFrame(rows, columns=columns)
+    for col in columns[1:]:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def daily_summary(conn, table_name, start, end):
+    """Số thay đổi / item mới / tổng chênh lệch avg_consume theo ngày trong [start, end]"""
+    summary = history_tables(table_name)['summary']
+    df = _read(conn, summary, f"""
+        SELECT day, changes, added, net_change FROM {summary}
+        WHERE day >= :start AND day <= :end ORDER BY day
+    """, {'start': start, 'end': end}, ['Day', 'Changes', 'New Items', 'Net Change'])
+    df['Day'] = pd.to_datetime(df['Day'])
+    return df
+
+
+def item_trend(conn, table_name, item_code, start, end, period='day'):
+    """avg_consume của 1 item theo ngày / tuần (chỉ các kỳ có thay đổi) trong [start, end]"""
+    rollup = history_tables(table_name)['daily' if period == 'day' else 'weekly']
+    df = _read(conn, rollup, f"""
+        SELECT {period}, avg_consume, prev_avg, changes FROM {rollup}
+        WHERE item_code = :code AND {period} >= :start AND {period} <= :end
+        ORDER BY {period}
+    """, {'code': item_code, 'start': start, 'end': end},
+        ['Period', 'Avg_Consume', 'Previous', 'Changes'])
+    df['Period'] = pd.to_datetime(df['Period'])
+    return df
+
+
+def top_movers(conn, table_name, period_start, period='day', limit=20):
+    """
+    Item có avg_consume thay đổi nhiều nhất trong 1 ngày / tuần (không tính item mới)
+
+    Args:
+        period_start: Ngày (period='day') hoặc thứ Hai đầu tuần (period='week')
+    """
+    rollup = history_tables(table_name)['daily' if period == 'day' else 'weekly']
+    df = _read(conn, rollup, f"""
+        SELECT item_code, prev_avg, avg_consume, avg_consume - prev_avg AS delta, changes
+        FROM {rollup}
+        WHERE {period} = :p AND prev_avg IS NOT NULL
+        ORDER BY ABS(avg_consume - prev_avg) DESC
+        LIMIT :limit
+    """, {'p': period_start, 'limit': limit},
+        ['Item_Code', 'Previous', 'Avg_Consume', 'Change', 'Changes'])
+    return df
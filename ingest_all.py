@@ -0,0 +1,194 @@
+"""
+Script để upsert TẤT CẢ file Excel trong folder data (Multi-file mode)
+- Đọc + làm sạch các file song song (process pool, mỗi file một process)
+- Item trùng giữa các file: file mới nhất (theo thời gian sửa file) thắng
+- Ghi vào database bằng một lần bulk upsert (1 transaction) cho mỗi site
+- Site của file: --site (mọi file), hoặc ghi trong tên file (vd: RO_site-hn1.xlsx),
+  mặc định DEFAULT_SITE
+- Site không có file nào thay đổi từ lần ingest trước (theo manifest) -> bỏ qua,
+  có file thay đổi -> đọc lại mọi file của site (giữ đúng thứ tự ưu tiên)
+
+Chạy: python ingest_all.py [data_folder] [--workers N] [--site SITE] [--force]
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+import time
+import pandas as pd
+from dotenv import load_dotenv
+
+import metrics
+from db import get_engine, format_stats
+from excel_reader import read_clean
+from bulk_loader import bulk_upsert
+from manifest import file_hash, is_ingested, record_files
+from sites import resolve_site, shard_table
+
+# Load environment variables
+load_dotenv()
+
+# Supabase connection string from .env
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+if not DATABASE_URL:
+    print("❌ DATABASE_URL not found in .env file!")
+    exit(1)
+
+def list_excel_files(data_folder):
+    """Danh sách file Excel trong folder, file mới nhất đứng đầu"""
+    paths = [
+        os.path.join(data_folder, f) for f in os.listdir(data_folder)
+        if f.endswith(('.xlsx', '.xls')) and not f.startswith('~$')
+    ]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+def parse_file(excel_file_path):
+    """
+    Đọc + làm sạch một file (chạy trong process con)
+
+    Returns:
+        (df, elapsed_seconds, error) - df là None nếu lỗi
+    """
+    start = time.perf_counter()
+    try:
+        df = read_clean(excel_file_path)
+        return df, time.perf_counter() - start, None
+    except Exception as e:
+        return None, time.perf_counter() - start, str(e)
+
+def read_folder(excel_files, workers=None):
+    """
+    Đọc song song nhiều file và gộp lại
+
+    Args:
+        excel_files: List đường dẫn file, theo thứ tự ưu tiên (file đầu thắng)
+        workers: Số process (mặc định = số CPU)
+
+    Returns:
+        (merged_df, reports) - reports: list dict thống kê từng file
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(parse_file, excel_files))
+
+    frames, reports = [], []
+    for path, (df, elapsed, error) in zip(excel_files, results):
+        reports.append({
+            'file': os.path.basename(path),
+            'rows': 0 if df is None else len(df),
+            'seconds': elapsed,
+            'error': error,
+        })
+        if df is not None:
+            frames.append(df)
+
+    if not frames:
+        return None, reports
+
+    # Gộp theo thứ tự ưu tiên, item trùng giữ bản của file mới nhất
+    merged = pd.concat(frames, ignore_index=True)
+    merged = merged.drop_duplicates(subset=['item_code'], keep='first')
+    return merged, reports
+
+def ingest_folder(data_folder, table_name='ro_items', workers=None, force=False, site=None):
+    """
+    Upsert toàn bộ file Excel trong folder vào database (mỗi site 1 lần upsert)
+
+    Args:
+        data_folder: Folder chứa file Excel
+        table_name: Tên bảng trong database
+        workers: Số process đọc file song song
+        force: Ingest lại kể cả những file không thay đổi
+        site: Site của mọi file (None = lấy từ tên từng file, không có thì DEFAULT_SITE)
+    """
+    try:
+        excel_files = list_excel_files(data_folder)
+        if len(excel_files) == 0:
+            print(f"❌ Không tìm thấy file Excel trong folder '{data_folder}'")
+            return
+
+        print("Đang kết nối Supabase...")
+        engine = get_engine(DATABASE_URL, statement_timeout_ms=0)
+
+        # Chia file theo site (giữ thứ tự file mới nhất trước trong từng site)
+        by_site = {}
+        for path in excel_files:
+            by_site.setdefault(resolve_site(site, path), []).append(path)
+        for file_site, site_files in sorted(by_site.items()):
+            print(f"🏭 Site: {file_site} ({len(site_files)} file)")
+            ingest_site(engine, site_files, file_site, table_name, workers, force)
+
+    except Exception as e:
+        print(f"❌ Lỗi: {str(e)}")
+
+def ingest_site(engine, excel_files, site, table_name='ro_items', workers=None, force=False):
+    """Upsert các file của 1 site vào shard của site đó (1 transaction)"""
+    shard = shard_table(table_name, site)
+
+    # Bỏ qua site nếu mọi file đã ingest (hash có trong manifest)
+    # Có file thay đổi -> đọc lại mọi file của site: merge "file mới nhất thắng" cần cả file không đổi
+    # (item của file không đổi nhưng mới hơn không bị file cũ vừa sửa ghi đè)
+    digests = {path: file_hash(path) for path in excel_files}
+    if not force:
+        changed = [p for p in excel_files if not is_ingested(engine, shard, digests[p])]
+        if len(changed) == 0:
+            print("✅ Không có file nào thay đổi, không cần ingest")
+            return
+        for path in changed:
+            print(f"   🔄 {os.path.basename(path)}: thay đổi")
+        if len(changed) < len(excel_files):
+            print(f"   ↪ Đọc lại cả {len(excel_files) - len(changed)} file không đổi của site")
+
+    print(f"🔍 {len(excel_files)} file Excel cần ingest, đang đọc song song...")
+    start = time.perf_counter()
+    merged, reports = read_folder(excel_files, workers)
+    read_seconds = time.perf_counter() - start
+
+    for r in reports:
+        if r['error']:
+            print(f"   ❌ {r['file']}: {r['error']} ({r['seconds']:.2f}s)")
+        else:
+            print(f"   ✓ {r['file']}: {r['rows']} items ({r['seconds']:.2f}s)")
+
+    if merged is None:
+        print("❌ Không đọc được file nào!")
+        return
+
+    total_rows = sum(r['rows'] for r in reports)
+    print(f"✓ Đã xử lý: {len(merged)} items duy nhất "
+          f"(từ {total_rows} dòng, {read_seconds:.2f}s)")
+
+    # Ghi manifest cho các file đọc thành công, cùng transaction với data
+    ingested = [
+        (path, digests[path], r['rows'])
+        for path, r in zip(excel_files, reports) if not r['error']
+    ]
+
+    print("Đang thực hiện UPSERT (COPY -> bảng tạm -> merge)...")
+    start = time.perf_counter()
+    timings = {'read': read_seconds}
+    summary = bulk_upsert(
+        engine, merged, table_name,
+        before_commit=lambda conn, s: record_files(conn, shard, ingested),
+        timings=timings,
+        site=site,
+    )
+    metrics.observe_timings('ingest', timings, mode='upsert', files=len(ingested), **summary)
+    print(f"✅ Upsert thành công {summary['rows']} items! ({time.perf_counter() - start:.2f}s)")
+    print(f"   - Items mới: {summary['inserted']} (INSERT)")
+    print(f"   - Items thay đổi: {summary['updated']} (UPDATE avg_consume)")
+    print(f"   - Items không đổi: {summary['unchanged']} (bỏ qua)")
+    print(f"   {format_stats()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upsert tất cả file Excel trong folder data")
+    parser.add_argument("data_folder", nargs="?", default="data")
+    parser.add_argument("--workers", type=int, default=None, help="Số process đọc file")
+    parser.add_argument("--force", action="store_true", help="Ingest lại cả file không thay đổi")
+    parser.add_argument("--site", default=None, help="Site của mọi file (mặc định: lấy từ tên file)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data_folder):
+        print(f"❌ Folder '{args.data_folder}' không tồn tại!")
+    else:
+        ingest_folder(args.data_folder, workers=args.workers, force=args.force, site=args.site)
@@ -0,0 +1,78 @@
+"""
+Index tìm kiếm Item Code cho ô search của dashboard
+- Key (code viết thường) đã sort, lưu thành 1 buffer bytes liên tục + mảng offset
+  (không giữ 1 object str cho mỗi item)
+- Prefix: binary search trên offset (O(log n + N))
+- Substring: bytes.find trên buffer (chạy ở tốc độ C), dừng ngay khi đủ N kết quả
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from item_table import string_buffers
+
+# Số kết quả tối đa trả về cho mỗi lần search
+SEARCH_LIMIT = 50
+
+
+class ItemSearchIndex:
+    """Tìm item code theo prefix trước, sau đó theo substring (không phân biệt hoa thường)"""
+
+    def __init__(self, codes):
+        if not isinstance(codes, pa.Array):
+            codes = pa.array(pd.Series(codes, dtype=object).astype(str), type=pa.string())
+        codes = pc.unique(codes)
+        keys = pc.utf8_lower(codes)
+        order = pc.array_sort_indices(keys)
+        self._blob, self._offsets = string_buffers(keys.take(order))
+        self.codes = codes.take(order)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _key(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1]]
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """
+        Tìm item code chứa query
+
+        Returns:
+            List tối đa `limit` code: khớp prefix trước (theo thứ tự sort), rồi khớp substring
+        """
+        q = str(query).strip().lower().encode()
+        if not q:
+            return []
+        blob, offsets, n = self._blob, self._offsets, len(self.codes)
+
+        # Khớp prefix: vị trí đầu tiên có key >= q
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < q:
+                lo = mid + 1
+            else:
+                hi = mid
+        results = []
+        i = lo
+        while i < n and len(results) < limit and self._key(i).startswith(q):
+            results.append(self.codes[i].as_py())
+            i += 1
+        if len(results) >= limit:
+            return results
+
+        # Khớp substring (bỏ qua code đã khớp prefix, bỏ qua chỗ khớp nằm vắt qua 2 code)
+        pos = blob.find(q)
+        while pos != -1 and len(results) < limit:
+            # Giữ đúng dtype int32 của offsets (tránh numpy ép kiểu -> copy cả mảng mỗi lần)
+            idx = int(offsets.searchsorted(np.int32(pos), side='right')) - 1
+            end = int(offsets[idx + 1])
+            if pos + len(q) > end:
+                pos = blob.find(q, pos + 1)
+                continue
+            if not self._key(idx).startswith(q):
+                results.append(self.codes[idx].as_py())
+            pos = blob.find(q, end)
+        return results
@@ -0,0 +1,212 @@
+"""
+Bộ nhớ đệm ro_items của dashboard (1 instance / site / process, dùng chung mọi session)
+- Mỗi store chỉ đọc shard của 1 site (vd: ro_items_main, xem sites.py)
+- Data giữ dạng compact (ItemTable: buffer code + mảng float), 1 bản dùng chung mọi session
+- Load toàn bộ bảng lần đầu, ghi nhớ revision đang giữ
+- Reload: chỉ lấy các dòng có revision mới hơn, tạo bảng mới rồi swap (không sửa bảng đang đọc)
+- Index search Item Code được build một lần mỗi lần load (và khi có item mới)
+- Bảng bị replace toàn bộ (base_revision tăng) -> load lại toàn bộ
+- Rule quyết định của site (rules.py) đọc cùng lúc load / refresh, threshold / moq tính sẵn trong
+  ItemTable; rule đổi -> chỉ tính lại tham số, không đọc lại data
+- Snapshot local (Arrow IPC, memory-map) gắn revision: khởi động từ snapshot ngay,
+  kiểm tra database ở background; database lỗi -> vẫn chạy read-only từ snapshot
+"""
+
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import text
+
+import db
+import metrics
+from item_search import ItemSearchIndex
+from item_table import ItemTable
+from revision import current_revision
+from rules import load_rules
+
+
+# Folder chứa snapshot local (có thể override trong .env)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "cache")
+
+
+class ItemStore:
+    """ItemTable + index search của ro_items, refresh theo revision"""
+
+    def __init__(self, table_name='ro_items', snapshot_dir=SNAPSHOT_DIR, site=None):
+        self.table_name = table_name
+        self.site = site  # Site của rule quyết định (load_rules)
+        self.table = None
+        self.search = ItemSearchIndex([])
+        self.revision = None
+        self.source = None
+        self.last_error = None
+        self.snapshot_path = (
+            os.path.join(snapshot_dir, f"{table_name}.arrow") if snapshot_dir else None
+        )
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._refresh_thread = None
+
+    def _select(self, where=""):
+        # Không cần ORDER BY: ItemTable tự sort
+        return text(f"SELECT item_code, avg_consume FROM {self.table_name} {where}")
+
+    @staticmethod
+    def _clean(raw):
+        raw = raw.dropna()
+        return raw['item_code'].astype(str), raw['avg_consume'].to_numpy(dtype=float)
+
+    def _set_table(self, table, revision, rebuild_search=True):
+        # Search build trước, swap table sau: session khác luôn thấy cặp (table, search) dùng được
+        if rebuild_search:
+            self.search = ItemSearchIndex(table.codes)
+        self.table = table
+        self.revision = revision
+
+    def open(self, engine):
+        """
+        Khởi động: dùng snapshot local nếu có (kiểm tra database ở background),
+        không có snapshot thì load toàn bộ từ database
+        """
+        # Đã có data: không chờ lock (refresh ở background có thể đang giữ lock)
+        if self.table is not None:
+            return
+        with self._lock:
+            if self.table is not None:
+                return
+            if self._load_snapshot():
+                self.source = 'snapshot'
+            else:
+                self._load(engine)
+        if self.source == 'snapshot':
+            self.refresh_in_background(engine)
+        else:
+            self._save_snapshot_in_background()
+
+    def load(self, engine):
+        """Load toàn bộ bảng"""
+        with self._lock:
+            self._load(engine)
+        self._save_snapshot_in_background()
+
+    def _load(self, engine):
+        with metrics.span('store_load', table=self.table_name):
+            with db.connect(engine) as conn:
+                # Đọc revision trước: dòng ghi sau thời điểm này sẽ được lấy lại ở lần refresh sau
+                revision, _ = current_revision(conn, self.table_name)
+                raw = pd.read_sql(self._select(), conn)
+                rules = load_rules(conn, self.site)
+            self._set_table(ItemTable.from_arrays(*self._clean(raw), rules), revision)
+        self.source = 'database'
+        self.last_error = None
+
+    def refresh(self, engine):
+        """
+        Cập nhật theo revision
+
+        Returns:
+            Số dòng đã thay đổi, hoặc None nếu phải load lại toàn bộ
+        """
+        try:
+            with metrics.span('store_refresh', table=self.table_name):
+                changed = self._refresh(engine)
+        except Exception as e:
+            metrics.REGISTRY.inc('store_refresh_errors')
+            self.last_error = str(e)
+            raise
+        self.last_error = None
+        if changed != 0:
+            self._save_snapshot_in_background()
+        return changed
+
+    def refresh_in_background(self, engine):
+        """Chạy refresh() ở thread riêng (bỏ qua nếu đang có thread chạy)"""
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+
+        def run():
+            try:
+                self.refresh(engine)
+            except Exception:
+                pass  # Lỗi đã lưu ở last_error, tiếp tục dùng data đang có
+
+        self._refresh_thread = threading.Thread(target=run, daemon=True)
+        self._refresh_thread.start()
+
+    def _refresh(self, engine):
+        with self._lock:
+            with db.connect(engine) as conn:
+                revision, base_revision = current_revision(conn, self.table_name)
+                rules = load_rules(conn, self.site)
+                if self.table is not None and revision == self.revision:
+                    # Data không đổi: chỉ tính lại threshold / moq nếu rule đổi
+                    self._set_table(self.table.with_rules(rules), revision, rebuild_search=False)
+                    self.source = 'database'
+                    return 0
+                if self.table is None or self.revision is None or base_revision > self.revision:
+                    full_reload = True
+                else:
+                    full_reload = False
+                    raw = pd.read_sql(self._select("WHERE revision > :rev"), conn,
+                                      params={'rev': self.revision})
+            if full_reload:
+                self._load(engine)
+                return None
+            codes, avg = self._clean(raw)
+            table = self.table.with_updates(codes, avg).with_rules(rules)
+            # Chỉ build lại index search khi có item mới
+            self._set_table(table, revision, rebuild_search=len(table) != len(self.table))
+            self.source = 'database'
+            return len(codes)
+
+    def _load_snapshot(self):
+        """Load snapshot local (memory-map, không copy buffer số). Trả về False nếu không có"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with metrics.span('snapshot_load', table=self.table_name):
+                source = pa.memory_map(self.snapshot_path)
+                table = pa.ipc.open_file(source).read_all()
+                metadata = table.schema.metadata
+                # Chưa kết nối database: rule từ file (rule trong bảng áp dụng ở lần refresh sau)
+                rules = load_rules(None, self.site)
+                if metadata.get(b'sorted') == b'1':
+                    items = ItemTable.from_arrow(table, rules)
+                else:
+                    # Snapshot format cũ (DataFrame chưa sort)
+                    df = table.to_pandas()
+                    items = ItemTable.from_arrays(df['Item_Code'], df['Avg_Consume'], rules)
+                self._set_table(items, int(metadata[b'revision']))
+            return True
+        except Exception:
+            # Snapshot hỏng/khác format -> bỏ qua, load từ database
+            return False
+
+    def save_snapshot(self):
+        """Ghi snapshot (ghi file tạm rồi rename -> không bao giờ có file ghi dở)"""
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            if self.table is None:
+                return
+            table = self.table.to_arrow().replace_schema_metadata(
+                {'revision': str(self.revision), 'sorted': '1'}
+            )
+        os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with self._save_lock, metrics.span('snapshot_save', table=self.table_name):
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, self.snapshot_path)
+
+    def _save_snapshot_in_background(self):
+        def run():
+            try:
+                self.save_snapshot()
+            except Exception:
+                pass  # Snapshot chỉ để tăng tốc khởi động, lỗi ghi không ảnh hưởng dashboard
+
+        threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,171 @@
+"""
+Xem 1 shard (site) của ro_items theo trang, lọc / sort / phân trang chạy trong SQL
+- Keyset pagination: trang sau bắt đầu từ key của dòng cuối trang trước
+  (WHERE key > :last ORDER BY key LIMIT n - không dùng OFFSET, trang nào cũng nhanh như trang đầu)
+- Sort theo item_code (primary key (site, item_code), điều kiện site = :site để dùng được index)
+  hoặc (avg_consume, item_code) (index {table}_avg_consume_idx)
+- Lọc theo prefix item code và khoảng avg_consume
+- Cache LRU các trang vừa xem, key gồm revision của bảng (data thay đổi -> không dùng trang cũ)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from sqlalchemy import text
+
+import metrics
+from db import connect
+
+# Số dòng mỗi trang (có thể override trong .env)
+VIEWER_PAGE_SIZE = int(os.getenv("VIEWER_PAGE_SIZE", "100"))
+# Số trang giữ trong cache LRU (mỗi process)
+VIEWER_CACHE_PAGES = int(os.getenv("VIEWER_CACHE_PAGES", "64"))
+
+# sort -> (cột keyset, chiều sort)
+SORTS = {
+    'item_code': (('item_code',), 'ASC'),
+    'item_code desc': (('item_code',), 'DESC'),
+    'avg_consume': (('avg_consume', 'item_code'), 'ASC'),
+    'avg_consume desc': (('avg_consume', 'item_code'), 'DESC'),
+}
+
+
+class PageCache:
+    """Cache LRU nhỏ (thread-safe): bỏ trang ít dùng nhất khi đầy"""
+
+    def __init__(self, max_pages=VIEWER_CACHE_PAGES):
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key, page):
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def __len__(self):
+        return len(self._pages)
+
+
+def build_query(table_name, prefix='', min_avg=None, max_avg=None, sort='item_code', after=None,
+                limit=VIEWER_PAGE_SIZE, site=None):
+    """
+    SQL + params cho 1 trang (lấy thêm 1 dòng để biết còn trang sau không)
+
+    Args:
+        after: Key của dòng cuối trang trước (item_code, hoặc (avg_consume, item_code)), None = trang đầu
+        site: Site của shard (None = bảng không có cột site)
+    """
+    columns, direction = SORTS[sort]
+    where, params = [], {'limit': limit + 1}
+    if site is not None:
+        where.append("site = :site")
+        params['site'] = site
+    if prefix:
+        # Cận dưới để dùng index của item_code, substr để khớp chính xác prefix
+        where.append("item_code >= :prefix AND substr(item_code, 1, :prefix_len) = :prefix")
+        params.update(prefix=prefix, prefix_len=len(prefix))
+    if min_avg is not None:
+        where.append("avg_consume >= :min_avg")
+        params['min_avg'] = min_avg
+    if max_avg is not None:
+        where.append("avg_consume <= :max_avg")
+        params['max_avg'] = max_avg
+    if after is not None:
+        op = '>' if direction == 'ASC' else '<'
+        if len(columns) == 1:
+            where.append(f"item_code {op} :after_code")
+            params['after_code'] = after
+        else:
+            where.append(f"(avg_consume, item_code) {op} (:after_avg, :after_code)")
+            params['after_avg'], params['after_code'] = after
+
+    sql = f"SELECT item_code, avg_consume FROM {table_name}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY " + ", ".join(f"{c} {direction}" for c in columns) + " LIMIT :limit"
+    return sql, params
+
+
+def fetch_page(conn, table_name, prefix='', min_avg=None, max_avg=None, sort='item_code', after=None,
+               limit=VIEWER_PAGE_SIZE, site=None):
+    """
+    Đọc 1 trang từ database
+
+    Returns:
+        (df, next_key): df có cột 'Item_Code', 'Avg_Consume';
+        next_key = key để đọc trang sau (truyền vào after), None nếu là trang cuối
+    """
+    sql, params = build_query(table_name, prefix, min_avg, max_avg, sort, after, limit, site)
+    rows = conn.execute(text(sql), params).fetchall()
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        # Giữ nguyên kiểu của avg_consume (NUMERIC -> Decimal) để so sánh keyset chính xác
+        next_key = last[0] if len(SORTS[sort][0]) == 1 else (last[1], last[0])
+    df = pd.DataFrame({
+        'Item_Code': [r[0] for r in rows],
+        'Avg_Consume': pd.Series([r[1] for r in rows], dtype=object).astype(float),
+    })
+    return df, next_key
+
+
+class ItemViewer:
+    """
+    Đọc trang của bảng qua cache LRU dùng chung cho mọi session
+
+    Args:
+        engine: SQLAlchemy Engine
+        table_name: Shard cần xem (vd: ro_items_main)
+        site: Site của shard
+        cache_pages: Số trang tối đa trong cache
+    """
+
+    def __init__(self, engine, table_name, site=None, cache_pages=VIEWER_CACHE_PAGES):
+        self.engine = engine
+        self.table_name = table_name
+        self.site = site
+        self.cache = PageCache(cache_pages)
+
+    def page(self, revision, prefix='', min_avg=None, max_avg=None, sort='item_code', after=None,
+             limit=VIEWER_PAGE_SIZE):
+        """
+        1 trang (từ cache nếu đã xem với cùng revision + bộ lọc)
+
+        Args:
+            revision: Revision hiện tại của bảng (ItemStore.revision)
+
+        Returns:
+            (df, next_key) - xem fetch_page()
+        """
+        key = (revision, prefix, min_avg, max_avg, sort, after, limit)
+        page = self.cache.get(key)
+        if page is not None:
+            return page
+        with metrics.span('viewer_page', sort=sort):
+            with connect(self.engine) as conn:
+                page = fetch_page(conn, self.table_name, prefix, min_avg, max_avg, sort, after, limit,
+                                  self.site)
+        self.cache.put(key, page)
+        return page
@@ -0,0 +1,125 @@
+"""
+Manifest các file Excel đã ingest (bảng ingest_manifest trong database)
+- Lưu hash nội dung (SHA-256) của từng file đã ghi thành công
+- File có hash đã có trong manifest -> không thay đổi, bỏ qua
+- Tiến độ theo chunk (bảng ingest_progress) để Append mode chạy tiếp từ chunk đã commit
+"""
+
+import hashlib
+import os
+
+from sqlalchemy import text
+
+from db import begin
+
+MANIFEST_TABLE = 'ingest_manifest'
+PROGRESS_TABLE = 'ingest_progress'
+
+
+def file_hash(path, block_size=1 << 20):
+    """Tính SHA-256 của nội dung file (đọc theo block)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ensure_manifest(conn):
+    """Tạo bảng manifest nếu chưa có"""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            table_name TEXT NOT NULL,
+            file_hash TEXT NOT NULL,
+            file_name TEXT,
+            row_count INTEGER,
+            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (table_name, file_hash)
+        )
+    """))
+
+
+def is_ingested(engine, table_name, digest):
+    """Kiểm tra file (theo hash) đã được ingest vào bảng chưa"""
+    with begin(engine) as conn:
+        ensure_manifest(conn)
+        row = conn.execute(
+            text(f"SELECT 1 FROM {MANIFEST_TABLE} WHERE table_name = :t AND file_hash = :h"),
+            {'t': table_name, 'h': digest},
+        ).first()
+    return row is not None
+
+
+def record_files(conn, table_name, files):
+    """
+    Ghi các file đã ingest vào manifest (gọi trong transaction ghi data)
+
+    Args:
+        conn: SQLAlchemy Connection
+        table_name: Bảng đã ghi data
+        files: List (path, digest, row_count)
+    """
+    ensure_manifest(conn)
+    for path, digest, row_count in files:
+        conn.execute(text(f"""
+            INSERT INTO {MANIFEST_TABLE} (table_name, file_hash, file_name, row_count)
+            VALUES (:t, :h, :n, :r)
+            ON CONFLICT (table_name, file_hash)
+            DO UPDATE SET file_name = EXCLUDED.file_name, row_count = EXCLUDED.row_count
+        """), {'t': table_name, 'h': digest, 'n': os.path.basename(path), 'r': row_count})
+
+
+def ensure_progress(conn):
+    """Tạo bảng lưu tiến độ ingest theo chunk (Append mode) nếu chưa có"""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} (
+            table_name TEXT NOT NULL,
+            file_hash TEXT NOT NULL,
+            chunksize INTEGER NOT NULL,
+            chunks INTEGER NOT NULL,
+            inserted BIGINT NOT NULL,
+            skipped BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (table_name, file_hash)
+        )
+    """))
+
+
+def get_progress(engine, table_name, digest, chunksize):
+    """
+    Tiến độ đã commit của lần ingest dở trước (cùng file, cùng chunksize)
+
+    Returns:
+        dict chunks, inserted, skipped - hoặc None nếu không có
+    """
+    with begin(engine) as conn:
+        ensure_progress(conn)
+        row = conn.execute(text(f"""
+            SELECT chunks, inserted, skipped FROM {PROGRESS_TABLE}
+            WHERE table_name = :t AND file_hash = :h AND chunksize = :c
+        """), {'t': table_name, 'h': digest, 'c': chunksize}).first()
+    if row is None:
+        return None
+    return {'chunks': int(row[0]), 'inserted': int(row[1]), 'skipped': int(row[2])}
+
+
+def save_progress(conn, table_name, digest, chunksize, summary):
+    """Lưu tiến độ (gọi trong transaction ghi chunk -> commit cùng data)"""
+    ensure_progress(conn)
+    conn.execute(text(f"""
+        INSERT INTO {PROGRESS_TABLE} (table_name, file_hash, chunksize, chunks, inserted, skipped)
+        VALUES (:t, :h, :c, :n, :i, :s)
+        ON CONFLICT (table_name, file_hash)
+        DO UPDATE SET chunksize = EXCLUDED.chunksize, chunks = EXCLUDED.chunks,
+            inserted = EXCLUDED.inserted, skipped = EXCLUDED.skipped,
+            updated_at = CURRENT_TIMESTAMP
+    """), {'t': table_name, 'h': digest, 'c': chunksize, 'n': summary['chunks'],
+           'i': summary['inserted'], 's': summary['skipped']})
+
+
+def clear_progress(engine, table_name, digest):
+    """Xóa tiến độ khi file đã ingest xong"""
+    with begin(engine) as conn:
+        ensure_progress(conn)
+        conn.execute(text(f"DELETE FROM {PROGRESS_TABLE} WHERE table_name = :t AND file_hash = :h"),
+                     {'t': table_name, 'h': digest})
@@ -0,0 +1,241 @@
+"""
+Đo thời gian các bước xử lý chính (dashboard + ingestion), giữ trong process
+- span(): đo 1 đoạn code, ghi vào histogram của registry process (+ registry của session)
+- Registry: counter + histogram độ trễ (bucket cố định, memory không tăng theo số lần đo)
+- Export: JSON log mỗi span (bật bằng METRICS_LOG) và text format Prometheus
+  (METRICS_PROM_FILE: ghi file khi process kết thúc, dùng cho các script)
+"""
+
+import atexit
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# JSON log: "stderr" hoặc đường dẫn file, để trống = tắt (có thể override trong .env)
+METRICS_LOG = os.getenv("METRICS_LOG", "")
+# File text Prometheus ghi khi process kết thúc (node_exporter textfile collector)
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE", "")
+
+PREFIX = "ros"
+
+# Bucket độ trễ (giây): 0.1ms -> 60s theo dãy 1-2-5
+BUCKETS = tuple(m * 10.0 ** e for e in range(-4, 2) for m in (1, 2, 5)) + (60.0, math.inf)
+
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    """Histogram độ trễ với bucket cố định, percentile ước lượng bằng nội suy trong bucket"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """Percentile p (0-100) tính bằng giây (giống histogram_quantile của Prometheus)"""
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        cumulative = 0
+        lower = 0.0
+        for bound, n in zip(self.buckets, self.counts):
+            if n and cumulative + n >= rank:
+                if math.isinf(bound):
+                    return self.max
+                value = lower + (bound - lower) * (rank - cumulative) / n
+                return min(value, self.max)
+            cumulative += n
+            lower = bound
+        return self.max
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    # Text format Prometheus: giá trị label phải escape \, " và xuống dòng (vd: đường dẫn file Windows)
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class Registry:
+    """Counter + histogram theo tên (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def summary(self):
+        """
+        Thống kê từng span
+
+        Returns:
+            Dict tên span -> {'count', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}
+        """
+        result = {}
+        with self._lock:
+            for (name, labels), h in sorted(self.histograms.items()):
+                label = name + _format_labels(labels)
+                result[label] = {'count': h.count, 'max_ms': h.max * 1e3}
+                for p in PERCENTILES:
+                    result[label][f'p{p}_ms'] = h.percentile(p) * 1e3
+        return result
+
+    def to_prometheus(self):
+        """Dump toàn bộ registry theo text format của Prometheus"""
+        lines = []
+        with self._lock:
+            families = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                families.setdefault(name, []).append((labels, value))
+            for name, samples in families.items():
+                metric = f"{PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in samples:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+            if self.histograms:
+                metric = f"{PREFIX}_span_seconds"
+                lines.append(f"# HELP {metric} Thời gian xử lý theo span")
+                lines.append(f"# TYPE {metric} histogram")
+            for (name, labels), h in sorted(self.histograms.items()):
+                span = (('span', name),) + labels
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    le = "+Inf" if math.isinf(bound) else f"{bound:g}"
+                    lines.append(f"{metric}_bucket{_format_labels(span, [('le', le)])} {cumulative}")
+                lines.append(f"{metric}_sum{_format_labels(span)} {h.sum:.6f}")
+                lines.append(f"{metric}_count{_format_labels(span)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Registry của process (dùng chung mọi session / mọi thread)
+REGISTRY = Registry()
+
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def _get_logger():
+    """Logger JSON (chỉ tạo handler khi METRICS_LOG được cấu hình)"""
+    global _logger
+    if _logger is None and METRICS_LOG:
+        with _logger_lock:
+            if _logger is None:
+                logger = logging.getLogger("ros.metrics")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                if METRICS_LOG == "stderr":
+                    handler = logging.StreamHandler(sys.stderr)
+                else:
+                    handler = logging.FileHandler(METRICS_LOG, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def log_event(event, **fields):
+    """Ghi 1 dòng JSON log (bỏ qua nếu METRICS_LOG tắt)"""
+    logger = _get_logger()
+    if logger is not None:
+        record = {'ts': time.time(), 'event': event, **fields}
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def observe(name, seconds, *registries, **labels):
+    """Ghi 1 giá trị thời gian vào registry process và các registry truyền thêm"""
+    REGISTRY.observe(name, seconds, **labels)
+    for registry in registries:
+        registry.observe(name, seconds, **labels)
+
+
+def observe_timings(prefix, timings, *registries, **fields):
+    """
+    Ghi dict timings {stage: giây} (từ excel_reader / bulk_loader) thành các span
+    '<prefix>_<stage>' + 1 dòng JSON log
+    """
+    for stage, seconds in timings.items():
+        observe(f"{prefix}_{stage}", seconds, *registries)
+    log_event(prefix, **fields, **{f"{stage}_ms": round(s * 1e3, 3) for stage, s in timings.items()})
+
+
+@contextmanager
+def span(name, *registries, **fields):
+    """
+    Đo thời gian 1 đoạn code:
+
+        with metrics.span('load_database', session_registry):
+            ...
+
+    Ghi cả khi đoạn code raise exception (field error=True trong log)
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe(name, seconds, *registries)
+        log_event('span', span=name, ms=round(seconds * 1e3, 3), error=error, **fields)
+
+
+def write_prometheus(path, registry=REGISTRY):
+    """Ghi file text Prometheus (ghi file tạm rồi rename)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.to_prometheus())
+    os.replace(tmp_path, path)
+
+
+def _write_on_exit():
+    try:
+        write_prometheus(METRICS_PROM_FILE)
+    except Exception:
+        pass  # Metrics chỉ để chẩn đoán, không làm script lỗi khi thoát
+
+
+if METRICS_PROM_FILE:
+    atexit.register(_write_on_exit)
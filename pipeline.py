@@ -0,0 +1,139 @@
+"""
+Pipeline ingestion: đọc/làm sạch Excel song song với ghi database
+- Parser chạy ở thread riêng, đẩy từng chunk đã làm sạch vào queue có giới hạn
+- Writer (1 hoặc nhiều thread) lấy chunk ra ghi database
+- Queue đầy -> parser chờ (backpressure): memory tối đa ~ (queue + writer) chunk
+- Lỗi ở bất kỳ stage nào -> dừng toàn bộ pipeline và raise lại ở thread gọi
+Tổng thời gian ~ max(parse, write) thay vì parse + write
+(openpyxl giữ GIL khi parse, driver database nhả GIL khi chờ network)
+"""
+
+import os
+import queue
+import threading
+
+# Số chunk tối đa nằm chờ trong queue (có thể override trong .env)
+QUEUE_CHUNKS = int(os.getenv("PIPELINE_QUEUE_CHUNKS", "4"))
+# Số writer thread ghi database song song
+WRITERS = int(os.getenv("PIPELINE_WRITERS", "1"))
+
+_DONE = object()
+
+
+class _Producer:
+    """Thread chạy iterable, đẩy từng phần tử vào queue có giới hạn"""
+
+    def __init__(self, iterable, max_queued, consumers=1):
+        self.queue = queue.Queue(maxsize=max(1, max_queued))
+        self.stop = threading.Event()
+        self.error = None
+        self._consumers = consumers
+        self._thread = threading.Thread(target=self._run, args=(iterable,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # put có timeout để thoát được khi consumer đã dừng (không block mãi khi queue đầy)
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put(item):
+                    break
+        except BaseException as e:
+            self.error = e
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+            for _ in range(self._consumers):
+                self._put(_DONE)
+
+    def get(self):
+        """Phần tử tiếp theo, _DONE khi hết"""
+        while True:
+            try:
+                return self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.stop.is_set():
+                    return _DONE
+
+    def close(self):
+        self.stop.set()
+        self._thread.join()
+
+
+def prefetch(iterable, max_queued=QUEUE_CHUNKS):
+    """
+    Chạy iterable (vd: iter_clean_chunks) ở thread riêng, trước tối đa max_queued phần tử
+
+    Dùng khi chỉ có 1 writer (vd: COPY trong 1 transaction của bulk_upsert):
+
+        for chunk in prefetch(iter_clean_chunks(path)):
+            copy_frame(conn, chunk, stage_table)
+    """
+    producer = _Producer(iterable, max_queued)
+    try:
+        while True:
+            item = producer.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        producer.close()
+    if producer.error is not None:
+        raise producer.error
+
+
+def run_pipeline(iterable, write, writers=WRITERS, max_queued=QUEUE_CHUNKS):
+    """
+    Parser thread -> queue có giới hạn -> `writers` thread gọi write(item)
+
+    Args:
+        iterable: Nguồn chunk (vd: iter_clean_chunks)
+        write: Hàm ghi 1 chunk (mỗi writer thread tự mở connection riêng)
+        writers: Số writer thread
+        max_queued: Số chunk tối đa chờ trong queue
+
+    Returns:
+        List kết quả của write() (thứ tự hoàn thành)
+    """
+    writers = max(1, writers)
+    producer = _Producer(iterable, max_queued, consumers=writers)
+    results = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = producer.get()
+            if item is _DONE or producer.stop.is_set():
+                return
+            try:
+                result = write(item)
+            except BaseException as e:
+                with lock:
+                    errors.append(e)
+                producer.stop.set()
+                return
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    producer.close()
+
+    if producer.error is not None:
+        raise producer.error
+    if errors:
+        raise errors[0]
+    return results
@@ -0,0 +1,213 @@
+"""
+Tự động refresh các ItemStore ở background (1 thread / process, dùng chung mọi session)
+- Mỗi site 1 ItemStore (shard riêng); mọi site được load sẵn (preload) ngay khi process khởi động
+  -> session đầu tiên của site không phải chờ load toàn bộ
+- PostgreSQL: LISTEN kênh revision (script ingest gửi NOTIFY khi commit, payload = tên shard)
+  -> refresh ngay store của shard đó
+- Ngoài ra kiểm tra revision định kỳ (REFRESH_INTERVAL_MINUTES): thay cho NOTIFY khi
+  không LISTEN được (SQLite, connection qua pgbouncer transaction mode, mất kết nối)
+- Refresh chạy trong thread này: tạo bảng mới rồi swap reference (ItemStore),
+  session không bao giờ chờ load và không thấy cache đang cập nhật dở
+"""
+
+import os
+import queue
+import select
+import threading
+import time
+
+import metrics
+from revision import REVISION_CHANNEL
+
+# Bật/tắt tự động refresh (có thể override trong .env)
+AUTO_REFRESH = os.getenv("AUTO_REFRESH", "1") == "1"
+# Chu kỳ kiểm tra revision khi không có NOTIFY (phút)
+REFRESH_INTERVAL_MINUTES = float(os.getenv("REFRESH_INTERVAL_MINUTES", "30"))
+# Thời gian chờ trước khi thử LISTEN lại sau khi mất kết nối (giây)
+LISTEN_RETRY_SECONDS = 30
+
+
+class _Listener:
+    """Connection riêng (không thuộc pool) LISTEN kênh revision - chỉ hỗ trợ psycopg2"""
+
+    def __init__(self, engine):
+        raw = engine.raw_connection()
+        self.conn = raw.driver_connection
+        if not hasattr(self.conn, 'poll'):
+            raw.close()
+            raise RuntimeError("LISTEN chỉ hỗ trợ psycopg2")
+        raw.detach()  # Giữ connection suốt đời thread, không chiếm chỗ của pool
+        self.conn.autocommit = True
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {REVISION_CHANNEL}")
+
+    def wait(self, timeout, wakeup_fd):
+        """Chờ NOTIFY tối đa timeout giây, trả về set tên bảng được báo thay đổi"""
+        ready, _, _ = select.select([self.conn, wakeup_fd], [], [], timeout)
+        tables = set()
+        if self.conn in ready:
+            self.conn.poll()
+            while self.conn.notifies:
+                tables.add(self.conn.notifies.pop(0).payload)
+        return tables
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class StoreRefresher:
+    """
+    Thread refresh các ItemStore theo NOTIFY hoặc theo chu kỳ
+
+    Args:
+        engine: SQLAlchemy Engine
+        stores: Các ItemStore cần giữ mới (thêm sau bằng watch() / preload())
+        interval_minutes: Chu kỳ kiểm tra revision
+        enabled: False = không refresh (đổi được lúc chạy, vd: trang Settings)
+    """
+
+    def __init__(self, engine, stores=(), interval_minutes=REFRESH_INTERVAL_MINUTES, enabled=AUTO_REFRESH):
+        self.stores = {store.table_name: store for store in stores}
+        self.engine = engine
+        self.interval_minutes = interval_minutes
+        self.enabled = enabled
+        self.listening = False
+        self.last_refresh = None      # thời điểm (time.time()) kiểm tra xong gần nhất
+        self.last_changed = None      # số dòng thay đổi của store refresh gần nhất (None = load lại toàn bộ)
+        self.last_error = None
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._pending = queue.SimpleQueue()   # store chờ load sẵn (preload)
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name='store-refresher')
+        self._thread.start()
+
+    def watch(self, store):
+        """Theo dõi thêm 1 store (vd: site vừa được chọn lần đầu trên dashboard)"""
+        if store.table_name not in self.stores:
+            # Tạo dict mới rồi gán: thread refresh đang duyệt dict cũ không bị ảnh hưởng
+            self.stores = {**self.stores, store.table_name: store}
+
+    def preload(self, stores):
+        """
+        Theo dõi và load sẵn các store chưa theo dõi (vd: mọi site khi process khởi động)
+        Load chạy trong thread refresh, không chặn thread gọi
+        """
+        added = False
+        for store in stores:
+            if store.table_name not in self.stores:
+                self.watch(store)
+                self._pending.put(store)
+                added = True
+        if added:
+            self.wakeup()
+
+    def _open_pending(self):
+        while True:
+            try:
+                store = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                # Có snapshot local -> dùng ngay, không thì load toàn bộ từ database
+                with metrics.span('preload', table=store.table_name):
+                    store.open(self.engine)
+            except Exception as e:
+                # Session mở store sẽ thử load lại và báo lỗi
+                self.last_error = str(e)
+
+    def configure(self, interval_minutes=None, enabled=None):
+        """Đổi chu kỳ / bật tắt, thread áp dụng ngay"""
+        if interval_minutes is not None:
+            self.interval_minutes = max(0.01, float(interval_minutes))
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        self.wakeup()
+
+    def wakeup(self):
+        try:
+            os.write(self._wakeup_w, b'x')
+        except BlockingIOError:
+            pass  # Pipe đầy: thread chắc chắn sẽ thức dậy
+
+    def stop(self):
+        self._stopped = True
+        self.wakeup()
+        self._thread.join(5)
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _refresh(self, reason, tables=None):
+        # tables = None: mọi store đang theo dõi
+        errors = []
+        for table_name, store in self.stores.items():
+            if tables is not None and table_name not in tables:
+                continue
+            try:
+                with metrics.span('auto_refresh', reason=reason, table=table_name):
+                    self.last_changed = store.refresh(self.engine)
+            except Exception as e:
+                # Lỗi đã lưu ở store.last_error, session tiếp tục dùng data đang có
+                errors.append(str(e))
+        self.last_error = errors[0] if errors else None
+        self.last_refresh = time.time()
+
+    def _run(self):
+        listener, retry_at = None, 0.0
+        next_check = time.monotonic() + self.interval_minutes * 60
+        while not self._stopped:
+            if listener is None and self.enabled and time.monotonic() >= retry_at:
+                try:
+                    if self.engine.dialect.name == 'postgresql':
+                        listener = _Listener(self.engine)
+                        self.listening = True
+                except Exception:
+                    retry_at = time.monotonic() + LISTEN_RETRY_SECONDS
+
+            timeout = max(0.0, next_check - time.monotonic())
+            tables = set()
+            if listener is not None:
+                try:
+                    tables = listener.wait(timeout, self._wakeup_r)
+                except Exception:
+                    # Mất connection LISTEN: quay về kiểm tra định kỳ, thử LISTEN lại sau
+                    listener.close()
+                    listener, self.listening = None, False
+                    retry_at = time.monotonic() + LISTEN_RETRY_SECONDS
+                    # Có thể đã bỏ lỡ NOTIFY -> kiểm tra revision ngay
+                    next_check = time.monotonic()
+            else:
+                select.select([self._wakeup_r], [], [], timeout)
+            self._drain_wakeup()
+            if self._stopped:
+                break
+            self._open_pending()
+
+            if not self.enabled:
+                # Tắt: bỏ NOTIFY nhận được, đóng LISTEN (không giữ connection vô ích)
+                if listener is not None:
+                    listener.close()
+                    listener, self.listening = None, False
+                next_check = time.monotonic() + self.interval_minutes * 60
+                continue
+            if tables & self.stores.keys():
+                self._refresh('notify', tables)
+                next_check = time.monotonic() + self.interval_minutes * 60
+            elif time.monotonic() >= next_check:
+                self._refresh('interval')
+                next_check = time.monotonic() + self.interval_minutes * 60
+            else:
+                # Đổi cấu hình: chu kỳ mới ngắn hơn -> kiểm tra sớm hơn
+                next_check = min(next_check, time.monotonic() + self.interval_minutes * 60)
+
+        if listener is not None:
+            listener.close()
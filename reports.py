@@ -0,0 +1,258 @@
+"""
+Tạo report Excel ở background cho trang Reports
+- Job chạy trên thread pool riêng (REPORT_WORKERS), script Streamlit chỉ submit rồi poll trạng thái
+- Đọc database bằng server-side cursor (stream_results), ghi từng batch dòng
+- Ghi Excel bằng openpyxl write-only (ghi thẳng ra file, memory không tăng theo số dòng)
+- Report của 1 site (shard ro_items / decision của site đó)
+- File đã tạo được cache trên đĩa, key = loại report + site + khoảng ngày + version data
+  (revision của shard ro_items + rule quyết định / số dòng + thời điểm cuối của decision_log):
+  yêu cầu lại cùng report khi data chưa đổi -> trả file có sẵn ngay
+"""
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+import pyarrow as pa
+from openpyxl import Workbook
+from sqlalchemy import text
+
+import metrics
+from db import begin, connect
+from decision_log import DECISION_LOG_TABLE, ensure_decision_log
+from revision import current_revision
+from rules import load_rules
+from sites import DEFAULT_SITE, shard_table
+
+# Folder chứa file report đã tạo (có thể override trong .env)
+REPORT_DIR = os.getenv("REPORT_DIR", os.path.join("cache", "reports"))
+# Số report chạy song song
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+# Số file report giữ lại trong cache (file cũ nhất bị xóa)
+REPORT_CACHE_FILES = int(os.getenv("REPORT_CACHE_FILES", "50"))
+# Số dòng đọc từ cursor mỗi lần
+REPORT_FETCH_ROWS = int(os.getenv("REPORT_FETCH_ROWS", "10000"))
+# Thời gian (giây) giữ trạng thái job đã xong trong memory
+REPORT_JOB_TTL = 3600
+
+
+def _date_bounds(start, end):
+    # Khoảng ngày [start, end] (end tính cả ngày) -> [start, end + 1 ngày)
+    start = start or date(1970, 1, 1)
+    end = end or date.today()
+    return {'start': start, 'end': end + timedelta(days=1)}
+
+
+def _decision_report(conn, start, end, site):
+    params = dict(_date_bounds(start, end), site=site)
+    where = f"FROM {DECISION_LOG_TABLE} WHERE logged_at >= :start AND logged_at < :end AND site = :site"
+    version = conn.execute(text(f"SELECT COUNT(*), MAX(logged_at) {where}"), params).first()
+    return {
+        'sheet': 'Decisions',
+        'columns': ['Time (UTC)', 'Item Code', 'Stock', 'Requested Qty', 'Avg Consume',
+                    'Threshold', 'Decision', 'Session'],
+        'sql': f"""
+            SELECT logged_at, item_code, stock, requested_qty, avg_consume, threshold, result, session_id
+            {where} ORDER BY logged_at
+        """,
+        'params': params,
+        'version': f"{version[0]}:{version[1]}",
+    }
+
+
+def _inventory_report(conn, start, end, site, table_name='ro_items'):
+    table_name = shard_table(table_name, site)
+    revision, base_revision = current_revision(conn, table_name)
+    rules = load_rules(conn, site)
+
+    def apply_rules(rows):
+        # Threshold / moq theo rule của site, tính vector cho cả batch dòng
+        codes = pa.array([row[0] for row in rows], type=pa.string())
+        avg = np.array([np.nan if row[1] is None else float(row[1]) for row in rows])
+        params = rules.compile(codes)
+        threshold = rules.thresholds(avg, params)
+        return [(*row, t, m) for row, t, m in zip(rows, threshold.tolist(), params['moq'].tolist())]
+
+    return {
+        'sheet': 'Inventory',
+        'columns': ['Item Code', 'Avg Consume', 'Threshold', 'Min Order Qty'],
+        'sql': f"SELECT item_code, avg_consume FROM {table_name} ORDER BY item_code",
+        'params': {},
+        'transform': apply_rules,
+        'version': f"{base_revision}:{revision}:{rules.key}",
+        # Snapshot catalog hiện tại: khoảng ngày không ảnh hưởng nội dung
+        'dated': False,
+    }
+
+
+# Loại report -> hàm trả về query + version data (report chưa có hàm -> chưa hỗ trợ)
+REPORTS = {
+    'Daily Summary': _decision_report,
+    'Weekly Inventory': _inventory_report,
+}
+
+
+def write_report(conn, spec, path, fetch_rows=REPORT_FETCH_ROWS):
+    """
+    Stream kết quả query vào file Excel (ghi file tạm rồi rename)
+
+    Returns:
+        Số dòng đã ghi
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(spec['sheet'])
+    sheet.append(spec['columns'])
+    rows = 0
+    result = conn.execution_options(stream_results=True, max_row_buffer=fetch_rows).execute(
+        text(spec['sql']), spec['params']
+    )
+    transform = spec.get('transform')
+    for batch in result.partitions(fetch_rows):
+        if transform is not None:
+            batch = transform(batch)
+        for row in batch:
+            sheet.append(list(row))
+        rows += len(batch)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, path)
+    return rows
+
+
+class ReportJob:
+    """Trạng thái 1 report: queued -> running -> done / error"""
+
+    def __init__(self, report_type, start, end, path, site=DEFAULT_SITE):
+        self.id = uuid.uuid4().hex
+        self.report_type = report_type
+        self.site = site
+        self.start = start
+        self.end = end
+        self.path = path
+        self.status = 'queued'
+        self.rows = None
+        self.error = None
+        self.cached = False
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ('done', 'error')
+
+    @property
+    def file_name(self):
+        name = f"{self.report_type.lower().replace(' ', '_')}_{self.site}"
+        if self.start and self.end:
+            name += f"_{self.start:%Y%m%d}-{self.end:%Y%m%d}"
+        return f"{name}.xlsx"
+
+
+class ReportService:
+    """
+    Thread pool chạy report + cache file theo (loại, site, khoảng ngày, version data)
+    1 instance / process (dùng chung mọi session)
+    """
+
+    def __init__(self, engine, report_dir=REPORT_DIR, workers=REPORT_WORKERS,
+                 cache_files=REPORT_CACHE_FILES):
+        self.engine = engine
+        self.report_dir = report_dir
+        self.cache_files = cache_files
+        self.jobs = {}
+        self._running = {}   # path -> job đang chạy (cùng report chỉ tạo 1 lần)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='report')
+        self._tables_ready = False
+
+    def _ensure_tables(self):
+        # decision_log chưa có khi chưa ai Check Decision: tạo trong transaction riêng (commit),
+        # connect() của submit / worker chỉ đọc và rollback khi đóng
+        if self._tables_ready:
+            return
+        with begin(self.engine) as conn:
+            ensure_decision_log(conn)
+        self._tables_ready = True
+
+    def _spec(self, conn, report_type, start, end, site):
+        spec = REPORTS[report_type](conn, start, end, site)
+        if spec.get('dated', True):
+            key = f"{report_type}|{site}|{start}|{end}|{spec['version']}"
+        else:
+            key = f"{report_type}|{site}|{spec['version']}"
+        digest = hashlib.sha256(key.encode()).hexdigest()[:24]
+        return spec, os.path.join(self.report_dir, f"{digest}.xlsx")
+
+    def submit(self, report_type, start=None, end=None, site=DEFAULT_SITE):
+        """
+        Yêu cầu 1 report (chỉ đọc version data, không chờ tạo file)
+
+        Returns:
+            ReportJob: done ngay nếu file đã có trong cache
+        """
+        if report_type not in REPORTS:
+            raise ValueError(f"Report '{report_type}' chưa được hỗ trợ")
+        self._ensure_tables()
+        with connect(self.engine) as conn:
+            spec, path = self._spec(conn, report_type, start, end, site)
+
+        with self._lock:
+            now = time.time()
+            for job_id in [j.id for j in self.jobs.values()
+                           if j.done and now - j.finished_at > REPORT_JOB_TTL]:
+                del self.jobs[job_id]
+            running = self._running.get(path)
+            if running is not None:
+                return running
+            job = ReportJob(report_type, start, end, path, site)
+            self.jobs[job.id] = job
+            if os.path.exists(path):
+                os.utime(path)  # Đánh dấu vừa dùng (giữ lại khi dọn cache)
+                job.status, job.cached, job.finished_at = 'done', True, time.time()
+                metrics.REGISTRY.inc('report_cache_hits', report=report_type)
+                return job
+            self._running[path] = job
+        self._pool.submit(self._run, job, spec)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _run(self, job, spec):
+        job.status = 'running'
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            with metrics.span('report', report=job.report_type):
+                with connect(self.engine) as conn:
+                    job.rows = write_report(conn, spec, job.path)
+            self._evict()
+            status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            status = 'error'
+            metrics.REGISTRY.inc('report_errors', report=job.report_type)
+        # finished_at trước status: session đang poll thấy done thì đã có đủ thông tin
+        job.finished_at = time.time()
+        job.status = status
+        with self._lock:
+            self._running.pop(job.path, None)
+
+    def _evict(self):
+        # Giữ cache_files file dùng gần nhất
+        files = [
+            os.path.join(self.report_dir, f) for f in os.listdir(self.report_dir)
+            if f.endswith('.xlsx')
+        ]
+        if len(files) <= self.cache_files:
+            return
+        files.sort(key=os.path.getmtime, reverse=True)
+        for path in files[self.cache_files:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,81 @@
+"""
+Quản lý revision (phiên bản thay đổi) của bảng ro_items
+- Mỗi lần ingest tăng revision của bảng lên 1 (bảng table_revisions)
+- Các dòng được INSERT/UPDATE được gắn revision đó (cột revision)
+- Replace toàn bộ bảng -> base_revision = revision mới, client phải load lại toàn bộ
+  (dòng của bảng replace giữ revision 0)
+- PostgreSQL: next_revision gửi NOTIFY trên kênh REVISION_CHANNEL (payload = tên bảng),
+  được gửi khi transaction ghi data commit -> dashboard refresh ngay (xem refresher.py)
+"""
+
+from sqlalchemy import inspect, text
+
+REVISION_TABLE = 'table_revisions'
+REVISION_CHANNEL = 'table_revisions'
+
+
+def ensure_revision_table(conn):
+    """Tạo bảng table_revisions nếu chưa có"""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {REVISION_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            revision BIGINT NOT NULL,
+            base_revision BIGINT NOT NULL
+        )
+    """))
+
+
+def ensure_revision(conn, table_name):
+    """Tạo bảng table_revisions và cột revision (+ index) cho bảng data nếu chưa có"""
+    ensure_revision_table(conn)
+    columns = [c['name'] for c in inspect(conn).get_columns(table_name)]
+    if 'revision' not in columns:
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN revision BIGINT DEFAULT 0"))
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {table_name}_revision_idx ON {table_name} (revision)"
+    ))
+
+
+def next_revision(conn, table_name, full_replace=False):
+    """
+    Tăng revision của bảng (gọi trong transaction ghi data)
+    Row lock trên table_revisions giữ đến khi commit -> revision commit theo đúng thứ tự
+
+    Args:
+        full_replace: True nếu toàn bộ bảng được thay thế (client phải load lại toàn bộ)
+
+    Returns:
+        Revision mới
+    """
+    conn.execute(text(f"""
+        INSERT INTO {REVISION_TABLE} (table_name, revision, base_revision)
+        VALUES (:t, 0, 0)
+        ON CONFLICT (table_name) DO NOTHING
+    """), {'t': table_name})
+    base = ", base_revision = revision + 1" if full_replace else ""
+    conn.execute(text(f"""
+        UPDATE {REVISION_TABLE} SET revision = revision + 1{base}
+        WHERE table_name = :t
+    """), {'t': table_name})
+    if conn.dialect.name == 'postgresql':
+        # Chỉ gửi khi commit (rollback -> không ai nhận)
+        conn.execute(text("SELECT pg_notify(:channel, :t)"), {'channel': REVISION_CHANNEL, 't': table_name})
+    return current_revision(conn, table_name)[0]
+
+
+def current_revision(conn, table_name):
+    """
+    Revision hiện tại của bảng
+
+    Returns:
+        (revision, base_revision) - (0, 0) nếu bảng chưa từng được ingest có revision
+    """
+    if not inspect(conn).has_table(REVISION_TABLE):
+        return 0, 0
+    row = conn.execute(
+        text(f"SELECT revision, base_revision FROM {REVISION_TABLE} WHERE table_name = :t"),
+        {'t': table_name},
+    ).first()
+    if row is None:
+        return 0, 0
+    return int(row[0]), int(row[1])
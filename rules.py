@@ -0,0 +1,202 @@
+"""
+Rule quyết định YES/NO theo nhóm item (thay cho công thức cố định stock + ro <= 2 * |avg_consume|)
+- Tham số của mỗi item:
+  multiplier   hệ số nhân |avg_consume| (mặc định THRESHOLD_FACTOR)
+  safety_stock tồn kho an toàn: ngưỡng không thấp hơn giá trị này
+  moq          số lượng order tối thiểu: order ít hơn vẫn phải nhận đủ moq
+- YES khi: stock + max(qty, moq) <= max(multiplier * |avg_consume|, safety_stock)
+- Rule theo nhóm (category): regex trên item_code (RE2 của Arrow, khớp 1 phần - dùng ^ để khớp đầu mã),
+  rule đứng trước thắng; rule theo item_code (override từng item) thắng mọi rule nhóm
+- Rule không ghi 1 tham số -> lấy từ rule khớp tiếp theo, cuối cùng là default
+- Nguồn rule: bảng decision_rules (theo priority) trước, rồi file DECISION_RULES_FILE (JSON):
+    {"default": {"multiplier": 2},
+     "rules": [{"name": "Hóa chất", "pattern": "^CH-", "multiplier": 3, "moq": 10},
+               {"item_code": "A1", "safety_stock": 50, "site": "hn1"}]}
+  Rule có site chỉ áp dụng cho site đó
+- compile() tính tham số cho cả catalog 1 lần (khi load / refresh ItemTable):
+  mỗi rule nhóm 1 phép match vector, override từng item 1 hash join
+  -> tra 1 item hay đánh giá lại cả catalog đều chỉ là phép tính trên mảng
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from sqlalchemy import inspect, text
+
+# Hệ số ngưỡng mặc định (item không có rule nào đặt multiplier)
+THRESHOLD_FACTOR = 2
+# File rule (có thể override trong .env)
+DECISION_RULES_FILE = os.getenv("DECISION_RULES_FILE", "decision_rules.json")
+DECISION_RULES_TABLE = 'decision_rules'
+
+FIELDS = ('multiplier', 'moq', 'safety_stock')
+DEFAULTS = {'multiplier': float(THRESHOLD_FACTOR), 'moq': 0.0, 'safety_stock': 0.0}
+
+
+def ensure_rules_table(conn):
+    """Tạo bảng decision_rules nếu chưa có (rule sửa trực tiếp bằng SQL)"""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {DECISION_RULES_TABLE} (
+            priority INTEGER NOT NULL DEFAULT 0,
+            name TEXT,
+            site TEXT,
+            pattern TEXT,
+            item_code TEXT,
+            multiplier NUMERIC,
+            moq NUMERIC,
+            safety_stock NUMERIC
+        )
+    """))
+
+
+def _clean_rule(rule):
+    # Rule hợp lệ: đúng 1 trong pattern / item_code, tham số là số >= 0 (None = không đặt)
+    name = rule.get('name') or rule.get('item_code') or rule.get('pattern')
+    has_pattern, has_item = rule.get('pattern') is not None, rule.get('item_code') is not None
+    if has_pattern == has_item:
+        raise ValueError(f"Rule '{name}': cần đúng 1 trong 'pattern' hoặc 'item_code'")
+    clean = {'name': name}
+    if has_pattern:
+        clean['pattern'] = str(rule['pattern'])
+        try:
+            pc.match_substring_regex(pa.array([''], type=pa.string()), clean['pattern'])
+        except pa.ArrowInvalid as e:
+            raise ValueError(f"Rule '{name}': {e}")
+    else:
+        clean['item_code'] = str(rule['item_code']).strip()
+    for field in FIELDS:
+        value = rule.get(field)
+        if value is not None:
+            value = float(value)
+            if not value >= 0:
+                raise ValueError(f"Rule '{name}': {field} phải >= 0")
+        clean[field] = value
+    return clean
+
+
+class RuleSet:
+    """
+    Danh sách rule của 1 site (không sửa sau khi tạo)
+
+    Args:
+        default: Tham số mặc định (thiếu -> DEFAULTS)
+        rules: List dict rule theo thứ tự ưu tiên
+    """
+
+    def __init__(self, default=None, rules=()):
+        self.default = dict(DEFAULTS)
+        for field, value in (default or {}).items():
+            if field in FIELDS and value is not None:
+                self.default[field] = float(value)
+        self.rules = [_clean_rule(rule) for rule in rules]
+        # Key đổi khi rule đổi -> ItemTable / report cache biết cần tính lại
+        raw = json.dumps([self.default, self.rules], sort_keys=True)
+        self.key = hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+    def __len__(self):
+        return len(self.rules)
+
+    def compile(self, codes):
+        """
+        Tham số của từng item
+
+        Args:
+            codes: Item code (Arrow StringArray hoặc list)
+
+        Returns:
+            dict field -> mảng float64 (cùng thứ tự codes). Tham số không rule nào đặt là
+            view broadcast của giá trị default (không tốn memory, chỉ đọc)
+        """
+        if not isinstance(codes, pa.Array):
+            codes = pa.array([str(code) for code in codes], type=pa.string())
+        n = len(codes)
+        params = {field: np.broadcast_to(np.float64(self.default[field]), (n,)) for field in FIELDS}
+
+        def assign(field, mask, values):
+            if not params[field].flags.writeable:
+                params[field] = params[field].copy()
+            params[field][mask] = values
+
+        # Rule nhóm áp dụng từ cuối lên: rule đứng trước ghi đè -> rule đầu tiên khớp thắng
+        for rule in reversed([r for r in self.rules if 'pattern' in r]):
+            fields = [field for field in FIELDS if rule[field] is not None]
+            if not fields or n == 0:
+                continue
+            mask = pc.match_substring_regex(codes, rule['pattern']).fill_null(False)
+            mask = mask.to_numpy(zero_copy_only=False)
+            for field in fields:
+                assign(field, mask, rule[field])
+
+        # Override từng item: 1 hash join cho tất cả (item có nhiều rule: gộp, rule đứng trước thắng)
+        overrides = {}
+        for rule in self.rules:
+            if 'item_code' in rule:
+                merged = overrides.setdefault(rule['item_code'], dict.fromkeys(FIELDS))
+                for field in FIELDS:
+                    if merged[field] is None:
+                        merged[field] = rule[field]
+        if overrides and n:
+            index = pc.index_in(codes, value_set=pa.array(list(overrides), type=pa.string()))
+            index = index.fill_null(-1).to_numpy(zero_copy_only=False)
+            found = index >= 0
+            for field in FIELDS:
+                values = np.array([np.nan if r[field] is None else r[field] for r in overrides.values()])
+                if np.isnan(values).all():
+                    continue
+                picked = np.full(n, np.nan)
+                picked[found] = values[index[found]]
+                mask = ~np.isnan(picked)
+                assign(field, mask, picked[mask])
+        return params
+
+    @staticmethod
+    def thresholds(avg, params):
+        """Ngưỡng của từng item: max(multiplier * |avg_consume|, safety_stock)"""
+        return np.maximum(params['multiplier'] * np.abs(avg), params['safety_stock'])
+
+
+def order_ok(stock, qty, threshold, moq):
+    """YES/NO (scalar hoặc mảng numpy): stock + max(qty, moq) <= threshold"""
+    if isinstance(qty, np.ndarray) or isinstance(moq, np.ndarray):
+        return stock + np.maximum(qty, moq) <= threshold
+    # 1 item: phép so sánh Python (ufunc numpy trên scalar chậm hơn vài lần)
+    return stock + max(qty, moq) <= threshold
+
+
+DEFAULT_RULES = RuleSet()
+
+
+def load_rules(conn=None, site=None, path=None):
+    """
+    Rule của 1 site: bảng decision_rules (nếu có) rồi file DECISION_RULES_FILE
+
+    Args:
+        conn: Connection đọc bảng rule (None = chỉ đọc file, vd: khởi động từ snapshot khi offline)
+        site: Site (None = chỉ rule không ghi site)
+        path: File rule (mặc định DECISION_RULES_FILE)
+
+    Returns:
+        RuleSet
+
+    Raises:
+        ValueError: rule sai (regex lỗi, tham số âm, ...)
+    """
+    path = DECISION_RULES_FILE if path is None else path
+    config = {}
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+    rules = []
+    if conn is not None and inspect(conn).has_table(DECISION_RULES_TABLE):
+        rows = conn.execute(text(f"""
+            SELECT name, pattern, item_code, multiplier, moq, safety_stock FROM {DECISION_RULES_TABLE}
+            WHERE site IS NULL OR site = :site
+            ORDER BY priority, name
+        """), {'site': site}).mappings().all()
+        rules.extend(dict(row) for row in rows)
+    rules.extend(rule for rule in config.get('rules', []) if rule.get('site') in (None, site))
+    return RuleSet(config.get('default'), rules)
@@ -0,0 +1,264 @@
+"""
+Nhiều site (kho) trong cùng 1 database: key của ro_items là (site, item_code)
+- PostgreSQL: ro_items là bảng partitioned LIST (site), mỗi site 1 partition ("shard")
+  {table}_{site}, PRIMARY KEY (site, item_code)
+- SQLite (không có partition): mỗi site 1 bảng {table}_{site} cùng cấu trúc
+- Mọi thao tác của 1 site (ingest, dashboard cache, viewer, history, revision) đọc / ghi
+  thẳng shard của site đó -> thêm site không làm tăng chi phí của site khác
+- Bảng table_sites ghi danh sách site của mỗi bảng (cho ô chọn site trên dashboard)
+- Site lấy từ tham số --site, hoặc từ tên file (SITE_FILE_PATTERN), mặc định DEFAULT_SITE
+- Bảng ro_items cũ (chỉ có item_code) được chuyển thành shard của DEFAULT_SITE ở lần ghi đầu tiên
+  (hoặc khi dashboard khởi động)
+"""
+
+import os
+import re
+
+from sqlalchemy import inspect, text
+
+from history import history_tables
+
+SITES_TABLE = 'table_sites'
+
+# Site của data không ghi rõ site (có thể override trong .env)
+DEFAULT_SITE = os.getenv("DEFAULT_SITE", "main")
+# Regex lấy site từ tên file (group 'site'), vd: RO_site-hn1_2024.xlsx -> hn1
+SITE_FILE_PATTERN = os.getenv(
+    "SITE_FILE_PATTERN", r"(?:^|[_\-\s.])site[-_=](?P<site>[A-Za-z0-9]+)"
+)
+
+_VALID_SITE = re.compile(r"^[a-z0-9_]{1,32}$")
+
+
+def normalize_site(site):
+    """Site dạng chuẩn (chữ thường, chữ số, '_') - dùng trong tên bảng và literal SQL"""
+    site = str(site).strip().lower()
+    if not _VALID_SITE.match(site):
+        raise ValueError(f"Site không hợp lệ: '{site}' (chỉ gồm chữ, số, '_', tối đa 32 ký tự)")
+    return site
+
+
+def shard_table(table_name, site=None):
+    """Tên shard của 1 site, vd: ro_items + hn1 -> ro_items_hn1"""
+    return f"{table_name}_{normalize_site(site or DEFAULT_SITE)}"
+
+
+def site_from_path(path, pattern=SITE_FILE_PATTERN):
+    """Site ghi trong tên file, None nếu không có"""
+    match = re.search(pattern, os.path.basename(path), re.IGNORECASE)
+    return normalize_site(match.group('site')) if match else None
+
+
+def resolve_site(site=None, path=None):
+    """Site của 1 lần ingest: tham số --site > tên file > DEFAULT_SITE"""
+    if site:
+        return normalize_site(site)
+    return (site_from_path(path) if path else None) or normalize_site(DEFAULT_SITE)
+
+
+def _is_postgres(conn):
+    return conn.dialect.name == 'postgresql'
+
+
+def shard_columns(site, constraint=None):
+    """
+    Cột của 1 shard (site mặc định = site của shard -> COPY / INSERT không cần cột site)
+
+    Args:
+        constraint: Tên CHECK (site = ...) - bảng staging của PostgreSQL cần để
+            ATTACH PARTITION không phải quét lại toàn bộ bảng
+    """
+    check = f" CONSTRAINT {constraint} CHECK (site = '{site}')" if constraint else ""
+    return f"""
+        site TEXT NOT NULL DEFAULT '{site}'{check},
+        item_code TEXT NOT NULL,
+        avg_consume NUMERIC,
+        revision BIGINT DEFAULT 0
+    """
+
+
+def ensure_parent(conn, table_name):
+    """
+    PostgreSQL: tạo bảng partitioned nếu chưa có
+    Bảng cũ chưa có cột site (cả SQLite) -> chuyển thành shard của DEFAULT_SITE
+    """
+    inspector = inspect(conn)
+    if inspector.has_table(table_name):
+        if 'site' not in [c['name'] for c in inspector.get_columns(table_name)]:
+            _migrate_legacy(conn, table_name)
+    if _is_postgres(conn):
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                site TEXT NOT NULL,
+                item_code TEXT NOT NULL,
+                avg_consume NUMERIC,
+                revision BIGINT DEFAULT 0,
+                PRIMARY KEY (site, item_code)
+            ) PARTITION BY LIST (site)
+        """))
+
+
+def register_site(conn, table_name, site):
+    """Ghi site vào table_sites (nếu chưa có)"""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {SITES_TABLE} (
+            table_name TEXT NOT NULL,
+            site TEXT NOT NULL,
+            PRIMARY KEY (table_name, site)
+        )
+    """))
+    conn.execute(text(f"""
+        INSERT INTO {SITES_TABLE} (table_name, site) VALUES (:t, :s)
+        ON CONFLICT (table_name, site) DO NOTHING
+    """), {'t': table_name, 's': site})
+
+
+def ensure_shard(conn, table_name, site=None):
+    """
+    Tạo shard của site nếu chưa có (gọi trong transaction ghi data)
+
+    Returns:
+        Tên shard
+    """
+    site = normalize_site(site or DEFAULT_SITE)
+    shard = shard_table(table_name, site)
+    if not inspect(conn).has_table(shard):
+        ensure_parent(conn, table_name)
+        if _is_postgres(conn):
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {shard} PARTITION OF {table_name}
+                (site DEFAULT '{site}') FOR VALUES IN ('{site}')
+            """))
+        else:
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {shard} ({shard_columns(site)}, PRIMARY KEY (site, item_code))
+            """))
+        register_site(conn, table_name, site)
+    return shard
+
+
+def _partition_state(conn, table_name, shard):
+    # None: không phải partition của table_name, 'attached', hoặc 'pending' (DETACH CONCURRENTLY bị ngắt)
+    row = conn.execute(text("""
+        SELECT inhdetachpending FROM pg_inherits
+        WHERE inhrelid = to_regclass(:s) AND inhparent = to_regclass(:t)
+    """), {'s': shard, 't': table_name}).first()
+    if row is None:
+        return None
+    return 'pending' if row[0] else 'attached'
+
+
+def attach_shard(conn, table_name, shard, site):
+    """
+    Gắn bảng đã load đủ data (Replace mode) làm partition của site (đã gắn -> bỏ qua)
+    ATTACH chỉ lock SHARE UPDATE EXCLUSIVE bảng partitioned (đọc / ghi site khác vẫn chạy),
+    bảng có sẵn CHECK (site = ...) -> không phải quét lại
+    """
+    if _is_postgres(conn) and _partition_state(conn, table_name, shard) is None:
+        conn.execute(text(
+            f"ALTER TABLE {table_name} ATTACH PARTITION {shard} FOR VALUES IN ('{site}')"
+        ))
+    register_site(conn, table_name, site)
+
+
+def detach_shard(conn, table_name, shard):
+    """
+    PostgreSQL: tách shard khỏi bảng partitioned trước khi swap (Replace mode)
+    - DETACH ... CONCURRENTLY (PostgreSQL 14+) không lock exclusive bảng partitioned,
+      conn phải ở chế độ autocommit (xem db.run_locked(..., autocommit=True))
+      và lock_timeout nhỏ hơn nửa deadlock_timeout (db.DETACH_LOCK_TIMEOUT_MS)
+    - Shard vẫn là bảng thường: đọc / ghi theo tên shard vẫn chạy, DROP sau đó không cần lock bảng cha
+    - DETACH lần trước bị ngắt giữa chừng (vd: hết lock_timeout) -> FINALIZE;
+      shard đã tách (lần trước lỗi trước khi ATTACH lại) -> bỏ qua
+    """
+    if not _is_postgres(conn):
+        return
+    state = _partition_state(conn, table_name, shard)
+    if state is not None:
+        mode = "FINALIZE" if state == 'pending' else "CONCURRENTLY"
+        conn.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {shard} {mode}"))
+
+
+def list_sites(conn, table_name):
+    """Các site đã có data của bảng (theo thứ tự tên)"""
+    if not inspect(conn).has_table(SITES_TABLE):
+        return []
+    rows = conn.execute(
+        text(f"SELECT site FROM {SITES_TABLE} WHERE table_name = :t ORDER BY site"),
+        {'t': table_name},
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def _rename(conn, old, new, indexes=()):
+    # PostgreSQL đổi tên cả index, SQLite không đổi tên được index -> xóa (được tạo lại khi ghi)
+    if not inspect(conn).has_table(old):
+        return
+    conn.execute(text(f"ALTER TABLE {old} RENAME TO {new}"))
+    for suffix in indexes:
+        if _is_postgres(conn):
+            conn.execute(text(f"ALTER INDEX IF EXISTS {old}_{suffix} RENAME TO {new}_{suffix}"))
+        else:
+            conn.execute(text(f"DROP INDEX IF EXISTS {old}_{suffix}"))
+
+
+def _migrate_legacy(conn, table_name):
+    """Bảng 1 site (PRIMARY KEY item_code) -> shard {table}_{DEFAULT_SITE} + bảng partitioned"""
+    site = normalize_site(DEFAULT_SITE)
+    shard = shard_table(table_name, site)
+    # Bảng tạo bởi bản đầu tiên (pandas to_sql) không có cột revision / PRIMARY KEY
+    has_revision = 'revision' in [c['name'] for c in inspect(conn).get_columns(table_name)]
+    if _is_postgres(conn):
+        _rename(conn, table_name, shard, ('pkey', 'revision_idx', 'avg_consume_idx'))
+        # Bảng to_sql cũ không có PRIMARY KEY: bỏ dòng không có item_code, item trùng giữ dòng đầu
+        # (như nhánh SQLite) để ADD PRIMARY KEY không lỗi
+        conn.execute(text(f"DELETE FROM {shard} WHERE item_code IS NULL"))
+        conn.execute(text(f"""
+            DELETE FROM {shard} d USING {shard} k
+            WHERE d.item_code = k.item_code AND d.ctid > k.ctid
+        """))
+        # ADD COLUMN có DEFAULT không ghi lại bảng, CHECK để ATTACH không phải quét lại
+        conn.execute(text(f"""
+            ALTER TABLE {shard}
+                ADD COLUMN site TEXT NOT NULL DEFAULT '{site}',
+                ADD COLUMN IF NOT EXISTS revision BIGINT DEFAULT 0,
+                ALTER COLUMN item_code TYPE TEXT,
+                ALTER COLUMN avg_consume TYPE NUMERIC,
+                DROP CONSTRAINT IF EXISTS {shard}_pkey,
+                ADD PRIMARY KEY (site, item_code),
+                ADD CONSTRAINT {shard}_site_check CHECK (site = '{site}')
+        """))
+        ensure_parent(conn, table_name)
+        attach_shard(conn, table_name, shard, site)
+    else:
+        revision = "COALESCE(revision, 0)" if has_revision else "0"
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {shard} ({shard_columns(site)}, PRIMARY KEY (site, item_code))"
+        ))
+        conn.execute(text(f"""
+            INSERT INTO {shard} (item_code, avg_consume, revision)
+            SELECT item_code, avg_consume, {revision} FROM {table_name} WHERE item_code IS NOT NULL
+            ON CONFLICT (site, item_code) DO NOTHING
+        """))
+        conn.execute(text(f"DROP TABLE {table_name}"))
+        register_site(conn, table_name, site)
+
+    # Revision / manifest / history của bảng cũ thuộc về shard mới
+    for meta in ('table_revisions', 'ingest_manifest', 'ingest_progress'):
+        if inspect(conn).has_table(meta):
+            conn.execute(text(f"UPDATE {meta} SET table_name = :new WHERE table_name = :old"),
+                         {'new': shard, 'old': table_name})
+    old, new = history_tables(table_name), history_tables(shard)
+    if _is_postgres(conn) and inspect(conn).has_table(old['history']):
+        # Partition tháng {history}_YYYYMM theo tên mới (ensure_partition tìm theo tên)
+        partitions = conn.execute(text("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:t AS regclass)
+        """), {'t': old['history']}).scalars().all()
+        for partition in partitions:
+            suffix = partition[len(old['history']):]
+            conn.execute(text(f"ALTER TABLE {partition} RENAME TO {new['history']}{suffix}"))
+    _rename(conn, old['history'], new['history'], ('item_ts_idx',))
+    _rename(conn, old['daily'], new['daily'], ('pkey', 'day_idx'))
+    _rename(conn, old['weekly'], new['weekly'], ('pkey', 'week_idx'))
+    _rename(conn, old['summary'], new['summary'], ('pkey',))
@@ -0,0 +1,46 @@
+"""
+Fixture dùng chung cho test (chạy trên SQLite, không cần PostgreSQL)
+
+Chạy: python -m pytest -q
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Mỗi test chạy trong folder tạm (không đọc file / cache của repo)"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Engine SQLite riêng cho từng test"""
+    return db.get_engine(f"sqlite:///{tmp_path / 'ro.db'}")
+
+
+def items(codes, avg):
+    """DataFrame đầu vào của bulk_loader (cột item_code, avg_consume)"""
+    return pd.DataFrame({'item_code': list(codes), 'avg_consume': [float(a) for a in avg]})
+
+
+def workbook(path, header, rows):
+    """Ghi file giống export ERP: row 1 là tiêu đề, header ở row 2"""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['RO report'])
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return str(path)
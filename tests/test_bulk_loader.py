@@ -0,0 +1,119 @@
+import pytest
+from sqlalchemy import text
+
+import bulk_loader
+from bulk_loader import append_rows, bulk_upsert, replace_table
+from conftest import items
+from manifest import get_progress, is_ingested, record_files, save_progress
+from revision import current_revision
+
+
+def rows(engine, table='ro_items_main'):
+    with engine.connect() as conn:
+        return dict(conn.execute(text(f"SELECT item_code, avg_consume FROM {table}")).all())
+
+
+def test_bulk_upsert_counts(engine):
+    first = bulk_upsert(engine, items(['A', 'B', 'C'], [1, 2, 3]))
+    assert (first['inserted'], first['updated'], first['unchanged']) == (3, 0, 0)
+
+    second = bulk_upsert(engine, items(['A', 'B', 'D'], [1, 5, 4]))
+    assert (second['inserted'], second['updated'], second['unchanged']) == (1, 1, 1)
+    assert second['revision'] == first['revision'] + 1
+    assert rows(engine) == {'A': 1, 'B': 5, 'C': 3, 'D': 4}
+
+
+def test_bulk_upsert_duplicates_keep_first(engine):
+    summary = bulk_upsert(engine, items(['A', 'A', 'B'], [1, 2, 3]))
+    assert summary['rows'] == 2
+    assert rows(engine) == {'A': 1, 'B': 3}
+
+
+def test_bulk_upsert_chunks_and_site(engine):
+    chunks = iter([items(['A'], [1]), items(['B'], [2])])
+    summary = bulk_upsert(engine, chunks, site='HN1')
+    assert summary['table'] == 'ro_items_hn1'
+    assert rows(engine, 'ro_items_hn1') == {'A': 1, 'B': 2}
+
+
+def test_manifest_recorded_with_data(engine):
+    def record(conn, summary):
+        record_files(conn, 'ro_items_main', [('data/a.xlsx', 'h1', summary['rows'])])
+
+    assert not is_ingested(engine, 'ro_items_main', 'h1')
+    bulk_upsert(engine, items(['A'], [1]), before_commit=record)
+    assert is_ingested(engine, 'ro_items_main', 'h1')
+    assert not is_ingested(engine, 'ro_items_hn1', 'h1')
+
+
+def test_append_rows_resume(engine):
+    data = items(['A', 'B', 'C', 'D', 'E'], [1, 2, 3, 4, 5])
+
+    def save_then_crash(conn, summary):
+        save_progress(conn, 'ro_items_main', 'h1', 2, summary)
+        if summary['chunks'] == 2:
+            raise RuntimeError("simulated crash")
+
+    with pytest.raises(RuntimeError):
+        append_rows(engine, data, chunksize=2, after_chunk=save_then_crash)
+    # Chunk lỗi bị rollback cùng tiến độ của nó: chỉ chunk đầu đã commit
+    assert rows(engine) == {'A': 1, 'B': 2}
+    resume = get_progress(engine, 'ro_items_main', 'h1', 2)
+    assert resume == {'chunks': 1, 'inserted': 2, 'skipped': 0}
+
+    summary = append_rows(engine, data, chunksize=2, resume_from=resume)
+    assert summary['resumed_chunks'] == 1
+    assert summary['chunks'] == 3
+    assert (summary['inserted'], summary['skipped']) == (5, 0)
+    assert rows(engine) == {'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5}
+
+
+def test_append_rows_skips_existing(engine):
+    bulk_upsert(engine, items(['A'], [1]))
+    summary = append_rows(engine, items(['A', 'B'], [9, 2]))
+    assert (summary['inserted'], summary['skipped']) == (1, 1)
+    assert rows(engine) == {'A': 1, 'B': 2}
+
+
+def test_replace_table(engine):
+    bulk_upsert(engine, items(['A', 'B'], [1, 2]))
+    summary = replace_table(engine, items(['B', 'C', 'C'], [5, 6, 7]))
+    assert summary['rows'] == 2
+    assert rows(engine) == {'B': 5, 'C': 6}
+    with engine.connect() as conn:
+        revision, base_revision = current_revision(conn, 'ro_items_main')
+    assert revision == base_revision == summary['revision']
+
+
+def test_replace_table_keeps_indexes(engine):
+    bulk_upsert(engine, items(['A'], [1]))
+    replace_table(engine, items(['B'], [2]))
+    with engine.connect() as conn:
+        indexes = dict(conn.execute(text(
+            "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        )).all())
+    assert indexes['ro_items_main_avg_consume_idx'] == 'ro_items_main'
+    assert indexes['ro_items_main_revision_idx'] == 'ro_items_main'
+    assert not [name for name in indexes if 'staging' in name]
+
+
+def test_replace_history_sees_write_before_lock(engine, monkeypatch):
+    bulk_upsert(engine, items(['A', 'B'], [1, 2]))
+    real_lock = bulk_loader.lock_shard
+
+    def lock_after_upsert(conn, shard, mode='ROW EXCLUSIVE'):
+        # Upsert commit trong lúc swap đang chờ lock
+        if mode == 'ACCESS EXCLUSIVE':
+            monkeypatch.setattr(bulk_loader, 'lock_shard', real_lock)
+            bulk_upsert(engine, items(['A'], [5]))
+        real_lock(conn, shard, mode)
+
+    monkeypatch.setattr(bulk_loader, 'lock_shard', lock_after_upsert)
+    replace_table(engine, items(['A', 'B'], [1, 2]))
+    with engine.connect() as conn:
+        history = conn.execute(text(
+            "SELECT avg_consume, prev_avg FROM ro_items_main_history "
+            "WHERE item_code = 'A' ORDER BY revision"
+        )).all()
+    # Replace đưa A từ 5 (upsert) về 1: history phải có thay đổi này
+    assert [tuple(row) for row in history] == [(1, None), (5, 1), (1, 5)]
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from decision import evaluate_batch, lookup_item, read_pick_list
+from item_table import ItemTable
+from rules import RuleSet
+
+
+def pick_list(rows):
+    return pd.DataFrame(rows, columns=['Item_Code', 'Stock', 'Requested_Qty'])
+
+
+def catalog():
+    return pd.DataFrame({'Item_Code': ['A', 'B', 'A'], 'Avg_Consume': [-10.0, 50.0, 99.0]})
+
+
+def test_evaluate_batch_decisions():
+    result = evaluate_batch(pick_list([
+        ['A', 10, 10],     # 20 <= 2 * |-10|
+        ['A', 10, 11],     # 21 > 20
+        ['B', 0, 100],
+        ['MISSING', 0, 0],
+        ['B', np.nan, 1],
+    ]), catalog())
+    assert result['Decision'].tolist() == ['YES', 'NO', 'YES', 'UNKNOWN', 'INVALID']
+    # Item trùng trong catalog: dòng đầu thắng
+    assert result['Avg_Consume'].tolist()[:2] == [10.0, 10.0]
+    assert np.isnan(result['Threshold'].iloc[3])
+
+
+def test_evaluate_batch_empty_table():
+    empty = pd.DataFrame({'Item_Code': pd.Series([], dtype=str), 'Avg_Consume': pd.Series([], dtype=float)})
+    result = evaluate_batch(pick_list([['A', 1, 1], ['B', 1, 1]]), empty)
+    assert result['Decision'].tolist() == ['UNKNOWN', 'UNKNOWN']
+
+
+def test_evaluate_batch_empty_pick_list():
+    result = evaluate_batch(pick_list([]), catalog())
+    assert len(result) == 0
+
+
+def test_evaluate_batch_moq():
+    table = ItemTable.from_frame(catalog(), RuleSet(rules=[{'item_code': 'A', 'moq': 15}]))
+    result = evaluate_batch(pick_list([['A', 0, 5], ['A', 6, 5], ['B', 0, 5]]), table)
+    # stock + max(qty, moq) <= threshold
+    assert result['Decision'].tolist() == ['YES', 'NO', 'YES']
+    assert result['Min_Order_Qty'].tolist() == [15.0, 15.0, 0.0]
+
+
+def test_lookup_item():
+    table = ItemTable.from_frame(catalog())
+    assert lookup_item(table, 'A') == (10.0, 20.0, 0.0)
+    assert lookup_item(table, 'MISSING') is None
+
+
+def test_batch_matches_single_lookup():
+    table = ItemTable.from_frame(catalog())
+    picks = pick_list([['A', 10, 10], ['A', 10, 11], ['B', 60, 40], ['B', 60, 41], ['Z', 0, 0]])
+    expected = []
+    for code, stock, qty in picks.itertuples(index=False):
+        entry = lookup_item(table, code)
+        expected.append('UNKNOWN' if entry is None else 'YES' if stock + qty <= entry[1] else 'NO')
+    assert evaluate_batch(picks, table)['Decision'].tolist() == expected
+
+
+def test_read_pick_list_csv(tmp_path):
+    path = tmp_path / 'pick.csv'
+    path.write_text("Item Code,Pick to Light Stock,Requested Quantity\n A ,1,2\nB,x,3\n")
+    df = read_pick_list(str(path))
+    assert df['Item_Code'].tolist() == ['A', 'B']
+    assert df['Stock'].tolist()[0] == 1 and np.isnan(df['Stock'].iloc[1])
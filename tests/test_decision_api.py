@@ -0,0 +1,96 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import decision_api
+from bulk_loader import bulk_upsert
+from conftest import items
+from decision_api import DecisionService, make_server
+
+
+@pytest.fixture
+def api(engine, tmp_path, monkeypatch):
+    """Server thật (port trống) với site main (A, B) và hn1 (A) load từ SQLite"""
+    monkeypatch.setattr(decision_api, 'DECISION_API_SNAPSHOT_DIR', str(tmp_path / 'api'))
+    bulk_upsert(engine, items(['A', 'B'], [10, -50]))
+    bulk_upsert(engine, items(['A'], [1]), site='hn1')
+    service = DecisionService(engine)
+    service.open()
+    server = make_server(service, '127.0.0.1', 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    service.refresher.stop()
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    conn.request(method, path, body, headers or {})
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    content_type = response.getheader('Content-Type', '')
+    return response.status, json.loads(data) if content_type.startswith('application/json') else data
+
+
+def test_get_decision(api):
+    status, body = request(api, 'GET', '/decision?item_code=A&stock=10&qty=10')
+    assert status == 200
+    assert body == {'item_code': 'A', 'decision': 'YES', 'avg_consume': 10.0, 'threshold': 20.0, 'moq': 0.0}
+    assert request(api, 'GET', '/decision?item_code=A&stock=10&qty=11')[1]['decision'] == 'NO'
+    assert request(api, 'GET', '/decision?item_code=Z&stock=1&qty=1')[1]['decision'] == 'UNKNOWN'
+
+
+def test_get_decision_site(api):
+    status, body = request(api, 'GET', '/decision?item_code=A&stock=1&qty=1&site=HN1')
+    assert status == 200 and body['threshold'] == 2.0
+    assert request(api, 'GET', '/decision?item_code=A&stock=1&qty=1&site=zz')[0] == 404
+    assert request(api, 'GET', '/decision?item_code=A&stock=1&qty=1&site=bad-site!')[0] == 400
+
+
+def test_get_decision_invalid(api):
+    assert request(api, 'GET', '/decision?item_code=A&stock=x&qty=1')[0] == 400
+    assert request(api, 'GET', '/decision?stock=1&qty=1')[0] == 400
+    assert request(api, 'GET', '/nope')[0] == 404
+
+
+def test_post_decision(api):
+    status, body = request(api, 'POST', '/decision', {'item_code': 'B', 'stock': 50, 'qty': 50})
+    assert status == 200 and body['decision'] == 'YES'
+
+
+def test_post_batch(api):
+    status, body = request(api, 'POST', '/decision', {'items': [
+        {'item_code': 'A', 'stock': 10, 'qty': 10},
+        {'item_code': 'A', 'stock': 10, 'qty': 11},
+        {'item_code': 'Z', 'stock': 1, 'qty': 1},
+        {'item_code': 'B', 'stock': 'x', 'qty': 1},
+    ]})
+    assert status == 200
+    assert [r['decision'] for r in body['results']] == ['YES', 'NO', 'UNKNOWN', 'INVALID']
+    assert body['counts'] == {'INVALID': 1, 'NO': 1, 'UNKNOWN': 1, 'YES': 1}
+
+
+def test_post_errors(api, monkeypatch):
+    assert request(api, 'POST', '/decision', b'not json')[0] == 400
+    assert request(api, 'POST', '/decision', [1])[0] == 400
+    assert request(api, 'POST', '/decision', {'items': 'A'})[0] == 400
+    assert request(api, 'POST', '/decision', {'site': 'x y', 'item_code': 'A', 'stock': 1, 'qty': 1})[0] == 400
+    monkeypatch.setattr(decision_api, 'DECISION_API_MAX_BATCH', 1)
+    assert request(api, 'POST', '/decision', {'items': [{}, {}]})[0] == 413
+    monkeypatch.setattr(decision_api, 'API_MAX_BODY', 10)
+    assert request(api, 'POST', '/decision', {'item_code': 'A', 'stock': 1, 'qty': 1})[0] == 413
+
+
+def test_health_and_metrics(api):
+    status, body = request(api, 'GET', '/health')
+    assert status == 200 and body['status'] == 'ok'
+    assert set(body['sites']) == {'main', 'hn1'}
+    status, body = request(api, 'GET', '/metrics')
+    assert status == 200 and b'api_request' in body
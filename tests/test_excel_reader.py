@@ -0,0 +1,35 @@
+import pytest
+
+from conftest import workbook
+from excel_reader import ColumnNotFoundError, iter_clean_chunks, read_clean
+
+
+def test_read_clean(tmp_path):
+    path = workbook(tmp_path / 'ro.xlsx', ['No', 'Item Code', 'Avg. Consume'], [
+        [1, 'A', 1.5],
+        [2, 'B', '#DIV/0!'],   # ô lỗi Excel -> bỏ như ô trống
+        [3, None, 2],
+        [4, 'A', 9],           # duplicate -> giữ dòng đầu
+        [5, 'C', 'x'],
+        [6, 'D', '-3'],
+    ])
+    df = read_clean(path)
+    assert df['item_code'].tolist() == ['A', 'D']
+    assert df['avg_consume'].tolist() == [1.5, -3.0]
+
+
+def test_chunks_skip_duplicates_across_chunks(tmp_path):
+    path = workbook(tmp_path / 'ro.xlsx', ['Item Code', 'Avg Consume'],
+                    [['A', 1], ['B', 2], ['A', 3], ['C', 4]])
+    timings = {}
+    chunks = list(iter_clean_chunks(path, chunksize=2, timings=timings))
+    assert [c['item_code'].tolist() for c in chunks] == [['A', 'B'], ['C']]
+    assert {'detect', 'read', 'clean'} <= set(timings)
+
+
+def test_missing_column(tmp_path):
+    path = workbook(tmp_path / 'ro.xlsx', ['Item Code', 'Qty'], [['A', 1]])
+    # Lỗi ngay khi gọi (trước khi đọc data)
+    with pytest.raises(ColumnNotFoundError) as excinfo:
+        iter_clean_chunks(path)
+    assert excinfo.value.item_col == 'Item Code' and excinfo.value.avg_col is None
@@ -0,0 +1,30 @@
+import os
+
+from sqlalchemy import text
+
+from conftest import workbook
+
+# Script dừng khi import nếu thiếu DATABASE_URL (test truyền engine trực tiếp)
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from ingest_all import ingest_site, list_excel_files  # noqa: E402
+
+
+def rows(engine):
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT item_code, avg_consume FROM ro_items_main")).all())
+
+
+def test_edited_older_file_does_not_override_newer(engine, tmp_path):
+    old = workbook(tmp_path / 'RO_old.xlsx', ['Item Code', 'Avg Consume'], [['A', 9], ['B', 2]])
+    new = workbook(tmp_path / 'RO_new.xlsx', ['Item Code', 'Avg Consume'], [['A', 1]])
+    os.utime(old, (1_000, 1_000))
+    os.utime(new, (2_000, 2_000))
+    ingest_site(engine, list_excel_files(str(tmp_path)), 'main', workers=1)
+    assert rows(engine) == {'A': 1, 'B': 2}
+
+    # Sửa file cũ (giữ mtime cũ): file mới không đổi vẫn thắng với item A
+    workbook(old, ['Item Code', 'Avg Consume'], [['A', 9], ['B', 3]])
+    os.utime(old, (1_000, 1_000))
+    ingest_site(engine, list_excel_files(str(tmp_path)), 'main', workers=1)
+    assert rows(engine) == {'A': 1, 'B': 3}
@@ -0,0 +1,48 @@
+from bulk_loader import bulk_upsert, replace_table
+from conftest import items
+from item_store import ItemStore
+
+
+def store():
+    return ItemStore('ro_items_main', snapshot_dir=None)
+
+
+def test_delta_refresh(engine):
+    bulk_upsert(engine, items(['A', 'B'], [1, 2]))
+    s = store()
+    s.open(engine)
+    assert len(s.table) == 2 and s.source == 'database'
+
+    assert s.refresh(engine) == 0
+    bulk_upsert(engine, items(['A', 'B', 'C'], [1, 5, 3]))
+    # Chỉ lấy các dòng revision mới (B đổi, C mới)
+    assert s.refresh(engine) == 2
+    assert s.table.get('B') == (5.0, 10.0, 0.0)
+    assert s.table.get('C') == (3.0, 6.0, 0.0)
+    assert s.table.code(2) == 'C'
+    assert s.search.search('c') == ['C']
+
+
+def test_full_reload_after_replace(engine):
+    bulk_upsert(engine, items(['A', 'B'], [1, 2]))
+    s = store()
+    s.open(engine)
+    old = s.table
+
+    replace_table(engine, items(['C'], [3]))
+    # base_revision tăng -> load lại toàn bộ (A, B không còn)
+    assert s.refresh(engine) is None
+    assert 'A' not in s.table and s.table.get('C') == (3.0, 6.0, 0.0)
+    # Bảng cũ không bị sửa (session đang đọc vẫn thấy đủ)
+    assert 'A' in old
+
+
+def test_snapshot_start(engine, tmp_path):
+    bulk_upsert(engine, items(['A'], [1]))
+    first = ItemStore('ro_items_main', snapshot_dir=str(tmp_path / 'cache'))
+    first.load(engine)
+    first.save_snapshot()
+
+    second = ItemStore('ro_items_main', snapshot_dir=str(tmp_path / 'cache'))
+    assert second._load_snapshot()
+    assert second.table.get('A') == (1.0, 2.0, 0.0) and second.revision == first.revision
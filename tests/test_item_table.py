@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from decision import evaluate_batch
+from item_table import ItemTable
+
+
+def table():
+    # Chưa sort, có item trùng (dòng đầu thắng)
+    return ItemTable.from_arrays(['C', 'A', 'B', 'A'], [3.0, -1.0, 2.0, 9.0])
+
+
+def test_lookup():
+    t = table()
+    assert len(t) == 3 and [t.code(i) for i in range(3)] == ['A', 'B', 'C']
+    assert t.find('B') == 1 and t.find('Z') == -1 and t.find('') == -1
+    assert t.get('A') == (1.0, 2.0, 0.0)
+    assert 'C' in t and 'Z' not in t
+    assert t.positions(['C', 'Z', 'A']).tolist() == [2, -1, 0]
+
+
+def test_with_updates_returns_new_table():
+    t = table()
+    updated = t.with_updates(['B', 'D'], [5.0, 4.0])
+    assert updated.get('B') == (5.0, 10.0, 0.0) and updated.get('D') == (4.0, 8.0, 0.0)
+    # Bảng cũ không bị sửa
+    assert t.get('B') == (2.0, 4.0, 0.0) and 'D' not in t
+
+
+def test_arrow_round_trip():
+    t = ItemTable.from_arrow(table().to_arrow())
+    assert t.codes.to_pylist() == ['A', 'B', 'C']
+    assert t.get('C') == (3.0, 6.0, 0.0)
+    assert len(ItemTable.empty()) == 0
+
+
+def test_evaluate_batch_matches_frame():
+    catalog = pd.DataFrame({'Item_Code': ['C', 'A', 'B', 'A'], 'Avg_Consume': [3.0, -1.0, 2.0, 9.0]})
+    picks = pd.DataFrame({'Item_Code': ['A', 'B', 'Z', 'C'], 'Stock': [1, 3, 0, np.nan],
+                          'Requested_Qty': [1, 2, 0, 1]})
+    expected = evaluate_batch(picks, catalog)
+    result = evaluate_batch(picks, table())
+    assert result['Decision'].tolist() == expected['Decision'].tolist() == ['YES', 'NO', 'UNKNOWN', 'INVALID']
+    np.testing.assert_array_equal(result['Threshold'], expected['Threshold'])
@@ -0,0 +1,12 @@
+from metrics import Registry
+
+
+def test_prometheus_escapes_label_values():
+    registry = Registry()
+    registry.inc('files', file='C:\\data\\"ro"\nitems.xlsx')
+    registry.observe('excel_read', 0.01, file='a"b')
+    text = registry.to_prometheus()
+    assert 'ros_files_total{file="C:\\\\data\\\\\\"ro\\"\\nitems.xlsx"} 1' in text
+    assert 'ros_span_seconds_count{span="excel_read",file="a\\"b"} 1' in text
+    # Mỗi sample đúng 1 dòng
+    assert all(line.startswith(('#', 'ros_')) for line in text.splitlines())
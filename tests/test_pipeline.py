@@ -0,0 +1,37 @@
+import pytest
+
+from pipeline import prefetch, run_pipeline
+
+
+def failing(n):
+    yield from range(n)
+    raise ValueError("parse error")
+
+
+def test_prefetch_keeps_order():
+    assert list(prefetch(iter(range(10)), max_queued=2)) == list(range(10))
+
+
+def test_prefetch_reraises_parser_error():
+    seen = []
+    with pytest.raises(ValueError):
+        for item in prefetch(failing(3), max_queued=1):
+            seen.append(item)
+    assert seen == [0, 1, 2]
+
+
+def test_run_pipeline_all_items():
+    results = run_pipeline(iter(range(20)), lambda x: x * 2, writers=3, max_queued=2)
+    assert sorted(results) == [x * 2 for x in range(20)]
+
+
+def test_run_pipeline_writer_error_stops():
+    def write(x):
+        if x == 5:
+            raise RuntimeError("write error")
+        return x
+
+    with pytest.raises(RuntimeError):
+        run_pipeline(iter(range(1000)), write, writers=2, max_queued=2)
+    with pytest.raises(ValueError):
+        run_pipeline(failing(3), lambda x: x, writers=2)
@@ -0,0 +1,25 @@
+import time
+
+from bulk_loader import bulk_upsert
+from conftest import items
+from item_store import ItemStore
+from refresher import StoreRefresher
+
+
+def test_preload_opens_every_store(engine):
+    bulk_upsert(engine, items(['A', 'B'], [1, 2]))
+    bulk_upsert(engine, items(['C'], [3]), site='hn1')
+    stores = [ItemStore(f'ro_items_{site}', snapshot_dir=None) for site in ('main', 'hn1')]
+    refresher = StoreRefresher(engine, interval_minutes=60)
+    try:
+        refresher.preload(stores)
+        deadline = time.time() + 10
+        while any(s.table is None for s in stores) and time.time() < deadline:
+            time.sleep(0.02)
+        assert [len(s.table) for s in stores] == [2, 1]
+        assert set(refresher.stores) == {'ro_items_main', 'ro_items_hn1'}
+        # Store đã theo dõi không bị load lại
+        refresher.preload(stores)
+        assert refresher._pending.empty()
+    finally:
+        refresher.stop()
@@ -0,0 +1,33 @@
+import time
+
+from openpyxl import load_workbook
+
+from bulk_loader import bulk_upsert
+from conftest import items
+from reports import ReportService
+
+
+def wait(job, timeout=10):
+    deadline = time.time() + timeout
+    while not job.done and time.time() < deadline:
+        time.sleep(0.02)
+    return job
+
+
+def test_daily_summary_on_empty_database(engine, tmp_path):
+    # Chưa có ai Check Decision: decision_log chưa tồn tại
+    service = ReportService(engine, report_dir=str(tmp_path / 'reports'))
+    job = wait(service.submit('Daily Summary'))
+    assert (job.status, job.error, job.rows) == ('done', None, 0)
+
+    again = service.submit('Daily Summary')
+    assert again.cached and again.path == job.path
+
+
+def test_weekly_inventory(engine, tmp_path):
+    bulk_upsert(engine, items(['B', 'A'], [2, -1]))
+    service = ReportService(engine, report_dir=str(tmp_path / 'reports'))
+    job = wait(service.submit('Weekly Inventory'))
+    assert job.status == 'done' and job.rows == 2
+    rows = list(load_workbook(job.path).active.values)
+    assert rows[1][:3] == ('A', -1, 2)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from rules import RuleSet, order_ok
+
+
+def test_default_parameters():
+    params = RuleSet().compile(['A', 'B'])
+    assert params['multiplier'].tolist() == [2.0, 2.0]
+    assert params['moq'].tolist() == [0.0, 0.0]
+    assert params['safety_stock'].tolist() == [0.0, 0.0]
+
+
+def test_first_matching_pattern_wins():
+    rules = RuleSet(rules=[
+        {'pattern': '^CH-', 'multiplier': 3},
+        {'pattern': '^C', 'multiplier': 5, 'moq': 10},
+    ])
+    params = rules.compile(['CH-1', 'CX-1', 'Z-1'])
+    assert params['multiplier'].tolist() == [3.0, 5.0, 2.0]
+    # Rule đầu không đặt moq -> lấy từ rule khớp tiếp theo
+    assert params['moq'].tolist() == [10.0, 10.0, 0.0]
+
+
+def test_item_override_beats_patterns():
+    rules = RuleSet({'multiplier': 4}, [
+        {'pattern': '^CH-', 'multiplier': 3, 'safety_stock': 5},
+        {'item_code': 'CH-1', 'safety_stock': 50},
+        {'item_code': 'CH-1', 'safety_stock': 99, 'moq': 7},
+    ])
+    params = rules.compile(['CH-1', 'CH-2', 'Z'])
+    assert params['multiplier'].tolist() == [3.0, 3.0, 4.0]
+    # Override trùng item: rule đứng trước thắng, field thiếu lấy từ override sau
+    assert params['safety_stock'].tolist() == [50.0, 5.0, 0.0]
+    assert params['moq'].tolist() == [7.0, 0.0, 0.0]
+
+
+def test_thresholds_use_safety_stock_floor():
+    params = RuleSet(rules=[{'item_code': 'A', 'safety_stock': 100}]).compile(['A', 'B'])
+    assert RuleSet.thresholds(np.array([-10.0, -10.0]), params).tolist() == [100.0, 20.0]
+
+
+@pytest.mark.parametrize('rule', [
+    {'pattern': '^A', 'item_code': 'A'},
+    {'multiplier': 2},
+    {'pattern': '(', 'moq': 1},
+    {'item_code': 'A', 'moq': -1},
+])
+def test_invalid_rules(rule):
+    with pytest.raises(ValueError):
+        RuleSet(rules=[rule])
+
+
+def test_key_changes_with_rules():
+    assert RuleSet().key == RuleSet().key
+    assert RuleSet().key != RuleSet(rules=[{'item_code': 'A', 'moq': 1}]).key
+
+
+def test_order_ok_scalar_and_array():
+    assert order_ok(10, 5, 20, 0)
+    assert not order_ok(10, 5, 20, 15)  # moq 15 > qty -> nhận đủ 15
+    result = order_ok(np.array([10.0, 10.0]), np.array([5.0, 5.0]), np.array([20.0, 20.0]), np.array([0.0, 15.0]))
+    assert result.tolist() == [True, False]
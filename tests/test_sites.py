@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import text
+
+from bulk_loader import bulk_upsert
+from conftest import items
+from revision import current_revision
+from sites import list_sites, normalize_site, resolve_site, shard_table, site_from_path
+
+
+def test_normalize_site():
+    assert normalize_site(' HN1 ') == 'hn1'
+    assert shard_table('ro_items', 'HN1') == 'ro_items_hn1'
+    for bad in ['', 'a-b', 'x' * 33, "main'; DROP TABLE ro_items; --"]:
+        with pytest.raises(ValueError):
+            normalize_site(bad)
+
+
+def test_site_from_path():
+    assert site_from_path('data/RO_site-HN1_2024.xlsx') == 'hn1'
+    assert site_from_path('data/RO_2024.xlsx') is None
+    assert resolve_site('hcm', 'data/RO_site-hn1.xlsx') == 'hcm'
+    assert resolve_site(None, 'data/RO_2024.xlsx') == 'main'
+
+
+def test_list_sites(engine):
+    bulk_upsert(engine, items(['A'], [1]), site='hn1')
+    bulk_upsert(engine, items(['A'], [2]))
+    with engine.connect() as conn:
+        assert list_sites(conn, 'ro_items') == ['hn1', 'main']
+
+
+def test_migrate_legacy_table(engine):
+    # Bảng 1 site của bản cũ (pandas to_sql, không có PRIMARY KEY / revision)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE ro_items (item_code TEXT, avg_consume NUMERIC)"))
+        conn.execute(text("INSERT INTO ro_items VALUES ('A', 1), ('B', 2), (NULL, 3)"))
+        conn.execute(text("CREATE TABLE table_revisions "
+                          "(table_name TEXT PRIMARY KEY, revision BIGINT, base_revision BIGINT)"))
+        conn.execute(text("INSERT INTO table_revisions VALUES ('ro_items', 7, 3)"))
+
+    summary = bulk_upsert(engine, items(['C'], [4]))
+    assert summary['revision'] == 8
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT item_code FROM ro_items_main ORDER BY item_code")).scalars()
+        assert rows.all() == ['A', 'B', 'C']
+        assert current_revision(conn, 'ro_items_main') == (8, 3)
+        assert list_sites(conn, 'ro_items') == ['main']
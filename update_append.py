@@ -1,13 +1,22 @@
 """
 Script để thêm items mới từ Excel vào Supabase (Append mode)
 Giữ nguyên data cũ, chỉ thêm items mới
+Site: --site <site>, hoặc ghi trong tên file (vd: RO_site-hn1.xlsx), mặc định DEFAULT_SITE
+
+Chạy: python update_append.py [--site SITE]
 """
 
-import pandas as pd
-from sqlalchemy import create_engine
 import os
+import sys
 from dotenv import load_dotenv
 
+import metrics
+from db import get_engine, format_stats
+from excel_reader import ColumnNotFoundError, iter_clean_chunks
+from bulk_loader import APPEND_CHUNK_SIZE, append_rows
+from manifest import clear_progress, file_hash, get_progress, save_progress
+from sites import resolve_site, shard_table
+
 # Load environment variables
 load_dotenv()
 
@@ -18,66 +27,63 @@ if not DATABASE_URL:
     print("❌ DATABASE_URL not found in .env file!")
     exit(1)
 
-def append_excel_to_db(excel_file_path, table_name='ro_items'):
+def append_excel_to_db(excel_file_path, table_name='ro_items', chunksize=APPEND_CHUNK_SIZE, site=None):
     """
     Thêm items từ Excel vào database (không xóa data cũ)
+    - Item code đã có trong database -> bỏ qua (không lỗi, không tạo duplicate)
+    - Mỗi chunk commit riêng: chạy lại sau lỗi sẽ tiếp tục từ chunk đã commit
     
     Args:
         excel_file_path: Đường dẫn đến file Excel
         table_name: Tên bảng trong database
+        chunksize: Số dòng mỗi chunk
+        site: Site của data (None = lấy từ tên file, không có thì DEFAULT_SITE)
     """
     try:
-        # Đọc file Excel
-        print(f"Đọc file Excel: {excel_file_path}")
-        df = pd.read_excel(excel_file_path, header=1)
-        
-        # Xử lý tương tự như upload_excel_to_db
-        item_col = None
-        for col in df.columns:
-            col_lower = col.lower().strip()
-            if 'item' in col_lower and 'code' in col_lower:
-                item_col = col
-                break
-            elif 'item' in col_lower:
-                item_col = col
-        
-        avg_col = None
-        for col in df.columns:
-            col_lower = col.lower().strip()
-            if 'avg' in col_lower and 'consume' in col_lower:
-                avg_col = col
-                break
-            elif 'consume' in col_lower:
-                avg_col = col
+        site = resolve_site(site, excel_file_path)
+        shard = shard_table(table_name, site)
+        print(f"🏭 Site: {site} (bảng {shard})")
         
-        if not item_col or not avg_col:
+
+        # Đọc file Excel (chỉ 2 cột cần thiết, theo từng chunk)
+        print(f"Đọc file Excel: {excel_file_path}")
+        try:
+            timings = {}
+            chunks = iter_clean_chunks(excel_file_path, timings=timings)
+        except ColumnNotFoundError:
             print(f"❌ Không tìm thấy cột cần thiết!")
             return
         
-        df_filtered = df[[item_col, avg_col]].copy()
-        df_filtered.columns = ['item_code', 'avg_consume']
-        df_filtered = df_filtered.dropna()
-        df_filtered = df_filtered.drop_duplicates(subset=['item_code'], keep='first')
-        df_filtered['item_code'] = df_filtered['item_code'].astype(str)
-        df_filtered['avg_consume'] = pd.to_numeric(df_filtered['avg_consume'], errors='coerce')
-        df_filtered = df_filtered.dropna(subset=['avg_consume'])
-        
-        print(f"✓ Đã xử lý: {len(df_filtered)} items")
-        
         # Kết nối database
         print("Đang kết nối Supabase...")
-        engine = create_engine(DATABASE_URL)
+        engine = get_engine(DATABASE_URL, statement_timeout_ms=0)
+        
+        # Lần chạy trước bị lỗi giữa chừng -> tiếp tục từ chunk đã commit
+        digest = file_hash(excel_file_path)
+        progress = get_progress(engine, shard, digest, chunksize)
+        if progress:
+            print(f"⏭️  Tiếp tục từ chunk {progress['chunks'] + 1} "
+                  f"({progress['chunks'] * chunksize} dòng đã commit)")
         
         # Append vào database (giữ data cũ, thêm data mới)
-        print(f"Đang thêm vào bảng '{table_name}'...")
-        df_filtered.to_sql(
-            table_name, 
-            engine, 
-            if_exists='append',  # Thêm vào data cũ
-            index=False
+        # Đọc Excel chạy song song với ghi database (pipeline)
+        print(f"Đang thêm vào bảng '{shard}' (chunk {chunksize} dòng)...")
+        summary = append_rows(
+            engine, chunks, table_name,
+            chunksize=chunksize,
+            resume_from=progress,
+            after_chunk=lambda conn, s: save_progress(conn, shard, digest, chunksize, s),
+            timings=timings,
+            site=site,
         )
+        clear_progress(engine, shard, digest)
+        metrics.observe_timings('ingest', timings, mode='append', file=excel_file_path, **summary)
         
-        print(f"✅ Đã thêm {len(df_filtered)} items vào Supabase!")
+        print(f"✓ Đã xử lý: {summary['rows']} items")
+        print(f"✅ Đã thêm {summary['inserted']} items vào Supabase!")
+        print(f"   - Items đã có (bỏ qua): {summary['skipped']}")
+        print(f"   - {summary['chunks']} chunk ({summary['resumed_chunks']} chunk từ lần chạy trước)")
+        print(f"   {format_stats()}")
         
     except Exception as e:
         print(f"❌ Lỗi: {str(e)}")
@@ -95,4 +101,5 @@ if __name__ == "__main__":
         else:
             excel_file = os.path.join(data_folder, excel_files[0])
             print(f"🔍 File Excel: {excel_files[0]}")
-            append_excel_to_db(excel_file)
+            site = sys.argv[sys.argv.index("--site") + 1] if "--site" in sys.argv else None
+            append_excel_to_db(excel_file, site=site)
@@ -2,13 +2,24 @@
 Script để merge data thông minh (Upsert mode)
 - Nếu item_code đã tồn tại -> UPDATE avg_consume
 - Nếu item_code chưa có -> INSERT mới
+- File đã ingest (không thay đổi) -> bỏ qua, chạy với --force để ingest lại
+- Site: --site <site>, hoặc ghi trong tên file (vd: RO_site-hn1.xlsx), mặc định DEFAULT_SITE
+
+Chạy: python update_upsert.py [--site SITE] [--force]
 """
 
-import pandas as pd
-from sqlalchemy import create_engine, text
 import os
+import sys
 from dotenv import load_dotenv
 
+import metrics
+from db import get_engine, format_stats
+from excel_reader import ColumnNotFoundError, iter_clean_chunks
+from bulk_loader import bulk_upsert
+from pipeline import WRITERS
+from manifest import file_hash, is_ingested, record_files
+from sites import resolve_site, shard_table
+
 # Load environment variables
 load_dotenv()
 
@@ -19,96 +30,73 @@ if not DATABASE_URL:
     print("❌ DATABASE_URL not found in .env file!")
     exit(1)
 
-def upsert_excel_to_db(excel_file_path, table_name='ro_items'):
+def upsert_excel_to_db(excel_file_path, table_name='ro_items', force=False, site=None):
     """
     Upsert items từ Excel vào database
-    - Update nếu item_code đã tồn tại
+    - Update nếu item_code đã tồn tại và avg_consume thay đổi
     - Insert nếu item_code chưa có
+    - Bỏ qua file đã ingest (cùng nội dung) trừ khi force=True
     
     Args:
         excel_file_path: Đường dẫn đến file Excel
         table_name: Tên bảng trong database
+        force: Ingest lại kể cả khi file không thay đổi
+        site: Site của data (None = lấy từ tên file, không có thì DEFAULT_SITE)
+    
+    Returns:
+        True nếu nội dung file đã có trong database (vừa ingest hoặc ingest từ trước)
     """
     try:
-        # Đọc file Excel
-        print(f"Đọc file Excel: {excel_file_path}")
-        df = pd.read_excel(excel_file_path, header=1)
-        
-        # Xử lý data
-        item_col = None
-        for col in df.columns:
-            col_lower = col.lower().strip()
-            if 'item' in col_lower and 'code' in col_lower:
-                item_col = col
-                break
-            elif 'item' in col_lower:
-                item_col = col
-        
-        avg_col = None
-        for col in df.columns:
-            col_lower = col.lower().strip()
-            if 'avg' in col_lower and 'consume' in col_lower:
-                avg_col = col
-                break
-            elif 'consume' in col_lower:
-                avg_col = col
-        
-        if not item_col or not avg_col:
-            print(f"❌ Không tìm thấy cột cần thiết!")
-            return
-        
-        df_filtered = df[[item_col, avg_col]].copy()
-        df_filtered.columns = ['item_code', 'avg_consume']
-        df_filtered = df_filtered.dropna()
-        df_filtered = df_filtered.drop_duplicates(subset=['item_code'], keep='first')
-        df_filtered['item_code'] = df_filtered['item_code'].astype(str)
-        df_filtered['avg_consume'] = pd.to_numeric(df_filtered['avg_consume'], errors='coerce')
-        df_filtered = df_filtered.dropna(subset=['avg_consume'])
-        
-        print(f"✓ Đã xử lý: {len(df_filtered)} items")
+        site = resolve_site(site, excel_file_path)
+        shard = shard_table(table_name, site)
+        print(f"🏭 Site: {site} (bảng {shard})")
         
         # Kết nối database
         print("Đang kết nối Supabase...")
-        engine = create_engine(DATABASE_URL)
+        engine = get_engine(DATABASE_URL, statement_timeout_ms=0)
         
-        # Tạo bảng tạm
-        temp_table = f"{table_name}_temp"
-        print(f"Tạo bảng tạm: {temp_table}")
-        df_filtered.to_sql(temp_table, engine, if_exists='replace', index=False)
+        # Kiểm tra manifest: file không đổi -> bỏ qua
+        digest = file_hash(excel_file_path)
+        if not force and is_ingested(engine, shard, digest):
+            print(f"⏭️  File không thay đổi từ lần ingest trước, bỏ qua: {excel_file_path}")
+            return True
+        
+        # Đọc file Excel (chỉ 2 cột cần thiết, theo từng chunk)
+        print(f"Đọc file Excel: {excel_file_path}")
+        try:
+            timings = {}
+            chunks = iter_clean_chunks(excel_file_path, timings=timings)
+        except ColumnNotFoundError:
+            print(f"❌ Không tìm thấy cột cần thiết!")
+            return False
         
-        # Thực hiện UPSERT bằng SQL
-        print("Đang thực hiện UPSERT...")
-        with engine.connect() as conn:
-            # Tạo bảng chính nếu chưa có
-            create_table_sql = f"""
-            CREATE TABLE IF NOT EXISTS {table_name} (
-                item_code TEXT PRIMARY KEY,
-                avg_consume NUMERIC
-            );
-            """
-            conn.execute(text(create_table_sql))
-            conn.commit()
-            
-            # UPSERT: INSERT ... ON CONFLICT DO UPDATE
-            upsert_sql = f"""
-            INSERT INTO {table_name} (item_code, avg_consume)
-            SELECT item_code, avg_consume FROM {temp_table}
-            ON CONFLICT (item_code) 
-            DO UPDATE SET avg_consume = EXCLUDED.avg_consume;
-            """
-            result = conn.execute(text(upsert_sql))
-            conn.commit()
-            
-            # Xóa bảng tạm
-            conn.execute(text(f"DROP TABLE {temp_table}"))
-            conn.commit()
+        # COPY từng chunk vào bảng TEMP rồi merge bằng
+        # INSERT ... ON CONFLICT DO UPDATE (cùng 1 transaction, kèm ghi manifest)
+        # Đọc Excel chạy song song với COPY (pipeline, PIPELINE_WRITERS connection)
+        print("Đang thực hiện UPSERT (COPY -> bảng tạm -> merge)...")
+        summary = bulk_upsert(
+            engine,
+            chunks,
+            table_name,
+            before_commit=lambda conn, s: record_files(
+                conn, shard, [(excel_file_path, digest, s['rows'])]
+            ),
+            timings=timings,
+            writers=WRITERS,
+            site=site,
+        )
+        metrics.observe_timings('ingest', timings, mode='upsert', file=excel_file_path, **summary)
         
-        print(f"✅ Upsert thành công {len(df_filtered)} items!")
-        print("   - Items mới: đã INSERT")
-        print("   - Items cũ: đã UPDATE avg_consume")
+        print(f"✅ Upsert thành công {summary['rows']} items!")
+        print(f"   - Items mới: {summary['inserted']} (INSERT)")
+        print(f"   - Items thay đổi: {summary['updated']} (UPDATE avg_consume)")
+        print(f"   - Items không đổi: {summary['unchanged']} (bỏ qua)")
+        print(f"   {format_stats()}")
+        return True
         
     except Exception as e:
         print(f"❌ Lỗi: {str(e)}")
+        return False
 
 if __name__ == "__main__":
     data_folder = "data"
@@ -123,4 +111,5 @@ if __name__ == "__main__":
         else:
             excel_file = os.path.join(data_folder, excel_files[0])
             print(f"🔍 File Excel: {excel_files[0]}")
-            upsert_excel_to_db(excel_file)
+            site = sys.argv[sys.argv.index("--site") + 1] if "--site" in sys.argv else None
+            upsert_excel_to_db(excel_file, force="--force" in sys.argv, site=site)
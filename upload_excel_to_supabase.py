@@ -1,13 +1,22 @@
 """
 Script để upload file Excel lên Supabase PostgreSQL (Lần đầu tiên)
-Thay thế toàn bộ data cũ bằng data mới
+Thay thế toàn bộ data cũ của site bằng data mới (các site khác giữ nguyên)
+Site: --site <site>, hoặc ghi trong tên file (vd: RO_site-hn1.xlsx), mặc định DEFAULT_SITE
+
+Chạy: python upload_excel_to_supabase.py [--site SITE]
 """
 
-import pandas as pd
-from sqlalchemy import create_engine
 import os
+import sys
+import pandas as pd
 from dotenv import load_dotenv
 
+import metrics
+from db import get_engine, format_stats
+from excel_reader import ColumnNotFoundError, iter_clean_chunks
+from bulk_loader import replace_table
+from sites import resolve_site
+
 # Load environment variables
 load_dotenv()
 
@@ -19,83 +28,49 @@ if not DATABASE_URL:
     print("   Create .env file with: DATABASE_URL=your_connection_string")
     exit(1)
 
-def upload_excel_to_db(excel_file_path, table_name='ro_items'):
+def upload_excel_to_db(excel_file_path, table_name='ro_items', site=None):
     """
     Upload Excel file to Supabase PostgreSQL
     
     Args:
         excel_file_path: Đường dẫn đến file Excel
         table_name: Tên bảng trong database (mặc định: ro_items)
+        site: Site của data (None = lấy từ tên file, không có thì DEFAULT_SITE)
     """
     try:
-        # Đọc file Excel (header ở row 2)
+        site = resolve_site(site, excel_file_path)
+
+        # Đọc header (row 2), tìm cột Item Code và Avg Consume, rồi chỉ đọc 2 cột đó
+        # theo từng chunk (đã loại bỏ dòng trống, duplicate và avg_consume không hợp lệ)
         print(f"Đọc file Excel: {excel_file_path}")
-        df = pd.read_excel(excel_file_path, header=1)
-        
-        # Tìm cột Item Code
-        item_col = None
-        for col in df.columns:
-            col_lower = col.lower().strip()
-            if 'item' in col_lower and 'code' in col_lower:
-                item_col = col
-                break
-            elif 'item' in col_lower:
-                item_col = col
-        
-        # Tìm cột Avg Consume
-        avg_col = None
-        for col in df.columns:
-            col_lower = col.lower().strip()
-            if 'avg' in col_lower and 'consume' in col_lower:
-                avg_col = col
-                break
-            elif 'consume' in col_lower:
-                avg_col = col
-        
-        if not item_col or not avg_col:
+        try:
+            timings = {}
+            chunks = iter_clean_chunks(excel_file_path, timings=timings)
+        except ColumnNotFoundError as e:
             print(f"❌ Không tìm thấy cột cần thiết!")
-            print(f"   Item Code column: {item_col}")
-            print(f"   Avg Consume column: {avg_col}")
+            print(f"   Item Code column: {e.item_col}")
+            print(f"   Avg Consume column: {e.avg_col}")
             return
         
-        # Chọn và đổi tên cột
-        df_filtered = df[[item_col, avg_col]].copy()
-        df_filtered.columns = ['item_code', 'avg_consume']
-        
-        # Loại bỏ dòng trống
-        df_filtered = df_filtered.dropna()
-        
-        # Loại bỏ duplicate (giữ item đầu tiên)
-        df_filtered = df_filtered.drop_duplicates(subset=['item_code'], keep='first')
-        
-        # Chuyển đổi kiểu dữ liệu
-        df_filtered['item_code'] = df_filtered['item_code'].astype(str)
-        df_filtered['avg_consume'] = pd.to_numeric(df_filtered['avg_consume'], errors='coerce')
-        
-        # Loại bỏ những dòng avg_consume không hợp lệ
-        df_filtered = df_filtered.dropna(subset=['avg_consume'])
-        
-        print(f"✓ Đã xử lý: {len(df_filtered)} items")
-        
         # Kết nối database
         print("Đang kết nối Supabase...")
-        engine = create_engine(DATABASE_URL)
+        engine = get_engine(DATABASE_URL, statement_timeout_ms=0)
         
-        # Upload lên database (replace = xóa bảng cũ và tạo mới)
-        print(f"Đang upload lên bảng '{table_name}'...")
-        df_filtered.to_sql(
-            table_name, 
-            engine, 
-            if_exists='replace',  # Thay thế toàn bộ
-            index=False
-        )
+        # Upload lên database (replace = load bảng staging rồi swap với bảng cũ)
+        # Đọc Excel chạy song song với ghi database (pipeline)
+        print(f"Đang upload lên bảng '{table_name}' (site {site})...")
+        summary = replace_table(engine, chunks, table_name, timings=timings, site=site)
+        metrics.observe_timings('ingest', timings, mode='replace', file=excel_file_path, **summary)
         
-        print(f"✅ Upload thành công {len(df_filtered)} items lên Supabase!")
-        print(f"   Bảng: {table_name}")
+        print(f"✓ Đã xử lý: {summary['rows']} items")
+        print(f"✅ Upload thành công {summary['rows']} items lên Supabase!")
+        print(f"   Bảng: {summary['table']}")
+        print(f"   {format_stats()}")
         
         # Hiển thị sample data
         print("\n📊 Sample data (5 dòng đầu):")
-        print(df_filtered.head().to_string(index=False))
+        sample = pd.read_sql(f"SELECT item_code, avg_consume FROM {summary['table']} LIMIT 5", engine)
+        print(sample.to_string(index=False))
         
     except Exception as e:
         print(f"❌ Lỗi: {str(e)}")
@@ -115,4 +90,5 @@ if __name__ == "__main__":
             # Lấy file đầu tiên
             excel_file = os.path.join(data_folder, excel_files[0])
             print(f"🔍 File Excel: {excel_files[0]}")
-            upload_excel_to_db(excel_file)
+            site = sys.argv[sys.argv.index("--site") + 1] if "--site" in sys.argv else None
+            upload_excel_to_db(excel_file, site=site)
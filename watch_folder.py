@@ -0,0 +1,292 @@
+"""
+Daemon theo dõi folder data: file Excel mới / thay đổi -> tự động upsert vào database
+- Linux: inotify (nhận sự kiện ngay khi file được ghi xong / move vào folder)
+  Hệ điều hành khác hoặc --poll: quét folder định kỳ
+- Debounce: chỉ ingest khi kích thước + thời gian sửa của file đứng yên WATCH_DEBOUNCE giây
+  (file đang copy dở / Excel đang lưu -> chờ), file tạm của Excel (~$) bị bỏ qua
+- Ingest qua đường upsert (update_upsert.py): mỗi nội dung file chỉ ingest 1 lần (manifest),
+  site lấy từ tên file (vd: RO_site-hn1.xlsx) hoặc --site
+- Ingest xong -> move file vào folder archive (kèm timestamp, không ghi đè file cũ)
+  File lỗi giữ nguyên chỗ, chỉ thử lại khi file bị thay đổi
+
+Chạy: python watch_folder.py [data_folder] [--archive DIR] [--site SITE] [--debounce S] [--poll S]
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import shutil
+import signal
+import struct
+import sys
+import threading
+import time
+import zipfile
+
+import metrics
+from update_upsert import upsert_excel_to_db
+
+# Thời gian (giây) file phải đứng yên trước khi ingest (có thể override trong .env)
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "2"))
+# Chu kỳ quét folder (giây) khi không dùng được inotify
+WATCH_POLL = float(os.getenv("WATCH_POLL", "2"))
+# Khi dùng inotify: vẫn quét lại folder sau mỗi khoảng này (phòng sự kiện bị mất)
+WATCH_RESCAN = float(os.getenv("WATCH_RESCAN", "60"))
+# Folder chứa file đã ingest, để trống = <data_folder>/archive
+WATCH_ARCHIVE = os.getenv("WATCH_ARCHIVE", "")
+
+# inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+_EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+    """inotify trên 1 folder (qua libc, không cần thư viện ngoài)"""
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed: {folder}")
+
+    def wait(self, timeout, wakeup_fd=None):
+        """
+        Chờ sự kiện tối đa timeout giây (hoặc tới khi wakeup_fd đọc được, vd: có signal)
+
+        Returns:
+            Set tên file có sự kiện (rỗng nếu hết thời gian chờ)
+        """
+        fds = [self.fd] if wakeup_fd is None else [self.fd, wakeup_fd]
+        ready, _, _ = select.select(fds, [], [], timeout)
+        names = set()
+        while self.fd in ready:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(buf):
+                _, _, _, length = _EVENT.unpack_from(buf, pos)
+                pos += _EVENT.size
+                names.add(os.fsdecode(buf[pos:pos + length].rstrip(b'\0')))
+                pos += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+def is_excel_file(name):
+    return name.endswith(('.xlsx', '.xls')) and not name.startswith(('~$', '.'))
+
+
+def is_complete(path):
+    """File .xlsx (zip) đã ghi xong: đọc được central directory ở cuối file"""
+    if not path.endswith('.xlsx'):
+        return True
+    try:
+        return zipfile.is_zipfile(path)
+    except OSError:
+        return False
+
+
+def archive_file(path, archive_folder):
+    """Move file vào archive, thêm timestamp vào tên (cùng tên file không ghi đè nhau)"""
+    os.makedirs(archive_folder, exist_ok=True)
+    stem, ext = os.path.splitext(os.path.basename(path))
+    target = os.path.join(archive_folder, f"{stem}_{time.strftime('%Y%m%d-%H%M%S')}{ext}")
+    n = 1
+    while os.path.exists(target):
+        target = os.path.join(archive_folder, f"{stem}_{time.strftime('%Y%m%d-%H%M%S')}_{n}{ext}")
+        n += 1
+    shutil.move(path, target)
+    return target
+
+
+class FolderWatcher:
+    """
+    Theo dõi 1 folder, ingest file khi đã đứng yên đủ debounce giây
+
+    Args:
+        data_folder: Folder nhận file Excel
+        archive_folder: Folder chứa file đã ingest
+        table_name: Bảng đích
+        site: Site của mọi file (None = lấy từ tên từng file)
+        debounce: Thời gian file phải đứng yên (giây)
+        poll: Chu kỳ quét khi không có inotify (giây)
+        use_inotify: False = luôn quét định kỳ
+    """
+
+    def __init__(self, data_folder, archive_folder=None, table_name='ro_items', site=None,
+                 debounce=WATCH_DEBOUNCE, poll=WATCH_POLL, use_inotify=True):
+        self.data_folder = data_folder
+        self.archive_folder = archive_folder or WATCH_ARCHIVE or os.path.join(data_folder, 'archive')
+        self.table_name = table_name
+        self.site = site
+        self.debounce = debounce
+        self.poll = poll
+        self.pending = {}   # path -> (size, mtime) lần thấy gần nhất, thời điểm thay đổi gần nhất
+        self.failed = {}    # path -> (size, mtime) lúc ingest lỗi (chỉ thử lại khi file đổi)
+        self.stopped = False
+        self.inotify = None
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.inotify = Inotify(data_folder)
+            except (OSError, AttributeError) as e:
+                print(f"⚠️  Không dùng được inotify ({e}), chuyển sang quét định kỳ")
+
+    def scan(self):
+        """(size, mtime) của các file Excel trong folder"""
+        files = {}
+        for name in os.listdir(self.data_folder):
+            path = os.path.join(self.data_folder, name)
+            if not is_excel_file(name):
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if os.path.isfile(path):
+                files[path] = (st.st_size, st.st_mtime_ns)
+        return files
+
+    def ready_files(self, now=None):
+        """
+        Cập nhật danh sách file đang chờ, trả về file đã đứng yên đủ lâu
+
+        Returns:
+            List đường dẫn, file cũ nhất trước (file mới hơn được upsert sau -> thắng)
+        """
+        now = time.monotonic() if now is None else now
+        files = self.scan()
+        for path in list(self.pending):
+            if path not in files:
+                del self.pending[path]
+        for path in list(self.failed):
+            if files.get(path) != self.failed[path]:
+                del self.failed[path]
+
+        ready = []
+        for path, stat in files.items():
+            if path in self.failed:
+                continue
+            seen = self.pending.get(path)
+            if seen is None or seen[0] != stat:
+                self.pending[path] = (stat, now)
+            elif now - seen[1] >= self.debounce:
+                if is_complete(path):
+                    ready.append(path)
+                else:
+                    self.pending[path] = (stat, now)
+        return sorted(ready, key=lambda p: files[p][1])
+
+    def ingest(self, path):
+        """Upsert 1 file, thành công -> archive, lỗi -> ghi nhớ để không thử lại liên tục"""
+        stat = self.pending.pop(path)[0]
+        print(f"🔍 File Excel: {os.path.basename(path)}")
+        dropped = stat[1] / 1e9
+        with metrics.span('watch_ingest', file=path):
+            ok = upsert_excel_to_db(path, self.table_name, site=self.site)
+        if not ok:
+            self.failed[path] = stat
+            metrics.REGISTRY.inc('watch_errors')
+            print(f"❌ Ingest lỗi, giữ file tại chỗ (thử lại khi file thay đổi): {path}")
+            return False
+        target = archive_file(path, self.archive_folder)
+        metrics.observe('watch_latency', max(0.0, time.time() - dropped))
+        print(f"📦 Đã chuyển vào archive: {target}")
+        if metrics.METRICS_PROM_FILE:
+            metrics.write_prometheus(metrics.METRICS_PROM_FILE)
+        return True
+
+    def timeout(self, now=None):
+        """Thời gian chờ tới lần kiểm tra tiếp theo"""
+        now = time.monotonic() if now is None else now
+        if self.pending:
+            due = min(changed for _, changed in self.pending.values()) + self.debounce
+            wait = max(0.05, due - now)
+        else:
+            wait = WATCH_RESCAN if self.inotify else self.poll
+        return wait if self.inotify else min(wait, self.poll)
+
+    def run_once(self):
+        """1 vòng: ingest các file đã sẵn sàng"""
+        for path in self.ready_files():
+            if self.stopped:
+                break
+            self.ingest(path)
+
+    def run(self):
+        """Chạy tới khi nhận SIGTERM / Ctrl+C"""
+        mode = "inotify" if self.inotify else f"quét mỗi {self.poll:g}s"
+        print(f"👀 Đang theo dõi '{self.data_folder}' ({mode}, debounce {self.debounce:g}s)")
+        print(f"   Archive: {self.archive_folder}")
+        # Signal (SIGTERM) đánh thức select ngay, không phải chờ hết timeout
+        # (chỉ đặt được ở main thread; chạy trong thread khác thì gọi stop() rồi chờ hết timeout)
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_w, False)
+        main = threading.current_thread() is threading.main_thread()
+        if main:
+            signal.set_wakeup_fd(wakeup_w)
+        try:
+            while not self.stopped:
+                # File có sẵn lúc khởi động (thả vào khi daemon chưa chạy) cũng được xử lý
+                self.run_once()
+                if self.stopped:
+                    break
+                if self.inotify:
+                    self.inotify.wait(self.timeout(), wakeup_r)
+                else:
+                    time.sleep(self.timeout())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if main:
+                signal.set_wakeup_fd(-1)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+            if self.inotify:
+                self.inotify.close()
+        print("👋 Dừng theo dõi")
+
+    def stop(self, *_):
+        self.stopped = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tự động upsert file Excel thả vào folder")
+    parser.add_argument("data_folder", nargs="?", default="data")
+    parser.add_argument("--archive", default=None, help="Folder chứa file đã ingest")
+    parser.add_argument("--table", default="ro_items")
+    parser.add_argument("--site", default=None, help="Site của mọi file (mặc định: lấy từ tên file)")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE,
+                        help="Số giây file phải đứng yên trước khi ingest")
+    parser.add_argument("--poll", type=float, default=None,
+                        help="Quét định kỳ mỗi N giây thay vì dùng inotify")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data_folder):
+        print(f"❌ Folder '{args.data_folder}' không tồn tại!")
+        exit(1)
+
+    watcher = FolderWatcher(
+        args.data_folder,
+        archive_folder=args.archive,
+        table_name=args.table,
+        site=args.site,
+        debounce=args.debounce,
+        poll=args.poll if args.poll is not None else WATCH_POLL,
+        use_inotify=args.poll is None,
+    )
+    signal.signal(signal.SIGTERM, watcher.stop)
+    watcher.run()